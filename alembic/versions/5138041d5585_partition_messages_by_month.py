@@ -0,0 +1,171 @@
+"""Partition messages by month
+
+Revision ID: 5138041d5585
+Revises: a738f8687434
+Create Date: 2026-10-17 09:31:05.402716
+
+Opt-in and PostgreSQL only; without the option this revision changes nothing:
+
+    alembic -x partition_messages=true [-x partition_months_ahead=12] upgrade head
+
+Turns messages into a table range-partitioned by month on timestamp, with a
+DEFAULT partition catching anything outside the monthly ones. A table cannot
+be partitioned in place, so the rows are copied into a new partitioned table
+that then takes the old one's name, all in one transaction. Unlike the index
+builds of a738f8687434 this cannot run CONCURRENTLY: writes to messages wait
+until it commits, so run it in a quiet period. Create future months with
+SELECT messages_add_month_partitions(current_date, 3), e.g. from cron.
+
+If that job lapses, a month's rows land in messages_default, and PostgreSQL
+refuses to create a partition whose range the default already holds rows
+for. The function handles this: it detaches messages_default, creates the
+missing months, moves their rows out of it and attaches it again, all in the
+caller's transaction. That holds an exclusive lock on messages and scans
+messages_default, so keep the job running rather than relying on it.
+
+To partition later, downgrade to a738f8687434 and upgrade again with the option.
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5138041d5585'
+down_revision: Union[str, None] = 'a738f8687434'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+ADD_MONTH_PARTITIONS = """
+CREATE OR REPLACE FUNCTION messages_add_month_partitions(start_month date, months_ahead integer)
+RETURNS integer LANGUAGE plpgsql AS $$
+DECLARE
+    part_month date := date_trunc('month', start_month)::date;
+    last_month date := (date_trunc('month', now()) + make_interval(months => months_ahead))::date;
+    part_name text;
+    stranded boolean;
+    detached boolean := false;
+    created integer := 0;
+BEGIN
+    WHILE part_month <= last_month LOOP
+        part_name := format('messages_%s', to_char(part_month, 'YYYY_MM'));
+        IF to_regclass(part_name) IS NULL THEN
+            -- Rows that arrived while this month had no partition sit in the default one,
+            -- which would make CREATE ... PARTITION OF fail; take it out while they move
+            SELECT EXISTS (SELECT 1 FROM messages_default WHERE timestamp >= part_month
+                           AND timestamp < (part_month + interval '1 month')::date) INTO stranded;
+            IF stranded AND NOT detached THEN
+                ALTER TABLE messages DETACH PARTITION messages_default;
+                detached := true;
+            END IF;
+            EXECUTE format('CREATE TABLE %I PARTITION OF messages FOR VALUES FROM (%L) TO (%L)',
+                           part_name, part_month, (part_month + interval '1 month')::date);
+            IF stranded THEN
+                -- Re-attaching checks that the default holds no rows of any month partition
+                WITH moved AS (
+                    DELETE FROM messages_default WHERE timestamp >= part_month
+                        AND timestamp < (part_month + interval '1 month')::date
+                    RETURNING id, session_id, role, content, timestamp
+                )
+                INSERT INTO messages (id, session_id, role, content, timestamp) SELECT * FROM moved;
+            END IF;
+            created := created + 1;
+        END IF;
+        part_month := (part_month + interval '1 month')::date;
+    END LOOP;
+    IF detached THEN
+        ALTER TABLE messages ATTACH PARTITION messages_default DEFAULT;
+    END IF;
+    RETURN created;
+END $$
+"""
+
+
+def _enabled() -> bool:
+    if op.get_context().dialect.name != 'postgresql':
+        return False
+    if context.get_x_argument(as_dictionary=True).get('partition_messages', '').lower() not in ('1', 'true', 'yes'):
+        return False
+    if context.is_offline_mode():
+        raise RuntimeError("Partitioning messages copies existing rows and needs a live connection, not --sql.")
+    return True
+
+
+def _is_partitioned() -> bool:
+    return op.get_bind().execute(
+        sa.text("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('messages'))")
+    ).scalar()
+
+
+def _rename_primary_key(table: str, name: str) -> None:
+    # Constraint names stay behind when a table is renamed and would clash with the new table's
+    current = op.get_bind().execute(
+        sa.text("SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(:table) AND contype = 'p'"), {'table': table}
+    ).scalar()
+    if current is not None and current != name:
+        op.execute(f'ALTER TABLE {table} RENAME CONSTRAINT "{current}" TO "{name}"')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if not _enabled() or _is_partitioned():
+        return
+    months_ahead = int(context.get_x_argument(as_dictionary=True).get('partition_months_ahead', 12))
+    bind = op.get_bind()
+    sequence = bind.execute(sa.text("SELECT pg_get_serial_sequence('messages', 'id')")).scalar()
+    first_message = bind.execute(sa.text("SELECT min(timestamp) FROM messages")).scalar()
+
+    op.execute("ALTER TABLE messages RENAME TO messages_unpartitioned")
+    _rename_primary_key('messages_unpartitioned', 'messages_unpartitioned_pkey')
+    op.execute("ALTER INDEX IF EXISTS ix_messages_session_id_id RENAME TO ix_messages_unpartitioned_session_id_id")
+    # The partition key has to be part of the primary key
+    op.execute(f"""
+        CREATE TABLE messages (
+            id integer NOT NULL DEFAULT nextval('{sequence}'),
+            session_id varchar NOT NULL,
+            role varchar NOT NULL,
+            content text NOT NULL,
+            timestamp timestamp without time zone NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),
+            PRIMARY KEY (id, timestamp)
+        ) PARTITION BY RANGE (timestamp)
+    """)
+    op.execute("CREATE TABLE messages_default PARTITION OF messages DEFAULT")
+    op.execute(ADD_MONTH_PARTITIONS)
+    bind.execute(
+        sa.text("SELECT messages_add_month_partitions(coalesce(CAST(:start AS date), current_date), :ahead)"),
+        {'start': first_message.date() if first_message else None, 'ahead': months_ahead},
+    )
+    op.execute("""
+        INSERT INTO messages (id, session_id, role, content, timestamp)
+        SELECT id, session_id, role, content, coalesce(timestamp, now() AT TIME ZONE 'utc') FROM messages_unpartitioned
+    """)
+    # Built after the copy; on a partitioned table this creates one index per partition
+    op.create_index('ix_messages_session_id_id', 'messages', ['session_id', 'id'])
+    op.execute(f"ALTER SEQUENCE {sequence} OWNED BY messages.id")
+    op.drop_table('messages_unpartitioned')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_context().dialect.name != 'postgresql' or context.is_offline_mode() or not _is_partitioned():
+        return
+    sequence = op.get_bind().execute(sa.text("SELECT pg_get_serial_sequence('messages', 'id')")).scalar()
+    op.execute("ALTER TABLE messages RENAME TO messages_partitioned")
+    _rename_primary_key('messages_partitioned', 'messages_partitioned_pkey')
+    op.execute("ALTER INDEX ix_messages_session_id_id RENAME TO ix_messages_partitioned_session_id_id")
+    op.execute(f"""
+        CREATE TABLE messages (
+            id integer NOT NULL DEFAULT nextval('{sequence}') PRIMARY KEY,
+            session_id varchar NOT NULL,
+            role varchar NOT NULL,
+            content text NOT NULL,
+            timestamp timestamp without time zone
+        )
+    """)
+    op.execute("INSERT INTO messages SELECT id, session_id, role, content, timestamp FROM messages_partitioned")
+    op.create_index('ix_messages_session_id_id', 'messages', ['session_id', 'id'])
+    op.execute(f"ALTER SEQUENCE {sequence} OWNED BY messages.id")
+    # Dropping the parent drops every partition with it
+    op.drop_table('messages_partitioned')
+    op.execute("DROP FUNCTION IF EXISTS messages_add_month_partitions(date, integer)")
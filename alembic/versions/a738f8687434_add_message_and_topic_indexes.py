@@ -0,0 +1,68 @@
+"""Add message and topic indexes
+
+Revision ID: a738f8687434
+Revises: 93bd11d28378
+Create Date: 2026-10-17 09:12:40.118204
+
+Indexes for the per-session reads of stm_prp (keyset pages by id) and
+utm_anyai (topics by session and time, synonym overlap). On PostgreSQL they
+are built with CREATE INDEX CONCURRENTLY outside the migration transaction,
+so the tables stay writable while this runs on a live database.
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a738f8687434'
+down_revision: Union[str, None] = '93bd11d28378'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (name, table, columns, PostgreSQL index method); mirrored in the models' __table_args__
+INDEXES = [
+    ('ix_messages_session_id_id', 'messages', ['session_id', 'id'], None),
+    ('ix_topics_foreign_key_datetime', 'topics', ['foreign_key', 'datetime'], None),
+    ('ix_topics_synonym', 'topics', ['synonym'], 'gin'),
+]
+
+
+def _drop_invalid_index(name: str) -> None:
+    # An interrupted CONCURRENTLY build leaves an INVALID index behind, which
+    # IF NOT EXISTS would then keep; drop it so the build is retried.
+    if context.is_offline_mode():
+        return
+    invalid = op.get_bind().execute(
+        sa.text("SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"), {'name': name}
+    ).scalar()
+    if invalid:
+        op.drop_index(name, if_exists=True, postgresql_concurrently=True)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if op.get_context().dialect.name != 'postgresql':
+        for name, table, columns, using in INDEXES:
+            # SQLite stores synonym as JSON text, which has no GIN equivalent
+            if using is None:
+                op.create_index(name, table, columns, if_not_exists=True)
+        return
+    with op.get_context().autocommit_block():
+        for name, table, columns, using in INDEXES:
+            _drop_invalid_index(name)
+            kwargs = {'postgresql_using': using} if using else {}
+            op.create_index(name, table, columns, if_not_exists=True, postgresql_concurrently=True, **kwargs)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_context().dialect.name != 'postgresql':
+        for name, table, _, using in INDEXES:
+            if using is None:
+                op.drop_index(name, table_name=table, if_exists=True)
+        return
+    with op.get_context().autocommit_block():
+        for name, table, _, _ in INDEXES:
+            op.drop_index(name, table_name=table, if_exists=True, postgresql_concurrently=True)
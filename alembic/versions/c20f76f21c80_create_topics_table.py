@@ -27,27 +27,20 @@ def upgrade() -> None:
     sa.Column('datetime', sa.DateTime(), nullable=False),
     sa.Column('turn_id', sa.Integer(), nullable=False),
     sa.Column('embedding', sa.LargeBinary(), nullable=True),
-    sa.Column('synonym', postgresql.ARRAY(sa.String()), nullable=True),
+    sa.Column('synonym', postgresql.ARRAY(sa.String()).with_variant(sa.JSON(), 'sqlite'), nullable=True),
     sa.Column('foreign_key', sa.String(), nullable=True),
     sa.Column('last_refactored', sa.DateTime(), nullable=True),
-    sa.Column('extra_metadata', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+    sa.Column('extra_metadata', postgresql.JSONB(astext_type=sa.Text()).with_variant(sa.JSON(), 'sqlite'), nullable=True),
     sa.PrimaryKeyConstraint('id'),
     sa.UniqueConstraint('topic')
     )
-    op.drop_table('messages')
     # ### end Alembic commands ###
+    # The autogenerated op.drop_table('messages') was removed: it wiped stm_prp's
+    # history, which 93bd11d28378 then recreated empty.
 
 
 def downgrade() -> None:
     """Downgrade schema."""
     # ### commands auto generated by Alembic - please adjust! ###
-    op.create_table('messages',
-    sa.Column('id', sa.INTEGER(), autoincrement=True, nullable=False),
-    sa.Column('session_id', sa.VARCHAR(), autoincrement=False, nullable=False),
-    sa.Column('role', sa.VARCHAR(), autoincrement=False, nullable=False),
-    sa.Column('content', sa.TEXT(), autoincrement=False, nullable=False),
-    sa.Column('timestamp', postgresql.TIMESTAMP(), autoincrement=False, nullable=True),
-    sa.PrimaryKeyConstraint('id', name=op.f('messages_pkey'))
-    )
     op.drop_table('topics')
     # ### end Alembic commands ###
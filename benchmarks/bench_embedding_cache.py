@@ -0,0 +1,67 @@
+# benchmarks/bench_embedding_cache.py
+"""
+Benchmark for the memory-mapped embedding cache: insert and lookup latency,
+time for a fresh process to reopen a populated cache, and compaction cost.
+Uses random vectors, so no network access is needed.
+
+    python -m benchmarks.bench_embedding_cache --entries 50000 --dim 768
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from llms.embedding_cache import EmbeddingCacheStore
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--lookups", type=int, default=20000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    texts = [f"topic {i}" for i in range(args.entries)]
+    vectors = rng.standard_normal((args.entries, args.dim), dtype=np.float32)
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = EmbeddingCacheStore(directory, max_entries=args.entries)
+        start = time.perf_counter()
+        for text, vector in zip(texts, vectors):
+            store.put(text, vector)
+        insert_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        reopened = EmbeddingCacheStore(directory, max_entries=args.entries)
+        reopen_seconds = time.perf_counter() - start
+
+        picks = rng.integers(0, args.entries, args.lookups)
+        start = time.perf_counter()
+        for i in picks:
+            reopened.get(texts[i])
+        lookup_seconds = time.perf_counter() - start
+        assert np.array_equal(reopened.get(texts[7]), vectors[7])
+
+        # One more insert fills the matrix and triggers compaction
+        start = time.perf_counter()
+        store.put("overflow", vectors[0])
+        compact_seconds = time.perf_counter() - start
+
+        results = {
+            "entries": args.entries,
+            "dim": args.dim,
+            "file_mb": round(os.path.getsize(store.path) / 2**20, 1),
+            "insert_us": round(insert_seconds / args.entries * 1e6, 2),
+            "lookup_us": round(lookup_seconds / args.lookups * 1e6, 2),
+            "reopen_ms": round(reopen_seconds * 1000, 3),
+            "compaction_ms": round(compact_seconds * 1000, 1),
+            "after_compaction": store.stats(),
+        }
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+# benchmarks/bench_gemini_prompt_cache.py
+"""
+Micro-benchmark for GeminiAdapter._prepare_chat_contents.
+Compares rebuilding every types.Content per turn against the per-session
+prompt cache, which only converts the newly appended messages.
+No network access is needed; the adapter is only used for conversion.
+
+    python -m benchmarks.bench_gemini_prompt_cache
+"""
+
+import argparse
+import json
+import time
+
+from llms.gemini import GeminiAdapter
+
+def _history(length: int):
+    return [
+        {"role": "user" if i % 2 == 0 else "model", "content": f"message {i} " + "lorem ipsum " * 20}
+        for i in range(length)
+    ]
+
+def _time_turn(adapter: GeminiAdapter, messages, session_id, repeats: int) -> float:
+    """Average seconds to prepare one turn that appends a single new message."""
+    total = 0.0
+    for r in range(repeats):
+        turn = messages + [{"role": "user", "content": f"new turn {r}"}]
+        start = time.perf_counter()
+        adapter._prepare_chat_contents(turn, session_id)
+        total += time.perf_counter() - start
+    return total / repeats
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lengths", default="10,100,1000,5000", help="Comma-separated history lengths")
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    adapter = GeminiAdapter(api_key="benchmark-no-network")
+    results = []
+    for length in (int(n) for n in args.lengths.split(",")):
+        messages = _history(length)
+        uncached = _time_turn(adapter, messages, None, args.repeats)
+        adapter._prepare_chat_contents(messages, "bench")  # warm the session
+        cached = _time_turn(adapter, messages, "bench", args.repeats)
+        adapter.invalidate_session("bench")
+        results.append({
+            "history_length": length,
+            "uncached_ms": round(uncached * 1000, 3),
+            "cached_ms": round(cached * 1000, 3),
+            "speedup": round(uncached / cached, 1) if cached else None,
+        })
+        print(f"{length:>6} messages: uncached {uncached * 1000:8.3f} ms  cached {cached * 1000:8.3f} ms")
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+# benchmarks/bench_load.py
+"""
+End-to-end load test: boots main.app in-process under uvicorn with the stub LLM
+module (no network) and the chosen memory module, then drives /stream and /query
+with closed-loop (fixed concurrency, back-to-back requests) and open-loop
+(Poisson arrivals at a fixed rate) load. Reports throughput, TTFT, latency and
+chunk-gap percentiles, plus server CPU and process RSS, as JSON that
+benchmarks.compare_load can diff across commits.
+
+    python -m benchmarks.bench_load --mode closed --endpoint stream --concurrency 32 --duration 20
+    python -m benchmarks.bench_load --mode open --rate 50 --output before.json
+
+Runs in a temporary directory with its own config.json, SQLite database and
+embedding cache, so the checkout's config is never touched. Open-loop latencies
+are measured from each request's scheduled start, so a slow server cannot hide
+queueing delay by slowing the client down.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from typing import Dict, List
+
+import httpx
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The benchmark changes into a scratch directory before importing main
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+def _summary(samples: List[float]) -> Dict:
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pick(percentile):
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))] * 1000, 3)
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+        "p50_ms": pick(50),
+        "p95_ms": pick(95),
+        "p99_ms": pick(99),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+class Recorder:
+    """
+    Collects per-request timings for one scenario.
+    """
+
+    def __init__(self):
+        self.latencies = []
+        self.ttfts = []
+        self.gaps = []
+        self.statuses = Counter()
+        self.errors = Counter()
+
+    def report(self, wall: float, server_cpu: float, client_cpu: float) -> Dict:
+        completed = self.statuses.get(200, 0)
+        return {
+            "requests": sum(self.statuses.values()) + sum(self.errors.values()),
+            "completed": completed,
+            "statuses": {str(code): count for code, count in sorted(self.statuses.items())},
+            "errors": dict(self.errors),
+            "wall_seconds": round(wall, 3),
+            "throughput_rps": round(completed / wall, 2) if wall else None,
+            "latency": _summary(self.latencies),
+            "ttft": _summary(self.ttfts),
+            "chunk_gap": _summary(self.gaps),
+            "server_cpu_seconds": round(server_cpu, 3),
+            "server_cpu_percent": round(server_cpu / wall * 100, 1) if wall else None,
+            "server_cpu_ms_per_request": round(server_cpu / completed * 1000, 3) if completed else None,
+            "client_cpu_seconds": round(client_cpu, 3),
+            "rss_mb": _rss_mb(),
+        }
+
+def _body(args, session_id: str, turn: int) -> Dict:
+    return {
+        "query": f"Load test turn {turn}: summarise what we discussed so far.",
+        "session_id": session_id,
+        "max_tokens": args.max_tokens,
+        # Every turn must reach the model; the response cache would short-circuit repeats
+        "cache": "bypass",
+    }
+
+async def _stream_once(client: httpx.AsyncClient, body: Dict, recorder: Recorder, started: float):
+    async with client.stream("POST", "/stream", json=body) as response:
+        if response.status_code != 200:
+            await response.aread()
+            recorder.statuses[response.status_code] += 1
+            return
+        last = None
+        async for chunk in response.aiter_raw():
+            if not chunk:
+                continue
+            now = time.perf_counter()
+            if last is None:
+                recorder.ttfts.append(now - started)
+            else:
+                recorder.gaps.append(now - last)
+            last = now
+    recorder.latencies.append(time.perf_counter() - started)
+    recorder.statuses[200] += 1
+
+async def _query_once(client: httpx.AsyncClient, body: Dict, recorder: Recorder, started: float):
+    response = await client.post("/query", json=body)
+    if response.status_code == 200:
+        recorder.latencies.append(time.perf_counter() - started)
+    recorder.statuses[response.status_code] += 1
+
+async def _send(endpoint: str, client, body, recorder: Recorder, started: float = None):
+    started = started or time.perf_counter()
+    try:
+        if endpoint == "stream":
+            await _stream_once(client, body, recorder, started)
+        else:
+            await _query_once(client, body, recorder, started)
+    except httpx.HTTPError as e:
+        recorder.errors[type(e).__name__] += 1
+
+async def closed_loop(args, client, endpoint: str, recorder: Recorder, prefix: str, duration: float):
+    """
+    args.concurrency users, each sending its next request as soon as the last one finishes.
+    """
+    deadline = time.perf_counter() + duration
+
+    async def user(index: int):
+        session_id = f"{prefix}-{index % args.sessions}"
+        turn = 0
+        while time.perf_counter() < deadline:
+            await _send(endpoint, client, _body(args, session_id, turn), recorder)
+            turn += 1
+            if args.think_ms:
+                await asyncio.sleep(args.think_ms / 1000)
+
+    await asyncio.gather(*(user(i) for i in range(args.concurrency)))
+
+async def open_loop(args, client, endpoint: str, recorder: Recorder, prefix: str, duration: float):
+    """
+    Poisson arrivals at args.rate per second, independent of how fast replies come back.
+    """
+    rng = random.Random(args.seed)
+    start = time.perf_counter()
+    deadline = start + duration
+    scheduled = start
+    tasks = set()
+    index = 0
+    while True:
+        scheduled += rng.expovariate(args.rate)
+        if scheduled >= deadline:
+            break
+        await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+        body = _body(args, f"{prefix}-{index % args.sessions}", index // args.sessions)
+        task = asyncio.create_task(_send(endpoint, client, body, recorder, started=scheduled))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        index += 1
+    await asyncio.gather(*tasks)
+
+async def run_scenarios(args, base_url: str) -> Dict:
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=max(args.concurrency, 64))
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        results = {}
+        for endpoint in args.endpoint:
+            if args.warmup:
+                await closed_loop(args, client, endpoint, Recorder(), f"warmup-{endpoint}", args.warmup)
+            for mode in args.mode:
+                recorder = Recorder()
+                run = closed_loop if mode == "closed" else open_loop
+                cpu_before = sum(resource.getrusage(resource.RUSAGE_SELF)[:2])
+                client_before = time.thread_time()
+                wall_before = time.perf_counter()
+                await run(args, client, endpoint, recorder, f"{mode}-{endpoint}", args.duration)
+                wall = time.perf_counter() - wall_before
+                client_cpu = time.thread_time() - client_before
+                # The server runs on other threads of this process; the client owns this one
+                server_cpu = sum(resource.getrusage(resource.RUSAGE_SELF)[:2]) - cpu_before - client_cpu
+                results[f"{mode}/{endpoint}"] = recorder.report(wall, server_cpu, client_cpu)
+                print(f"{mode}/{endpoint}: {json.dumps(results[f'{mode}/{endpoint}'])}", file=sys.stderr)
+        return results
+
+def _bench_config(args) -> Dict:
+    config = {
+        "llm": {
+            "active_model": "stub",
+            "preload_modules": ["stub"],
+            "modules": {
+                "stub": {
+                    "ttft_ms": args.ttft_ms,
+                    "tokens_per_second": args.tokens_per_second,
+                    "min_output_tokens": args.output_tokens,
+                    "max_output_tokens": args.output_tokens,
+                    "jitter": args.jitter,
+                    "error_rate": args.error_rate,
+                    "seed": args.seed,
+                }
+            },
+        },
+        "memory": {"active_module": args.memory_module},
+        # Measure the service, not the per-session rate limiter
+        "admission": {
+            "max_inflight": args.max_inflight,
+            "max_queue": 100000,
+            "queue_timeout_seconds": args.timeout,
+            "session_rate_per_second": 1000000,
+            "session_burst": 1000000,
+        },
+    }
+    if args.config:
+        with open(args.config) as f:
+            overrides = json.load(f)
+        _merge(config, overrides)
+    return config
+
+def _merge(target: Dict, overrides: Dict):
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge(target[key], value)
+        else:
+            target[key] = value
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["closed", "open"], action="append", help="Load model (repeatable; default both)")
+    parser.add_argument("--endpoint", choices=["stream", "query"], action="append", help="Endpoint (repeatable; default both)")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=1.0, help="Unrecorded closed-loop seconds per endpoint")
+    parser.add_argument("--concurrency", type=int, default=16, help="Closed-loop users")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="Closed-loop pause between a user's requests")
+    parser.add_argument("--rate", type=float, default=20.0, help="Open-loop arrivals per second")
+    parser.add_argument("--sessions", type=int, default=16, help="Distinct session ids the load is spread over")
+    parser.add_argument("--max-tokens", type=int, default=256)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--max-inflight", type=int, default=256, help="admission.max_inflight for the server")
+    parser.add_argument("--memory-module", default="stm_eth", help="stm_eth, or a SQL module backed by MEMORY_SQL")
+    parser.add_argument("--ttft-ms", type=float, default=200.0)
+    parser.add_argument("--tokens-per-second", type=float, default=100.0)
+    parser.add_argument("--output-tokens", type=int, default=64)
+    parser.add_argument("--jitter", default="lognormal")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--config", help="JSON merged over the generated config.json (e.g. memory.write_behind)")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--output", help="Write the JSON report here as well as to stdout")
+    args = parser.parse_args()
+    args.mode = args.mode or ["closed", "open"]
+    args.endpoint = args.endpoint or ["stream", "query"]
+    output = os.path.abspath(args.output) if args.output else None
+    config_path = os.path.abspath(args.config) if args.config else None
+    args.config = config_path
+
+    with tempfile.TemporaryDirectory(prefix="anyai-bench-") as workdir:
+        os.environ.setdefault("MEMORY_SQL", f"sqlite:///{os.path.join(workdir, 'memory.db')}")
+        with open(os.path.join(workdir, "config.json"), "w") as f:
+            json.dump(_bench_config(args), f, indent=4)
+        os.chdir(workdir)
+
+        import uvicorn
+        from main import app
+
+        server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=args.port, log_level="warning"))
+        thread = threading.Thread(target=server.run, name="bench-server", daemon=True)
+        thread.start()
+        while not server.started:
+            if not thread.is_alive():
+                raise SystemExit("The server failed to start.")
+            time.sleep(0.01)
+        try:
+            results = asyncio.run(run_scenarios(args, f"http://127.0.0.1:{args.port}"))
+        finally:
+            server.should_exit = True
+            thread.join(timeout=30)
+        os.chdir(REPO_ROOT)
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "args": {key: value for key, value in vars(args).items() if key != "output"},
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+
+if __name__ == "__main__":
+    main()
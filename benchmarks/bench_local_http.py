@@ -0,0 +1,85 @@
+# benchmarks/bench_local_http.py
+"""
+Measures the per-request overhead of LocalHttpAdapter against the stub server
+(no token delay, so the timings are client + HTTP + stub cost). Compares the
+pooled keep-alive client with opening a fresh client per request.
+
+    python -m benchmarks.bench_local_http --requests 500 --concurrency 8
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from benchmarks.openai_stub_server import start_in_thread
+from llms.local_http import LocalHttpAdapter
+
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+def _summary(samples):
+    samples = sorted(samples)
+    return {
+        "p50_ms": round(statistics.median(samples) * 1000, 3),
+        "p95_ms": round(samples[int(len(samples) * 0.95) - 1] * 1000, 3),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3),
+    }
+
+async def _run(call, requests: int, concurrency: int):
+    samples = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            await call()
+            samples.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return _summary(samples)
+
+async def bench(port: int, requests: int, concurrency: int, tokens: int):
+    settings = {"base_url": f"http://127.0.0.1:{port}/v1", "tokenize_url": f"http://127.0.0.1:{port}/tokenize"}
+    adapter = LocalHttpAdapter(settings=settings)
+
+    async def generate():
+        await adapter.generate(MESSAGES, max_tokens=tokens)
+
+    async def stream():
+        async for _ in adapter.stream(MESSAGES, max_tokens=tokens):
+            pass
+
+    async def generate_fresh_client():
+        fresh = LocalHttpAdapter(settings=settings)
+        try:
+            await fresh.generate(MESSAGES, max_tokens=tokens)
+        finally:
+            await fresh.aclose()
+
+    await generate()  # warm the pool
+    results = {
+        "generate_pooled": await _run(generate, requests, concurrency),
+        "generate_fresh_client": await _run(generate_fresh_client, requests, concurrency),
+        "stream_pooled": await _run(stream, requests, concurrency),
+    }
+    await adapter.aclose()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--tokens", type=int, default=32)
+    args = parser.parse_args()
+
+    server = start_in_thread(args.port, tokens=args.tokens)
+    try:
+        results = asyncio.run(bench(args.port, args.requests, args.concurrency, args.tokens))
+    finally:
+        server.should_exit = True
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
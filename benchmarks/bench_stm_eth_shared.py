@@ -0,0 +1,82 @@
+# benchmarks/bench_stm_eth_shared.py
+"""
+Multi-process consistency check and read-latency benchmark for the shared
+stm_eth store (STM_ETH_SHARED_DB). Several writer processes append to the
+same sessions concurrently, as uvicorn workers would. Afterwards every
+process must read an identical history for every session.
+
+    python -m benchmarks.bench_stm_eth_shared --processes 8 --writes 200
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+
+def _worker(path, worker_id, sessions, writes, barrier, results):
+    os.environ["STM_ETH_SHARED_DB"] = path
+    from memory.stm_eth import stm_eth
+    memory = stm_eth(max_turns=50, max_age_minutes=60)
+    barrier.wait()
+    for i in range(writes):
+        memory.add_message("user", f"worker {worker_id} message {i}", session_id=f"session-{i % sessions}")
+    barrier.wait()  # all writers done
+
+    latencies = []
+    histories = {}
+    for _ in range(5):
+        for s in range(sessions):
+            start = time.perf_counter()
+            histories[f"session-{s}"] = memory.get_messages(f"session-{s}")
+            latencies.append(time.perf_counter() - start)
+    results.put((worker_id, histories, latencies))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--sessions", type=int, default=4)
+    parser.add_argument("--writes", type=int, default=200, help="Messages written by each process")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "stm_eth_shared.db")
+        # Create the schema once before the writers race on it
+        os.environ["STM_ETH_SHARED_DB"] = path
+        from memory.stm_eth import stm_eth
+        stm_eth()
+
+        barrier = multiprocessing.Barrier(args.processes)
+        results = multiprocessing.Queue()
+        start = time.perf_counter()
+        procs = [
+            multiprocessing.Process(target=_worker, args=(path, w, args.sessions, args.writes, barrier, results))
+            for w in range(args.processes)
+        ]
+        for p in procs:
+            p.start()
+        collected = [results.get() for _ in procs]
+        for p in procs:
+            p.join()
+        elapsed = time.perf_counter() - start
+
+    reference = collected[0][1]
+    consistent = all(histories == reference for _, histories, _ in collected)
+    latencies = sorted(l for _, _, worker_latencies in collected for l in worker_latencies)
+    report = {
+        "processes": args.processes,
+        "writes_total": args.processes * args.writes,
+        "elapsed_s": round(elapsed, 3),
+        "consistent": consistent,
+        "history_lengths": {session: len(history) for session, history in reference.items()},
+        "read_p50_ms": round(statistics.median(latencies) * 1000, 4),
+        "read_p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 4),
+    }
+    print(json.dumps(report, indent=2))
+    if not consistent:
+        raise SystemExit("Histories differ between processes")
+
+if __name__ == "__main__":
+    main()
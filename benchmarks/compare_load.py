@@ -0,0 +1,78 @@
+# benchmarks/compare_load.py
+"""
+Diffs two bench_load reports and flags regressions beyond a threshold.
+Exits with status 1 if any tracked metric regressed, so it can gate CI.
+
+    python -m benchmarks.compare_load before.json after.json --threshold 10
+"""
+
+import argparse
+import json
+import sys
+
+# (path into a scenario result, True if higher is better)
+TRACKED = [
+    (("throughput_rps",), True),
+    (("ttft", "p50_ms"), False),
+    (("ttft", "p95_ms"), False),
+    (("ttft", "p99_ms"), False),
+    (("latency", "p50_ms"), False),
+    (("latency", "p95_ms"), False),
+    (("latency", "p99_ms"), False),
+    (("chunk_gap", "p95_ms"), False),
+    (("chunk_gap", "p99_ms"), False),
+    (("server_cpu_ms_per_request",), False),
+    (("rss_mb",), False),
+]
+
+def _lookup(result, path):
+    for key in path:
+        if not isinstance(result, dict) or key not in result:
+            return None
+        result = result[key]
+    return result
+
+def compare(before, after, threshold: float):
+    """
+    Returns (rows, regressions); each row is (scenario, metric, before, after, change %).
+    """
+    rows = []
+    regressions = []
+    for scenario in sorted(set(before["results"]) & set(after["results"])):
+        for path, higher_is_better in TRACKED:
+            old = _lookup(before["results"][scenario], path)
+            new = _lookup(after["results"][scenario], path)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old * 100 if old else 0.0
+            row = (scenario, ".".join(path), old, new, change)
+            rows.append(row)
+            worse = -change if higher_is_better else change
+            if worse > threshold:
+                regressions.append(row)
+    return rows, regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Allowed change in percent")
+    args = parser.parse_args()
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    rows, regressions = compare(before, after, args.threshold)
+
+    print(f"{before['meta'].get('commit')} -> {after['meta'].get('commit')}")
+    print(f"{'scenario':<16}{'metric':<30}{'before':>12}{'after':>12}{'change':>10}")
+    for scenario, metric, old, new, change in rows:
+        flag = "  <-- regression" if (scenario, metric, old, new, change) in regressions else ""
+        print(f"{scenario:<16}{metric:<30}{old:>12}{new:>12}{change:>+9.1f}%{flag}")
+    if regressions:
+        print(f"{len(regressions)} metric(s) regressed by more than {args.threshold}%.")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# benchmarks/openai_stub_server.py
+"""
+Minimal OpenAI-compatible server for exercising the local_http adapter without a model.
+Serves /v1/chat/completions (plain and SSE streaming), /v1/embeddings and llama.cpp's /tokenize.
+
+    python -m benchmarks.openai_stub_server --port 8080 --tokens 64 --token-delay-ms 0
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import threading
+import time
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+def create_app(tokens: int = 64, token_delay: float = 0.0, dim: int = 64) -> Starlette:
+    def reply_tokens(body):
+        count = min(tokens, body.get("max_tokens") or tokens)
+        return [f"tok{i} " for i in range(count)]
+
+    async def chat_completions(request: Request):
+        body = await request.json()
+        pieces = reply_tokens(body)
+        if not body.get("stream"):
+            if token_delay:
+                await asyncio.sleep(token_delay * len(pieces))
+            return JSONResponse({
+                "id": "stub", "object": "chat.completion", "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(pieces)}, "finish_reason": "stop"}],
+            })
+
+        async def events():
+            for piece in pieces:
+                if token_delay:
+                    await asyncio.sleep(token_delay)
+                chunk = {"id": "stub", "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {"content": piece}}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    async def embeddings(request: Request):
+        body = await request.json()
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        data = []
+        for index, text in enumerate(inputs):
+            digest = hashlib.sha256(text.encode("utf-8")).digest()
+            data.append({"index": index, "embedding": [digest[i % len(digest)] / 255.0 for i in range(dim)]})
+        return JSONResponse({"object": "list", "data": data, "model": body.get("model")})
+
+    async def tokenize(request: Request):
+        body = await request.json()
+        return JSONResponse({"tokens": list(range(len(body.get("content", "").split())))})
+
+    return Starlette(routes=[
+        Route("/v1/chat/completions", chat_completions, methods=["POST"]),
+        Route("/v1/embeddings", embeddings, methods=["POST"]),
+        Route("/tokenize", tokenize, methods=["POST"]),
+    ])
+
+def start_in_thread(port: int, **app_kwargs) -> uvicorn.Server:
+    """
+    Runs the stub on 127.0.0.1:port in a daemon thread and returns once it accepts connections.
+    """
+    server = uvicorn.Server(uvicorn.Config(create_app(**app_kwargs), host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--tokens", type=int, default=64, help="Tokens per reply")
+    parser.add_argument("--token-delay-ms", type=float, default=0.0)
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.tokens, args.token_delay_ms / 1000), host="127.0.0.1", port=args.port)
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@
 import os
 import importlib
 import json
+import time
 from dotenv import load_dotenv
 from typing import List, Dict
 import logging
@@ -10,6 +11,8 @@ import logging
 
 class ConfigManager:
     _instance = None
+    # How often to check whether another worker rewrote config.json
+    RELOAD_INTERVAL_SECONDS = 1.0
 
     def __new__(cls):
         if cls._instance is None:
@@ -33,11 +36,38 @@ class ConfigManager:
             }
         }
         
+        self._config_mtime = None
+        self._next_reload_check = time.monotonic() + self.RELOAD_INTERVAL_SECONDS
         if os.path.exists('config.json'):
+            self._config_mtime = os.stat('config.json').st_mtime_ns
             with open('config.json', 'r') as f:
                 file_config = json.load(f)
                 self._recursive_update(self.config, file_config)
 
+    def _refresh(self):
+        """
+        Re-reads config.json if another process (e.g. a sibling uvicorn worker)
+        replaced it. Checked at most once per RELOAD_INTERVAL_SECONDS.
+        """
+        now = time.monotonic()
+        if now < self._next_reload_check:
+            return
+        self._next_reload_check = now + self.RELOAD_INTERVAL_SECONDS
+        try:
+            mtime = os.stat('config.json').st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._config_mtime:
+            return
+        try:
+            with open('config.json', 'r') as f:
+                file_config = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not reload config.json: {e}")
+            return
+        self._config_mtime = mtime
+        self._recursive_update(self.config, file_config)
+
     def _recursive_update(self, d, u):
         for k, v in u.items():
             if isinstance(v, dict):
@@ -55,12 +85,17 @@ class ConfigManager:
         if 'api_keys' in config_to_save.get('llm', {}):
             del config_to_save['llm']['api_keys']
             
-        with open('config.json', 'w') as f:
+        # Write to a temp file and rename so other workers never read a partial file
+        tmp_path = f"config.json.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
             json.dump(config_to_save, f, indent=4)
             f.flush()
             os.fsync(f.fileno())
+        os.replace(tmp_path, 'config.json')
+        self._config_mtime = os.stat('config.json').st_mtime_ns
 
     def get_current_model(self) -> str:
+        self._refresh()
         return self.config['llm']['active_model']
 
     def set_current_model(self, model_name: str):
@@ -68,6 +103,7 @@ class ConfigManager:
         self._save_config()
 
     def get_memory_module(self) -> str:
+        self._refresh()
         return self.config['memory']['active_module']
         
     def set_memory_module(self, module_name: str):
@@ -75,7 +111,12 @@ class ConfigManager:
         self._save_config()
         
     def get_api_key(self, llm_name: str) -> str:
-        return self.config['llm']['api_keys'].get(llm_name)
+        # Falls back to <NAME>_API_KEY, e.g. LOCAL_HTTP_API_KEY
+        return self.config['llm']['api_keys'].get(llm_name) or os.getenv(f"{llm_name.upper()}_API_KEY")
+
+    def get_setting(self, section: str, key: str, default=None):
+        """Returns an optional tuning value from a config section, or the default."""
+        return self.config.get(section, {}).get(key, default)
 
 # Global instance will be created and memory_manager set in main.py
 # config_manager = ConfigManager() # Removed global instance creation here
\ No newline at end of file
@@ -1,7 +1,7 @@
 # llms/base.py
 
 from abc import ABC, abstractmethod
-from typing import List, Dict, Union, AsyncGenerator
+from typing import List, Dict, Union, AsyncGenerator, Awaitable, Callable
 
 class LLMAdapter(ABC):
     """
@@ -10,6 +10,8 @@ class LLMAdapter(ABC):
     """
     id: str
     name: str
+    # EmbeddingCacheStore for the adapter's embedding model, set by LLMManager when enabled
+    embedding_cache = None
 
     @abstractmethod
     async def generate(self, messages: List[Dict], **kwargs) -> str:
@@ -43,4 +45,33 @@ class LLMAdapter(ABC):
         """
         Returns True if the adapter supports embedding generation.
         """
-        return callable(getattr(self, "embed", None))
\ No newline at end of file
+        return callable(getattr(self, "embed", None))
+
+    def invalidate_session(self, session_id: str):
+        """
+        Drops any per-session state the adapter caches. No-op by default.
+        """
+        pass
+
+    async def aclose(self):
+        """
+        Releases connections or other resources held by the adapter. No-op by default.
+        """
+        pass
+
+    async def _embed_through_cache(self, texts: List[str],
+                                   fetch: Callable[[List[str]], Awaitable[List[List[float]]]]) -> List[List[float]]:
+        """
+        Serves texts from embedding_cache and calls fetch() only for the ones not cached.
+        Cached vectors are returned as read-only NumPy views.
+        """
+        cache = self.embedding_cache
+        if cache is None:
+            return await fetch(texts)
+        vectors = cache.get_many(texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            fetched = await fetch([texts[i] for i in missing])
+            for i, vector in zip(missing, fetched):
+                vectors[i] = cache.put(texts[i], vector)
+        return vectors
\ No newline at end of file
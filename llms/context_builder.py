@@ -0,0 +1,151 @@
+# llms/context_builder.py
+
+import asyncio
+import logging
+import re
+from collections import OrderedDict
+from typing import Dict, List
+
+from llms.base import LLMAdapter
+
+# Word pieces and individual punctuation marks, roughly how BPE tokenizers split text
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+# Role/turn framing the provider adds around every message
+MESSAGE_OVERHEAD_TOKENS = 4
+# Used when an adapter does not declare its context window
+DEFAULT_CONTEXT_WINDOW = 32768
+# Generous bytes-per-token bound (CJK text runs ~12), used to size history reads
+MAX_BYTES_PER_TOKEN = 16
+
+def estimate_tokens(text: str) -> int:
+    """
+    Fast local token estimate: one token per punctuation mark and roughly one
+    per four characters of each word. Calibrated against the real tokenizer
+    by ContextBuilder.
+    """
+    return sum(1 + (len(piece) - 1) // 4 for piece in _TOKEN_PATTERN.findall(text))
+
+class ContextWindow:
+    """
+    The messages selected for a request and how much history was dropped.
+    """
+
+    def __init__(self, messages: List[Dict], budget: int, prompt_tokens: int, trimmed_tokens: int, trimmed_messages: int):
+        self.messages = messages
+        self.budget = budget
+        self.prompt_tokens = prompt_tokens
+        self.trimmed_tokens = trimmed_tokens
+        self.trimmed_messages = trimmed_messages
+
+    def report(self) -> Dict:
+        return {
+            "budget": self.budget,
+            "prompt_tokens": self.prompt_tokens,
+            "trimmed_tokens": self.trimmed_tokens,
+            "trimmed_messages": self.trimmed_messages,
+        }
+
+class ContextBuilder:
+    """
+    Fits conversation history into the model's prompt budget.
+    Keeps pinned messages ('pinned': True, and a leading system prompt) and the
+    newest turns that fit. Other system messages, such as the topic messages
+    utm_anyai returns, are history and trimmed like any other turn.
+    Per-message estimates are memoized; the adapter's count_tokens is only
+    called in the background to calibrate them.
+    """
+
+    def __init__(self, max_prompt_tokens: int = None, reserve_tokens: int = 256,
+                 calibrate_every: int = 50, memo_size: int = 50000):
+        self.max_prompt_tokens = max_prompt_tokens
+        self.reserve_tokens = reserve_tokens
+        self.calibrate_every = calibrate_every
+        self.memo_size = memo_size
+        self._memo = OrderedDict()  # (role, content) -> uncalibrated estimate
+        self._ratios = {}  # adapter id -> real tokens per estimated token
+        self._builds = {}  # adapter id -> builds since last calibration
+        self._calibrations = {}  # adapter id -> in-flight calibration task
+
+    def budget_for(self, adapter: LLMAdapter, max_tokens: int) -> int:
+        """
+        Prompt tokens available once the response and a safety reserve are set aside.
+        """
+        context_window = getattr(adapter, "context_window", None) or DEFAULT_CONTEXT_WINDOW
+        budget = context_window - max_tokens - self.reserve_tokens
+        if self.max_prompt_tokens:
+            budget = min(budget, self.max_prompt_tokens)
+        return max(budget, 0)
+
+    def history_byte_budget(self, adapter: LLMAdapter, max_tokens: int) -> int:
+        """
+        Upper bound on the history bytes that could fit the prompt budget, so memory
+        modules can read just the tail of a long session.
+        """
+        return self.budget_for(adapter, max_tokens) * MAX_BYTES_PER_TOKEN
+
+    def _estimate(self, message: Dict) -> int:
+        key = (message.get("role"), message.get("content") or "")
+        estimate = self._memo.get(key)
+        if estimate is None:
+            estimate = estimate_tokens(key[1]) + MESSAGE_OVERHEAD_TOKENS
+            self._memo[key] = estimate
+            if len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+        return estimate
+
+    async def build(self, messages: List[Dict], adapter: LLMAdapter, max_tokens: int) -> ContextWindow:
+        """
+        Selects the pinned messages plus the longest run of newest messages
+        that fits the budget. The newest message is always kept.
+        """
+        adapter_id = getattr(adapter, "id", type(adapter).__name__)
+        ratio = self._ratios.get(adapter_id, 1.0)
+        budget = self.budget_for(adapter, max_tokens)
+
+        costs = [int(self._estimate(msg) * ratio) for msg in messages]
+        total = sum(costs)
+        keep = [bool(msg.get("pinned")) for msg in messages]
+        if messages and messages[0].get("role") == "system":
+            keep[0] = True
+        used = sum(cost for cost, pinned in zip(costs, keep) if pinned)
+
+        for i in range(len(messages) - 1, -1, -1):
+            if keep[i]:
+                continue
+            if used + costs[i] > budget and i != len(messages) - 1:
+                break
+            keep[i] = True
+            used += costs[i]
+
+        kept = [msg for msg, kept_flag in zip(messages, keep) if kept_flag]
+        window = ContextWindow(kept, budget, used, total - used, len(messages) - len(kept))
+        if window.trimmed_messages:
+            logging.info(f"Context trimmed {window.trimmed_messages} messages ({window.trimmed_tokens} tokens) to fit {budget} tokens.")
+        self._maybe_calibrate(adapter, adapter_id, kept)
+        return window
+
+    def _maybe_calibrate(self, adapter: LLMAdapter, adapter_id: str, messages: List[Dict]):
+        builds = self._builds.get(adapter_id, self.calibrate_every) + 1
+        if builds < self.calibrate_every or adapter_id in self._calibrations or not messages:
+            self._builds[adapter_id] = builds
+            return
+        self._builds[adapter_id] = 0
+        sample = [msg.get("content") or "" for msg in messages[-8:]]
+        task = asyncio.ensure_future(self._calibrate(adapter, adapter_id, sample))
+        self._calibrations[adapter_id] = task
+        task.add_done_callback(lambda _: self._calibrations.pop(adapter_id, None))
+
+    async def _calibrate(self, adapter: LLMAdapter, adapter_id: str, sample: List[str]):
+        estimated = sum(estimate_tokens(text) for text in sample)
+        if not estimated:
+            return
+        try:
+            actual = await adapter.count_tokens(sample)
+        except Exception as e:
+            logging.warning(f"Token calibration against '{adapter_id}' failed: {e}")
+            return
+        observed = actual / estimated
+        previous = self._ratios.get(adapter_id)
+        # Smooth so one unusual sample does not swing the budget
+        self._ratios[adapter_id] = observed if previous is None else 0.8 * previous + 0.2 * observed
+        logging.info(f"Token estimate calibrated for '{adapter_id}': {self._ratios[adapter_id]:.3f} real tokens per estimated token.")
@@ -0,0 +1,258 @@
+# llms/embedding_cache.py
+
+import hashlib
+import logging
+import os
+import re
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process use only
+    fcntl = None
+
+MAGIC = 0x414E594149454D42  # "ANYAIEMB"
+FORMAT_VERSION = 1
+HEADER_WORDS = 8  # magic, version, slot capacity, rows used, dim, max rows, use tick, reserved
+SLOT_WORDS = 4  # key high, key low, row + 1 (0 = empty), last-used tick
+
+class EmbeddingCacheStore:
+    """
+    Embedding cache for one model, in a single memory-mapped file:
+
+        header | open-addressing hash index (sha256 prefix -> row) | float32 vector matrix
+
+    Vectors are appended and never moved in place, so a lookup returns a
+    zero-copy NumPy view and a restarted process only has to map the file.
+    When the matrix is full, compaction rewrites the file keeping the most
+    recently used entries and swaps it in atomically. Writers from several
+    processes serialize on a lock file; readers notice a swapped file by inode.
+    """
+    # Fraction of max_entries kept when the matrix fills up
+    COMPACT_KEEP = 0.75
+    # How often readers check whether another process swapped the file
+    REOPEN_CHECK_SECONDS = 1.0
+
+    def __init__(self, directory: str, max_entries: int = 100000):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.path = os.path.join(directory, "cache.bin")
+        self.max_entries = max_entries
+        self.capacity = 1 << max(4, (2 * max_entries - 1).bit_length())  # load factor <= 0.5
+        self.hits = 0
+        self.misses = 0
+        self.inserts = 0
+        self.compactions = 0
+        self._lock = threading.Lock()
+        self._lock_file = open(os.path.join(directory, "cache.lock"), "a+")
+        self._header = None
+        self._slots = None
+        self._vectors = None
+        self._inode = None
+        self._last_check = 0.0
+        with self._lock, self._file_lock():
+            self._open()
+            if self._header is not None and (int(self._header[2]) != self.capacity or int(self._header[5]) != self.max_entries):
+                # Resized through config; carry the newest entries over to the new layout
+                self._compact()
+
+    @staticmethod
+    def _key(text: str):
+        return struct.unpack("<QQ", hashlib.sha256(text.encode("utf-8")).digest()[:16])
+
+    @contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _open(self):
+        if not os.path.exists(self.path):
+            self._header = self._slots = self._vectors = self._inode = None
+            return
+        words = np.memmap(self.path, dtype=np.uint64, mode="r+", shape=(HEADER_WORDS,))
+        if int(words[0]) != MAGIC or int(words[1]) != FORMAT_VERSION:
+            logging.warning(f"Ignoring embedding cache with unknown format at {self.path}.")
+            del words
+            os.remove(self.path)
+            self._header = self._slots = self._vectors = self._inode = None
+            return
+        self._map(int(words[2]), int(words[4]), int(words[5]))
+
+    def _map(self, capacity: int, dim: int, max_rows: int, path: str = None):
+        path = path or self.path
+        index_words = HEADER_WORDS + capacity * SLOT_WORDS
+        index = np.memmap(path, dtype=np.uint64, mode="r+", shape=(index_words,))
+        self._header = index[:HEADER_WORDS]
+        self._slots = index[HEADER_WORDS:].reshape(capacity, SLOT_WORDS)
+        self._vectors = np.memmap(path, dtype=np.float32, mode="r+", offset=index_words * 8, shape=(max_rows, dim))
+        self._inode = os.stat(path).st_ino
+        self._last_check = time.monotonic()
+
+    def _create(self, path: str, dim: int):
+        index_words = HEADER_WORDS + self.capacity * SLOT_WORDS
+        with open(path, "wb") as f:
+            # Sparse file: untouched slots and rows take no disk space
+            f.truncate(index_words * 8 + self.max_entries * dim * 4)
+        self._map(self.capacity, dim, self.max_entries, path)
+        self._header[:] = (MAGIC, FORMAT_VERSION, self.capacity, 0, dim, self.max_entries, 0, 0)
+
+    def _refresh(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._last_check < self.REOPEN_CHECK_SECONDS:
+            return
+        self._last_check = now
+        try:
+            inode = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            inode = None
+        if inode != self._inode:
+            self._open()
+
+    def _find(self, high: int, low: int):
+        """
+        Returns (slot, row) for the key, or (first empty slot, None).
+        """
+        mask = self._slots.shape[0] - 1
+        slot = low & mask
+        while True:
+            key_high, key_low, row, _ = self._slots[slot].tolist()
+            if row == 0:
+                return slot, None
+            if key_high == high and key_low == low:
+                return slot, row - 1
+            slot = (slot + 1) & mask
+
+    def _touch(self, slot: int):
+        tick = int(self._header[6]) + 1
+        self._header[6] = tick
+        self._slots[slot, 3] = tick
+
+    def get(self, text: str, count_miss: bool = True) -> Optional[np.ndarray]:
+        """
+        Returns the cached vector as a read-only view into the mapped file, or None.
+        count_miss=False is for fast-path probes that fall through to a counted lookup.
+        """
+        high, low = self._key(text)
+        with self._lock:
+            self._refresh()
+            if self._slots is not None:
+                slot, row = self._find(high, low)
+                if row is not None:
+                    self._touch(slot)
+                    self.hits += 1
+                    view = self._vectors[row]
+                    view.flags.writeable = False
+                    return view
+            if count_miss:
+                self.misses += 1
+            return None
+
+    def get_many(self, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        return [self.get(text) for text in texts]
+
+    def put(self, text: str, vector: Sequence[float]) -> np.ndarray:
+        """
+        Stores a vector and returns the cached view of it.
+        """
+        vector = np.asarray(vector, dtype=np.float32)
+        high, low = self._key(text)
+        with self._lock, self._file_lock():
+            self._refresh(force=True)
+            if self._slots is None:
+                self._create(self.path, vector.shape[0])
+            if vector.shape[0] != self._vectors.shape[1]:
+                logging.warning(f"Not caching a {vector.shape[0]}-dim embedding in a {self._vectors.shape[1]}-dim cache at {self.path}.")
+                return vector
+            slot, row = self._find(high, low)
+            if row is None:
+                if int(self._header[3]) >= self._vectors.shape[0]:
+                    self._compact()
+                    slot, row = self._find(high, low)
+                row = int(self._header[3])
+                self._vectors[row] = vector
+                tick = int(self._header[6]) + 1
+                self._header[6] = tick
+                # The row pointer is written after the key, so readers never match a half-written slot
+                self._slots[slot, 0] = high
+                self._slots[slot, 1] = low
+                self._slots[slot, 3] = tick
+                self._slots[slot, 2] = row + 1
+                self._header[3] = row + 1
+                self.inserts += 1
+            view = self._vectors[row]
+            view.flags.writeable = False
+            return view
+
+    def _compact(self):
+        """
+        Rewrites the file with the most recently used entries. Call with both locks held.
+        """
+        if self._slots is None:
+            return
+        occupied = np.nonzero(self._slots[:, 2])[0]
+        keep = int(self.max_entries * self.COMPACT_KEEP)
+        if len(occupied) > keep:
+            # Highest tick = most recently used
+            occupied = occupied[np.argsort(self._slots[occupied, 3])[::-1][:keep]]
+        old_slots = np.array(self._slots[occupied])
+        old_vectors = np.array(self._vectors[old_slots[:, 2].astype(np.int64) - 1])
+        dim = self._vectors.shape[1]
+
+        tmp_path = f"{self.path}.tmp"
+        self._create(tmp_path, dim)
+        self._vectors[:len(old_slots)] = old_vectors
+        for row, (high, low, _, tick) in enumerate(old_slots):
+            slot, _ = self._find(int(high), int(low))
+            self._slots[slot] = (high, low, row + 1, tick)
+        self._header[3] = len(old_slots)
+        self._header[6] = int(old_slots[:, 3].max()) if len(old_slots) else 0
+        self._vectors.flush()
+        os.replace(tmp_path, self.path)
+        self._inode = os.stat(self.path).st_ino
+        self.compactions += 1
+        logging.info(f"Compacted embedding cache {self.path} to {len(old_slots)} entries.")
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": int(self._header[3]) if self._header is not None else 0,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "inserts": self.inserts,
+            "compactions": self.compactions,
+        }
+
+class EmbeddingCache:
+    """
+    Persistent embedding cache keyed by (embedding model, sha256 of text),
+    with one EmbeddingCacheStore per model directory.
+    """
+
+    def __init__(self, directory: str, max_entries: int = 100000):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._stores = {}
+
+    def for_model(self, model: str) -> EmbeddingCacheStore:
+        store = self._stores.get(model)
+        if store is None:
+            directory = os.path.join(self.directory, re.sub(r"[^A-Za-z0-9_.-]", "_", model))
+            store = self._stores[model] = EmbeddingCacheStore(directory, self.max_entries)
+        return store
+
+    def stats(self) -> Dict[str, Dict]:
+        return {model: store.stats() for model, store in self._stores.items()}
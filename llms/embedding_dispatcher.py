@@ -0,0 +1,106 @@
+# llms/embedding_dispatcher.py
+
+import asyncio
+import logging
+from typing import Dict, List
+
+from llms.base import LLMAdapter
+from llms.context_builder import estimate_tokens
+from metrics.collectors import Counter, Histogram
+
+EMBED_BATCH_SIZE = Histogram(
+    "anyai_embedding_batch_size", "Texts sent per upstream embedding call.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+EMBED_BATCH_FALLBACKS = Counter("anyai_embedding_batch_fallbacks_total", "Embedding batches retried one text at a time after failing.")
+
+class _PendingBatch:
+    def __init__(self):
+        self.futures: Dict[str, List[asyncio.Future]] = {}  # text -> callers waiting on it
+        self.tokens = 0
+        self.timer = None
+
+class EmbeddingDispatcher:
+    """
+    Gathers concurrent single-text embed requests into one adapter.embed() call.
+    A batch is sent when its window elapses, or sooner once it reaches max_batch
+    distinct texts or max_batch_tokens estimated tokens. Identical texts in a
+    batch are embedded once. If a batch call fails, its texts are retried one by
+    one so a single bad input only fails its own caller.
+    """
+
+    def __init__(self, window_seconds: float = 0.005, max_batch: int = 100, max_batch_tokens: int = 32000):
+        self.window_seconds = window_seconds
+        self.max_batch = max_batch
+        self.max_batch_tokens = max_batch_tokens
+        self._pending: Dict[int, _PendingBatch] = {}  # id(adapter) -> batch being gathered
+        self._adapters: Dict[int, LLMAdapter] = {}
+        self._tasks = set()
+
+    async def embed(self, adapter: LLMAdapter, text: str) -> List[float]:
+        """
+        Embeds one text, sharing the upstream call with concurrent requests to the same adapter.
+        """
+        key = id(adapter)
+        batch = self._pending.get(key)
+        if batch is None:
+            batch = self._pending[key] = _PendingBatch()
+            self._adapters[key] = adapter
+            batch.timer = asyncio.get_running_loop().call_later(self.window_seconds, self._dispatch, key)
+        future = asyncio.get_running_loop().create_future()
+        waiters = batch.futures.get(text)
+        if waiters is None:
+            batch.futures[text] = [future]
+            batch.tokens += estimate_tokens(text)
+        else:
+            waiters.append(future)
+        if len(batch.futures) >= self.max_batch or batch.tokens >= self.max_batch_tokens:
+            self._dispatch(key)
+        return await future
+
+    def _dispatch(self, key: int):
+        batch = self._pending.pop(key, None)
+        adapter = self._adapters.pop(key, None)
+        if batch is None:
+            return
+        batch.timer.cancel()
+        task = asyncio.ensure_future(self._run(adapter, batch))
+        # Keep a reference so the task is not garbage collected mid-flight
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, adapter: LLMAdapter, batch: _PendingBatch):
+        texts = list(batch.futures)
+        EMBED_BATCH_SIZE.observe(len(texts))
+        try:
+            vectors = await adapter.embed(texts)
+            if len(vectors) != len(texts):
+                raise ValueError(f"Expected {len(texts)} embeddings, got {len(vectors)}.")
+        except Exception as e:
+            if len(texts) == 1:
+                self._resolve(batch.futures[texts[0]], error=e)
+                return
+            EMBED_BATCH_FALLBACKS.inc()
+            logging.warning(f"Embedding batch of {len(texts)} failed ({e}); retrying texts individually.")
+            await asyncio.gather(*(self._run_single(adapter, text, batch.futures[text]) for text in texts))
+            return
+        for text, vector in zip(texts, vectors):
+            self._resolve(batch.futures[text], result=vector)
+
+    async def _run_single(self, adapter: LLMAdapter, text: str, futures: List[asyncio.Future]):
+        try:
+            vectors = await adapter.embed([text])
+            self._resolve(futures, result=vectors[0])
+        except Exception as e:
+            self._resolve(futures, error=e)
+
+    @staticmethod
+    def _resolve(futures: List[asyncio.Future], result=None, error: Exception = None):
+        for future in futures:
+            # Callers that were cancelled while waiting are skipped
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
@@ -1,7 +1,8 @@
 # llms/gemini.py
 
 import os
-from typing import List, Dict, AsyncGenerator
+from collections import OrderedDict
+from typing import List, Dict, AsyncGenerator, Optional
 from google import genai
 from google.genai import types
 
@@ -11,7 +12,9 @@ from llms.base import LLMAdapter
 module_config = {
     "name": "Gemini",
     "generation_model": "gemini-2.0-flash-001",
-    "embedding_model": "text-embedding-004"
+    "embedding_model": "text-embedding-004",
+    "context_window": 1048576,
+    "prompt_cache_sessions": 256
 }
 
 class GeminiAdapter(LLMAdapter):
@@ -19,7 +22,7 @@ class GeminiAdapter(LLMAdapter):
     Adapter for the Google Gemini API.
     """
 
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, settings: Optional[Dict] = None):
         self.id = "gemini"
         self.name = "Google Gemini"
         
@@ -31,14 +34,19 @@ class GeminiAdapter(LLMAdapter):
         os.environ["GOOGLE_API_KEY"] = api_key
         
         self.client = genai.Client()
-        self.generation_model = module_config["generation_model"]
-        self.embedding_model = module_config["embedding_model"]
+        settings = {**module_config, **(settings or {})}
+        self.generation_model = settings["generation_model"]
+        self.embedding_model = settings["embedding_model"]
+        self.context_window = settings["context_window"]
+        # session_id -> {(role, content): types.Content}, LRU over sessions
+        self._prompt_cache = OrderedDict()
+        self.prompt_cache_sessions = settings["prompt_cache_sessions"]
 
     async def generate(self, messages: List[Dict], **kwargs) -> str:
         """
         Generate a non-streaming text response from the Gemini model.
         """
-        contents = self._prepare_chat_contents(messages)
+        contents = self._prepare_chat_contents(messages, kwargs.get("session_id"))
                         
         response = await self.client.aio.models.generate_content(
             model=self.generation_model,
@@ -50,24 +58,34 @@ class GeminiAdapter(LLMAdapter):
         """
         Generate a streaming text response from the Gemini model.
         """
-        contents = self._prepare_chat_contents(messages)
-        
-        async for chunk in await self.client.aio.models.generate_content_stream(
+        contents = self._prepare_chat_contents(messages, kwargs.get("session_id"))
+
+        response_stream = await self.client.aio.models.generate_content_stream(
             model=self.generation_model,
             contents=contents,
-        ):
-            if chunk.text:
-                yield chunk.text
+        )
+        try:
+            async for chunk in response_stream:
+                if chunk.text:
+                    yield chunk.text
+        finally:
+            # Closing the SDK iterator releases the HTTP stream when we stop early
+            await response_stream.aclose()
 
     async def embed(self, texts: List[str]) -> List[List[float]]:
         """
         Generate embeddings for a list of texts using a dedicated embedding model.
+        With an embedding cache, only texts not cached yet are sent, and vectors
+        are returned as read-only NumPy views into the cache.
         """
-        response = await self.client.aio.models.embed_content(
-            model=self.embedding_model,
-            contents=texts
-        )
-        return [embedding.values for embedding in response.embeddings]
+        async def fetch(batch: List[str]) -> List[List[float]]:
+            response = await self.client.aio.models.embed_content(
+                model=self.embedding_model,
+                contents=batch
+            )
+            return [embedding.values for embedding in response.embeddings]
+
+        return await self._embed_through_cache(texts, fetch)
 
     async def count_tokens(self, texts: List[str]) -> int:
         """
@@ -79,19 +97,43 @@ class GeminiAdapter(LLMAdapter):
         )
         return response.total_tokens
 
-    def _prepare_chat_contents(self, messages: List[Dict]):
+    def _prepare_chat_contents(self, messages: List[Dict], session_id: Optional[str] = None):
         """
         Prepares the chat message format for the Gemini SDK's generate/stream methods.
+        With a session_id, Content objects from the previous turn are reused so only
+        messages that are new to the session get converted.
         """
+        if session_id is None:
+            return [self._to_content(msg) for msg in messages]
+
+        previous = self._prompt_cache.pop(session_id, {})
+        prepared = {}
         contents = []
         for msg in messages:
-            contents.append(
-                types.Content(
-                    role=msg['role'],
-                    parts=[types.Part(text=msg['content'])]
-                )
-            )
+            key = (msg['role'], msg['content'])
+            content = prepared.get(key) or previous.get(key)
+            if content is None:
+                content = self._to_content(msg)
+            prepared[key] = content
+            contents.append(content)
+
+        # Only the current window is kept, so the per-session map cannot outgrow the history
+        self._prompt_cache[session_id] = prepared
+        if len(self._prompt_cache) > self.prompt_cache_sessions:
+            self._prompt_cache.popitem(last=False)
         return contents
+
+    def _to_content(self, msg: Dict) -> types.Content:
+        return types.Content(
+            role=msg['role'],
+            parts=[types.Part(text=msg['content'])]
+        )
+
+    def invalidate_session(self, session_id: str):
+        """
+        Drops the prepared contents cached for a session, e.g. after memory/clear.
+        """
+        self._prompt_cache.pop(session_id, None)
         
     def supports_embeddings(self) -> bool:
         """
@@ -1,20 +1,80 @@
 # llms/llm_manager.py
 
 import os
+import asyncio
 import importlib
-from typing import List, Dict, AsyncGenerator
+import threading
+from contextlib import aclosing
+from typing import List, Dict, AsyncGenerator, Optional
+import numpy as np
 from llms.base import LLMAdapter
+from llms.response_cache import ResponseCache
+from llms.embedding_dispatcher import EmbeddingDispatcher
+from llms.embedding_cache import EmbeddingCache
+from llms.router import LLMRouter
+from metrics.collectors import Histogram, InstanceMetric
 from config.manager import ConfigManager
 
+LLM_GENERATE_SECONDS = Histogram("anyai_llm_generate_seconds", "Latency of upstream generate calls.", ["module"])
+RESPONSE_CACHE_EVENTS = InstanceMetric(
+    "anyai_llm_response_cache_events_total", "Response cache lookups by outcome.",
+    lambda manager: {(outcome,): manager.response_cache.stats()[outcome] for outcome in ("hits", "misses", "coalesced", "evictions")},
+    kind="counter", labelnames=["outcome"]
+)
+RESPONSE_CACHE_BYTES = InstanceMetric("anyai_llm_response_cache_bytes", "Bytes held by the response cache.",
+                                      lambda manager: manager.response_cache.current_bytes)
+EMBEDDING_CACHE_EVENTS = InstanceMetric(
+    "anyai_embedding_cache_events_total", "Embedding cache lookups by model and outcome.",
+    lambda manager: {
+        (model, outcome): stats[outcome]
+        for model, stats in (manager.embedding_cache.stats() if manager.embedding_cache else {}).items()
+        for outcome in ("hits", "misses")
+    },
+    kind="counter", labelnames=["model", "outcome"]
+)
+
 class LLMManager:
     def __init__(self, config_manager: ConfigManager):
         self.config_manager = config_manager
         self.modules = {}
-        self._instances = {}  # Cache for module instances
+        self._instances = {}  # Cache for module instances, shared by concurrent requests
+        self._instances_lock = threading.Lock()
         self.active_module_name = None
         self.active_module = None
+        self._failed_switch = None  # configured module this worker could not instantiate
+        self.response_cache = ResponseCache(
+            max_entries=self.config_manager.get_setting("llm", "response_cache_entries", 1024),
+            max_bytes=self.config_manager.get_setting("llm", "response_cache_bytes", 32 * 1024 * 1024),
+            ttl_seconds=self.config_manager.get_setting("llm", "response_cache_ttl_seconds", 300)
+        )
+        RESPONSE_CACHE_EVENTS.track(self)
+        RESPONSE_CACHE_BYTES.track(self)
+        self.embedding_dispatcher = EmbeddingDispatcher(
+            window_seconds=self.config_manager.get_setting("llm", "embed_batch_window_ms", 5) / 1000,
+            max_batch=self.config_manager.get_setting("llm", "embed_max_batch", 100),
+            max_batch_tokens=self.config_manager.get_setting("llm", "embed_max_batch_tokens", 32000)
+        )
+        cache_dir = self.config_manager.get_setting("llm", "embedding_cache_dir", "embedding_cache")
+        self.embedding_cache = EmbeddingCache(
+            cache_dir, self.config_manager.get_setting("llm", "embedding_cache_entries", 100000)
+        ) if cache_dir else None
+        EMBEDDING_CACHE_EVENTS.track(self)
+        routing = self.config_manager.get_setting("llm", "routing", {})
+        # Hedging and failover from the active module to the fallbacks, when enabled
+        self.router = LLMRouter(
+            self.get_module,
+            fallbacks=routing.get("fallbacks", []),
+            hedge_percentile=routing.get("hedge_percentile", 95),
+            hedge_min=routing.get("hedge_min_ms", 250) / 1000,
+            hedge_max=routing.get("hedge_max_ms", 5000) / 1000,
+            max_attempts=routing.get("max_attempts", 2),
+            failure_threshold=routing.get("failure_threshold", 5),
+            error_rate_threshold=routing.get("error_rate_threshold", 0.5),
+            open_seconds=routing.get("open_seconds", 30)
+        ) if routing.get("enabled") else None
         self._discover_modules()
         self.set_active_module(self.config_manager.get_current_model())
+        self._preload_modules()
 
     def _discover_modules(self):
         """
@@ -22,54 +82,177 @@ class LLMManager:
         """
         module_path = os.path.dirname(__file__)
         for filename in os.listdir(module_path):
-            if filename.endswith('.py') and filename not in ['__init__.py', 'base.py', 'llm_manager.py']:
+            if filename.endswith('.py') and filename not in ['__init__.py', 'base.py', 'llm_manager.py', 'response_cache.py', 'context_builder.py', 'embedding_dispatcher.py', 'embedding_cache.py', 'router.py']:
                 module_name = filename[:-3]
                 try:
                     module = importlib.import_module(f"llms.{module_name}")
                     class_name = f"{module_name.capitalize()}Adapter"
-                    if hasattr(module, class_name):
+                    adapter_class = getattr(module, class_name, None)
+                    if adapter_class is None:
+                        # e.g. local_http.py defines LocalHttpAdapter
+                        adapter_class = next((
+                            obj for obj in vars(module).values()
+                            if isinstance(obj, type) and issubclass(obj, LLMAdapter)
+                            and obj is not LLMAdapter and obj.__module__ == module.__name__
+                        ), None)
+                    if adapter_class is not None:
                         self.modules[module_name] = {
-                            "class": getattr(module, class_name),
+                            "class": adapter_class,
                             "config": getattr(module, "module_config", {})
                         }
                         print(f"Discovered LLM module: {module_name}")
                 except (ImportError, AttributeError) as e:
                     print(f"Warning: Could not load LLM module {module_name}: {e}")
 
-    def set_active_module(self, module_name: str):
+    def _preload_modules(self):
+        """
+        Instantiates the configured modules up front (all by default) so per-request
+        selection never pays for adapter setup. Modules that cannot start are skipped.
+        """
+        for module_name in self.config_manager.get_setting("llm", "preload_modules", list(self.modules)):
+            try:
+                self.get_module(module_name)
+            except Exception as e:
+                print(f"Warning: Could not preload LLM module {module_name}: {e}")
+
+    def get_module(self, module_name: Optional[str] = None) -> LLMAdapter:
+        """
+        Returns the adapter for a module from the shared pool, creating it on first use.
+        None means the active module. Does not change the active module.
+        """
+        if module_name is None:
+            return self.get_active_module()
+        instance = self._instances.get(module_name)
+        if instance is not None:
+            return instance
+        if module_name not in self.modules:
+            raise ValueError(f"LLM module '{module_name}' not found.")
+        with self._instances_lock:
+            if module_name in self._instances:
+                return self._instances[module_name]
+            module_info = self.modules[module_name]
+            api_key = self.config_manager.get_api_key(module_name)
+            if not api_key and module_info["config"].get("requires_api_key", True):
+                raise ValueError(f"API key for '{module_name}' not found.")
+
+            # Module defaults, overridden by "llm": {"modules": {"<name>": {...}}} in config.json
+            settings = {
+                **module_info["config"],
+                **self.config_manager.get_setting("llm", "modules", {}).get(module_name, {})
+            }
+            instance = module_info["class"](api_key=api_key, settings=settings)
+            embedding_model = getattr(instance, "embedding_model", None)
+            if self.embedding_cache is not None and embedding_model:
+                instance.embedding_cache = self.embedding_cache.for_model(embedding_model)
+            self._instances[module_name] = instance
+            print(f"Initialized and cached new instance for LLM module: {module_name}")
+        return self._instances[module_name]
+
+    def set_active_module(self, module_name: str, persist: bool = True):
         """
         Sets the active LLM module, using a cached instance if available.
+        persist=False adopts a selection already saved by another worker.
         """
-        if module_name in self.modules:
-            if module_name not in self._instances:
-                api_key = self.config_manager.get_api_key(module_name)
-                if not api_key:
-                    raise ValueError(f"API key for '{module_name}' not found.")
-                
-                module_info = self.modules[module_name]
-                self._instances[module_name] = module_info["class"](api_key=api_key)
-                print(f"Initialized and cached new instance for LLM module: {module_name}")
-
-            self.active_module_name = module_name
-            self.active_module = self._instances[module_name]
+        self.active_module = self.get_module(module_name)
+        self.active_module_name = module_name
+        if persist:
             self.config_manager.set_current_model(module_name)
-            print(f"Active LLM module set to: {module_name}")
-        else:
-            raise ValueError(f"LLM module '{module_name}' not found.")
+        print(f"Active LLM module set to: {module_name}")
 
     def get_active_module(self) -> LLMAdapter:
+        # Follow switches made by other workers sharing config.json
+        configured = self.config_manager.get_current_model()
+        if configured != self.active_module_name and configured in self.modules and configured != self._failed_switch:
+            try:
+                self.set_active_module(configured, persist=False)
+            except Exception as e:
+                self._failed_switch = configured
+                print(f"Warning: Could not follow LLM module switch to '{configured}': {e}")
         if not self.active_module:
             raise ValueError("No active LLM module set.")
         return self.active_module
 
-    async def generate_text(self, messages: List[Dict], **kwargs) -> str:
-        return await self.get_active_module().generate(messages, **kwargs)
+    def _resolve(self, module_name: Optional[str]):
+        """
+        Returns (name, adapter) for a per-request module name, or for the active module if None.
+        """
+        if module_name is None:
+            self.get_active_module()
+            module_name = self.active_module_name
+        return module_name, self.get_module(module_name)
+
+    async def generate_text(self, messages: List[Dict], cache: str = "read", session_id: Optional[str] = None,
+                            module_name: Optional[str] = None, **kwargs) -> str:
+        """
+        Generates a response through the exact-match response cache.
+        cache is one of 'read', 'write' or 'bypass' (see ResponseCache).
+        session_id lets the adapter reuse per-session state; it is not part of the cache key.
+        module_name picks a module for this request only; the active module is the default.
+        """
+        module_name, module = self._resolve(module_name)
+        key = ResponseCache.make_key(
+            module_name,
+            getattr(module, "generation_model", module_name),
+            messages,
+            kwargs
+        )
 
-    async def stream_text(self, messages: List[Dict], **kwargs) -> AsyncGenerator[str, None]:
-        async for chunk in self.get_active_module().stream(messages, **kwargs):
-            yield chunk
+        async def generate():
+            if self.router is not None:
+                return await self.router.generate(module_name, lambda adapter: self._timed_generate(adapter, messages, session_id, **kwargs))
+            return await self._timed_generate(module, messages, session_id, **kwargs)
 
-    async def embed(self, text: str) -> List[float]:
-        return await self.get_active_module().embed([text])
+        return await self.response_cache.get_or_generate(key, generate, mode=cache)
+
+    async def _timed_generate(self, module: LLMAdapter, messages: List[Dict], session_id: Optional[str], **kwargs) -> str:
+        with LLM_GENERATE_SECONDS.labels(module.id).time():
+            return await module.generate(messages, session_id=session_id, **kwargs)
+
+    async def stream_text(self, messages: List[Dict], session_id: Optional[str] = None,
+                          module_name: Optional[str] = None, **kwargs) -> AsyncGenerator[str, None]:
+        module_name, module = self._resolve(module_name)
+        if self.router is not None:
+            stream = self.router.stream(module_name, lambda adapter: adapter.stream(messages, session_id=session_id, **kwargs))
+        else:
+            stream = module.stream(messages, session_id=session_id, **kwargs)
+        # aclosing propagates an early close (e.g. client disconnect) down to the adapter
+        async with aclosing(stream) as chunks:
+            async for chunk in chunks:
+                yield chunk
+
+    def invalidate_session(self, session_id: str):
+        """
+        Tells every instantiated adapter to drop its cached state for a session.
+        """
+        for instance in self._instances.values():
+            instance.invalidate_session(session_id)
+
+    async def aclose(self):
+        """
+        Closes connection pools held by instantiated adapters.
+        """
+        for instance in self._instances.values():
+            await instance.aclose()
+
+    async def embed(self, text: str, module_name: Optional[str] = None) -> List[float]:
+        """
+        Embeds one text. Cached vectors skip the upstream; other concurrent calls
+        are batched into shared upstream requests. Always returns a plain list the
+        caller owns: the cache hands out read-only views into its mapped file,
+        which are only valid until the cache is compacted.
+        """
+        module = self.get_module(module_name)
+        if module.embedding_cache is not None:
+            vector = module.embedding_cache.get(text, count_miss=False)
+            if vector is not None:
+                return vector.tolist()
+        vector = await self.embedding_dispatcher.embed(module, text)
+        return vector.tolist() if isinstance(vector, np.ndarray) else list(vector)
+
+    async def embed_many(self, texts: List[str], module_name: Optional[str] = None) -> List[List[float]]:
+        """
+        Embeds several texts through the same batching as embed().
+        """
+        return list(await asyncio.gather(*(self.embed(text, module_name) for text in texts)))
 
 # Global instance will be created in main.py
\ No newline at end of file
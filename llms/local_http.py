@@ -0,0 +1,192 @@
+# llms/local_http.py
+
+import json
+import logging
+import time
+from typing import List, Dict, AsyncGenerator, AsyncIterator, Optional
+from urllib.parse import urljoin
+
+import httpx
+
+from llms.base import LLMAdapter
+from llms.context_builder import estimate_tokens
+
+try:
+    import orjson
+    _loads = orjson.loads  # accepts memoryview, so SSE payloads are parsed without copying
+except ImportError:
+    orjson = None
+    _loads = lambda data: json.loads(bytes(data))
+
+# Defaults; override any of them under "llm": {"modules": {"local_http": {...}}} in config.json
+module_config = {
+    "name": "Local HTTP (OpenAI-compatible)",
+    "requires_api_key": False,
+    "base_url": "http://127.0.0.1:8080/v1",
+    # llama.cpp's /tokenize endpoint; None derives it from base_url's host, "" disables it.
+    # count_tokens falls back to a local estimate without it.
+    "tokenize_url": None,
+    # After a transient tokenize failure, estimate locally for this long before retrying
+    "tokenize_retry_seconds": 30.0,
+    "generation_model": "local-model",
+    "embedding_model": "local-embedding",
+    "context_window": 8192,
+    "connect_timeout": 2.0,
+    "read_timeout": 120.0,
+    "write_timeout": 10.0,
+    "pool_timeout": 10.0,
+    "max_connections": 64,
+    "max_keepalive_connections": 32,
+    "keepalive_expiry": 120.0,
+}
+
+async def iter_sse_data(chunks: AsyncIterator[bytes]) -> AsyncGenerator[object, None]:
+    """
+    Yields the decoded JSON payload of each `data:` line of a server-sent event stream.
+    Lines are located in one growing bytearray and parsed through memoryview slices,
+    so chunk payloads are not copied into intermediate strings. Stops at `data: [DONE]`.
+    """
+    buffer = bytearray()
+    async for chunk in chunks:
+        buffer += chunk
+        start = 0
+        events = []
+        done = False
+        while True:
+            end = buffer.find(b"\n", start)
+            if end == -1:
+                break
+            if buffer.startswith(b"data:", start, end):
+                payload_start = start + 5
+                if payload_start < end and buffer[payload_start] == 0x20:
+                    payload_start += 1
+                payload_end = end - 1 if end > payload_start and buffer[end - 1] == 0x0D else end
+                if buffer.startswith(b"[DONE]", payload_start, payload_end):
+                    done = True
+                    break
+                with memoryview(buffer) as view:
+                    events.append(_loads(view[payload_start:payload_end]))
+            start = end + 1
+        del buffer[:start]
+        for event in events:
+            yield event
+        if done:
+            return
+
+class LocalHttpAdapter(LLMAdapter):
+    """
+    Adapter for a local OpenAI-compatible server (llama.cpp, vLLM, Ollama, LM Studio).
+    One long-lived httpx.AsyncClient keeps pooled keep-alive connections, so a
+    request does not pay for a new TCP connection.
+    """
+
+    def __init__(self, api_key: Optional[str] = None, settings: Optional[Dict] = None):
+        self.id = "local_http"
+        self.name = "Local HTTP"
+        settings = {**module_config, **(settings or {})}
+        self.base_url = settings["base_url"].rstrip("/")
+        tokenize_url = settings.get("tokenize_url")
+        self.tokenize_url = urljoin(self.base_url, "/tokenize") if tokenize_url is None else tokenize_url or None
+        self.tokenize_retry_seconds = settings["tokenize_retry_seconds"]
+        self._tokenize_retry_at = 0.0
+        self.generation_model = settings["generation_model"]
+        self.embedding_model = settings["embedding_model"]
+        self.context_window = settings["context_window"]
+
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers=headers,
+            timeout=httpx.Timeout(
+                connect=settings["connect_timeout"],
+                read=settings["read_timeout"],
+                write=settings["write_timeout"],
+                pool=settings["pool_timeout"],
+            ),
+            limits=httpx.Limits(
+                max_connections=settings["max_connections"],
+                max_keepalive_connections=settings["max_keepalive_connections"],
+                keepalive_expiry=settings["keepalive_expiry"],
+            ),
+        )
+
+    def _chat_body(self, messages: List[Dict], stream: bool, **kwargs) -> Dict:
+        body = {
+            "model": self.generation_model,
+            # History may carry Gemini's 'model' role from earlier turns
+            "messages": [
+                {"role": "assistant" if msg.get("role") == "model" else msg.get("role", "user"), "content": msg.get("content", "")}
+                for msg in messages
+            ],
+            "stream": stream,
+        }
+        for key in ("temperature", "max_tokens", "top_p", "stop"):
+            if kwargs.get(key) is not None:
+                body[key] = kwargs[key]
+        return body
+
+    async def generate(self, messages: List[Dict], **kwargs) -> str:
+        """
+        Generate a non-streaming text response from the local model.
+        """
+        response = await self.client.post("/chat/completions", json=self._chat_body(messages, False, **kwargs))
+        response.raise_for_status()
+        return _loads(response.content)["choices"][0]["message"]["content"] or ""
+
+    async def stream(self, messages: List[Dict], **kwargs) -> AsyncGenerator[str, None]:
+        """
+        Generate a streaming text response from the local model.
+        Closing the generator early closes the HTTP response, which stops generation server-side.
+        """
+        async with self.client.stream("POST", "/chat/completions", json=self._chat_body(messages, True, **kwargs)) as response:
+            response.raise_for_status()
+            async for event in iter_sse_data(response.aiter_raw()):
+                choices = event.get("choices")
+                if not choices:
+                    continue
+                content = choices[0].get("delta", {}).get("content")
+                if content:
+                    yield content
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """
+        Generate embeddings for a list of texts through the /embeddings endpoint.
+        """
+        async def fetch(batch: List[str]) -> List[List[float]]:
+            response = await self.client.post("/embeddings", json={"model": self.embedding_model, "input": batch})
+            response.raise_for_status()
+            data = sorted(_loads(response.content)["data"], key=lambda item: item.get("index", 0))
+            return [item["embedding"] for item in data]
+
+        return await self._embed_through_cache(texts, fetch)
+
+    async def count_tokens(self, texts: List[str]) -> int:
+        """
+        Count tokens with the server's tokenizer, or estimate locally if it has none.
+        A server without the endpoint (404/405) is not asked again; other failures
+        fall back to the estimate for tokenize_retry_seconds, then retry.
+        """
+        if self.tokenize_url and time.monotonic() >= self._tokenize_retry_at:
+            try:
+                total = 0
+                for text in texts:
+                    response = await self.client.post(self.tokenize_url, json={"content": text})
+                    response.raise_for_status()
+                    total += len(_loads(response.content)["tokens"])
+                return total
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code in (404, 405):
+                    logging.info(f"Server has no tokenize endpoint ({e}); using local token estimates.")
+                    self.tokenize_url = None
+                else:
+                    self._tokenize_backoff(e)
+            except (httpx.HTTPError, KeyError, ValueError) as e:
+                self._tokenize_backoff(e)
+        return sum(estimate_tokens(text) for text in texts)
+
+    def _tokenize_backoff(self, error: Exception):
+        logging.info(f"Tokenize request failed ({error}); using local token estimates for {self.tokenize_retry_seconds}s.")
+        self._tokenize_retry_at = time.monotonic() + self.tokenize_retry_seconds
+
+    async def aclose(self):
+        await self.client.aclose()
@@ -0,0 +1,122 @@
+# llms/response_cache.py
+
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional
+
+# Per-request cache modes accepted by ResponseCache.get_or_generate
+CACHE_MODES = ("bypass", "read", "write")
+
+class ResponseCache:
+    """
+    Exact-match cache for non-streaming LLM responses.
+    Entries are evicted LRU-first when either the entry or byte cap is hit,
+    and expire after a TTL. Concurrent misses for the same key are coalesced
+    into a single upstream call (single-flight).
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 32 * 1024 * 1024, ttl_seconds: float = 300.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (expires_at, size, response)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(module_name: str, model_name: str, messages: List[Dict], kwargs: Dict) -> str:
+        """
+        Hashes everything that determines the response. Messages are reduced to
+        role/content so storage metadata (timestamps, ids) does not split keys.
+        """
+        payload = {
+            "module": module_name,
+            "model": model_name,
+            "messages": [[msg.get("role"), (msg.get("content") or "").strip()] for msg in messages],
+            "kwargs": kwargs,
+        }
+        encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    async def get_or_generate(self, key: str, generate: Callable[[], Awaitable[str]], mode: str = "read") -> str:
+        """
+        Returns the response for key, calling generate() on a miss.
+        mode 'read' serves from the cache and stores misses, 'write' always
+        regenerates and overwrites the entry, 'bypass' leaves the cache untouched.
+        """
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode '{mode}'. Expected one of {CACHE_MODES}.")
+        if mode == "bypass":
+            return await generate()
+
+        if mode == "read":
+            cached = self._get(key)
+            if cached is not None:
+                self.hits += 1
+                return cached
+            inflight = self._inflight.get(key)
+            if inflight is not None:
+                self.coalesced += 1
+                return await asyncio.shield(inflight)
+
+        self.misses += 1
+        task = asyncio.ensure_future(generate())
+        self._inflight[key] = task
+        task.add_done_callback(lambda done: self._on_generated(key, done))
+        # Shielded so a cancelled caller does not cancel the call other waiters share
+        return await asyncio.shield(task)
+
+    def _on_generated(self, key: str, task: asyncio.Future):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled() and task.exception() is None:
+            self._put(key, task.result())
+
+    def _get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, _, response = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return response
+
+    def _put(self, key: str, response: str):
+        size = len(key) + len(response.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, size, response)
+        self.current_bytes += size
+        while len(self._entries) > self.max_entries or self.current_bytes > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        _, size, _ = self._entries.pop(key)
+        self.current_bytes -= size
+
+    def clear(self):
+        self._entries.clear()
+        self.current_bytes = 0
+
+    def stats(self) -> Dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+        }
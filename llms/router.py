@@ -0,0 +1,250 @@
+# llms/router.py
+
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import aclosing
+from typing import AsyncGenerator, Callable, Dict, List
+
+from llms.base import LLMAdapter
+from metrics.collectors import Counter, Histogram, InstanceMetric
+
+LLM_FIRST_TOKEN_SECONDS = Histogram("anyai_llm_first_token_seconds", "Time to the first streamed chunk (or full reply for generate) per LLM module.", ["module"])
+LLM_ERRORS = Counter("anyai_llm_errors_total", "Upstream LLM call failures per module.", ["module"])
+LLM_HEDGES = Counter("anyai_llm_hedges_total", "Hedged LLM requests by outcome.", ["outcome"])
+CIRCUIT_OPEN = InstanceMetric(
+    "anyai_llm_circuit_open", "1 while the module's circuit breaker is open.",
+    lambda router: {(name,): int(health.state == "open") for name, health in router.health.items()},
+    labelnames=["module"]
+)
+
+class AdapterHealth:
+    """
+    Latency and error tracking for one adapter, plus its circuit breaker.
+    The breaker opens after failure_threshold consecutive failures, or when the
+    error-rate EWMA passes error_rate_threshold; after open_seconds one probe
+    request is let through (half-open) and its outcome closes or reopens it.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, error_rate_threshold: float = 0.5,
+                 open_seconds: float = 30.0, samples: int = 200):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.error_rate_threshold = error_rate_threshold
+        self.open_seconds = open_seconds
+        self.latencies = deque(maxlen=samples)  # recent first-token latencies, seconds
+        self.latency_ewma = None
+        self.error_rate = 0.0  # EWMA over request outcomes, 1 = failure
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.open_seconds:
+            return "half_open"
+        return "open"
+
+    def available(self) -> bool:
+        state = self.state
+        return state == "closed" or (state == "half_open" and not self._probing)
+
+    def begin(self):
+        if self.state == "half_open":
+            self._probing = True
+
+    def record_success(self, first_token_seconds: float):
+        self.latencies.append(first_token_seconds)
+        self.latency_ewma = first_token_seconds if self.latency_ewma is None else 0.8 * self.latency_ewma + 0.2 * first_token_seconds
+        self.error_rate *= 0.9
+        self.consecutive_failures = 0
+        if self.opened_at is not None:
+            logging.info(f"Circuit for LLM module '{self.name}' closed.")
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.error_rate = 0.9 * self.error_rate + 0.1
+        self.consecutive_failures += 1
+        if self._probing or self.consecutive_failures >= self.failure_threshold or self.error_rate >= self.error_rate_threshold:
+            if self.state == "closed":
+                logging.warning(f"Circuit for LLM module '{self.name}' opened after {self.consecutive_failures} failures.")
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+    def release_probe(self):
+        # A probe that was cancelled (e.g. lost a hedge race) proves nothing either way
+        self._probing = False
+
+    def percentile(self, percentile: float):
+        if len(self.latencies) < 20:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))]
+
+    def stats(self) -> Dict:
+        return {
+            "state": self.state,
+            "latency_ewma_ms": round(self.latency_ewma * 1000, 1) if self.latency_ewma is not None else None,
+            "error_rate": round(self.error_rate, 3),
+            "consecutive_failures": self.consecutive_failures,
+            "samples": len(self.latencies),
+        }
+
+class _Attempt:
+    """
+    One adapter call racing for the first token.
+    """
+
+    def __init__(self, name: str, health: AdapterHealth, stream: AsyncGenerator[str, None]):
+        self.name = name
+        self.health = health
+        self.stream = stream
+        self.started = time.perf_counter()
+        self.task = asyncio.ensure_future(stream.__anext__())
+        health.begin()
+
+    async def cancel(self):
+        self.task.cancel()
+        await asyncio.gather(self.task, return_exceptions=True)
+        self.health.release_probe()
+        await self.stream.aclose()
+
+class LLMRouter:
+    """
+    Routes a request to the primary adapter and, if its first token is late,
+    hedges to the next healthy adapter; whichever streams first wins and the
+    other call is cancelled. The hedge delay is the primary's hedge_percentile
+    first-token latency, clamped to [hedge_min, hedge_max]. An adapter that
+    fails before its first token is failed over immediately. Adapters with an
+    open circuit are skipped; once committed to a stream, later errors propagate.
+    """
+
+    def __init__(self, get_adapter: Callable[[str], LLMAdapter], fallbacks: List[str],
+                 hedge_percentile: float = 95, hedge_min: float = 0.25, hedge_max: float = 5.0,
+                 max_attempts: int = 2, failure_threshold: int = 5, error_rate_threshold: float = 0.5,
+                 open_seconds: float = 30.0):
+        self._get_adapter = get_adapter
+        self.fallbacks = fallbacks
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min = hedge_min
+        self.hedge_max = hedge_max
+        self.max_attempts = max_attempts
+        self._health_args = (failure_threshold, error_rate_threshold, open_seconds)
+        self.health: Dict[str, AdapterHealth] = {}
+        CIRCUIT_OPEN.track(self)
+
+    def _health(self, name: str) -> AdapterHealth:
+        health = self.health.get(name)
+        if health is None:
+            health = self.health[name] = AdapterHealth(name, *self._health_args)
+        return health
+
+    def candidates(self, primary: str) -> List[str]:
+        """
+        Adapters to try, in order: healthy ones first, then the primary as a last resort.
+        """
+        names = [primary] + [name for name in self.fallbacks if name != primary]
+        healthy = [name for name in names if self._health(name).available()]
+        return healthy or [primary]
+
+    def hedge_delay(self, name: str) -> float:
+        observed = self._health(name).percentile(self.hedge_percentile)
+        if observed is None:
+            return self.hedge_max
+        return min(max(observed, self.hedge_min), self.hedge_max)
+
+    def _start(self, name: str, call: Callable[[LLMAdapter], AsyncGenerator[str, None]]):
+        try:
+            return _Attempt(name, self._health(name), call(self._get_adapter(name)))
+        except Exception as e:
+            # Could not even create the adapter (e.g. missing API key)
+            logging.warning(f"LLM module '{name}' unavailable for routing: {e}")
+            self._health(name).record_failure()
+            LLM_ERRORS.labels(name).inc()
+            return None
+
+    async def stream(self, primary: str, call: Callable[[LLMAdapter], AsyncGenerator[str, None]]) -> AsyncGenerator[str, None]:
+        """
+        Streams from whichever adapter produces a first chunk first.
+        call(adapter) must return that adapter's chunk generator.
+        """
+        queue = deque(self.candidates(primary)[:self.max_attempts])
+        attempts: List[_Attempt] = []
+        winner = None
+        first_chunk = None
+        last_error = None
+        hedged = False
+        try:
+            while winner is None:
+                while not attempts and queue:
+                    attempt = self._start(queue.popleft(), call)
+                    if attempt is not None:
+                        attempts.append(attempt)
+                if not attempts:
+                    raise last_error or RuntimeError("No LLM module available.")
+                timeout = self.hedge_delay(attempts[0].name) if queue and len(attempts) == 1 else None
+                done, _ = await asyncio.wait([a.task for a in attempts], timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    LLM_HEDGES.labels("fired").inc()
+                    attempt = self._start(queue.popleft(), call)
+                    if attempt is not None:
+                        attempts.append(attempt)
+                    continue
+                for attempt in [a for a in attempts if a.task in done]:
+                    attempts.remove(attempt)
+                    error = attempt.task.exception()
+                    if error is None:
+                        winner, first_chunk = attempt, attempt.task.result()
+                        break
+                    if not isinstance(error, StopAsyncIteration):
+                        last_error = error
+                        logging.warning(f"LLM module '{attempt.name}' failed before its first token: {error}")
+                        attempt.health.record_failure()
+                        LLM_ERRORS.labels(attempt.name).inc()
+                    else:
+                        # An empty reply still counts as a finished call
+                        winner, first_chunk = attempt, None
+                        break
+                    await attempt.stream.aclose()
+        finally:
+            # Losers, or everything if we were cancelled while racing
+            for attempt in attempts:
+                await attempt.cancel()
+            if winner is not None and hedged:
+                LLM_HEDGES.labels("won_by_primary" if winner.name == primary else "won_by_hedge").inc()
+
+        elapsed = time.perf_counter() - winner.started
+        winner.health.record_success(elapsed)
+        LLM_FIRST_TOKEN_SECONDS.labels(winner.name).observe(elapsed)
+        if first_chunk is None:
+            await winner.stream.aclose()
+            return
+        async with aclosing(winner.stream) as stream:
+            yield first_chunk
+            try:
+                async for chunk in stream:
+                    yield chunk
+            except Exception:
+                LLM_ERRORS.labels(winner.name).inc()
+                winner.health.record_failure()
+                raise
+
+    async def generate(self, primary: str, call: Callable[[LLMAdapter], "asyncio.Future"]) -> str:
+        """
+        Hedged non-streaming call: the whole reply plays the part of the first token.
+        """
+        async def as_stream(adapter: LLMAdapter):
+            yield await call(adapter)
+
+        async with aclosing(self.stream(primary, as_stream)) as replies:
+            async for reply in replies:
+                return reply
+        return ""
+
+    def stats(self) -> Dict:
+        return {name: health.stats() for name, health in self.health.items()}
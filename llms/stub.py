@@ -0,0 +1,203 @@
+# llms/stub.py
+
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import time
+from itertools import cycle
+from typing import List, Dict, AsyncGenerator, Optional
+
+import numpy as np
+
+from llms.base import LLMAdapter
+from llms.context_builder import estimate_tokens
+
+# Defaults; override any of them under "llm": {"modules": {"stub": {...}}} in config.json
+module_config = {
+    "name": "Stub (offline load testing)",
+    "requires_api_key": False,
+    "generation_model": "stub-model",
+    "embedding_model": "stub-embedding",
+    "context_window": 32768,
+    # Timing model: first chunk after ttft_ms, then tokens_per_second
+    "ttft_ms": 300.0,
+    "tokens_per_second": 60.0,
+    "chunk_tokens": 4,
+    # none, uniform, normal or lognormal; jitter scales every delay by a random factor
+    "jitter": "lognormal",
+    "jitter_amount": 0.25,
+    # Reply length in tokens, capped by a request's max_tokens
+    "min_output_tokens": 32,
+    "max_output_tokens": 128,
+    # Error injection: before the first chunk, and part way through a stream
+    "error_rate": 0.0,
+    "stream_error_rate": 0.0,
+    # JSONL of recorded replies to replay instead of generated text (see StubAdapter)
+    "transcript_path": None,
+    "embedding_dim": 768,
+    "embed_latency_ms": 0.0,
+    # Seeds reply text, timing and errors so runs are reproducible
+    "seed": 0,
+}
+
+_WORDS = (
+    "the model answer context memory session token stream latency request value "
+    "system cache result query window history signal vector time data service "
+    "and of to in is for that with on as it by this be are from at or an"
+).split()
+
+class StubAdapterError(RuntimeError):
+    """
+    An injected failure, standing in for an upstream API error.
+    """
+
+class StubAdapter(LLMAdapter):
+    """
+    Emulates a remote model without any network: replies arrive after a configurable
+    time-to-first-token and stream at a configurable rate, with jitter and injected
+    errors. Reply text depends only on the messages and the seed, and embeddings are
+    deterministic unit vectors, so runs can be compared against each other.
+
+    transcript_path replays recorded replies. Each JSONL line is an object with
+    "response" (a string) or "chunks" (a list of strings), optionally "delays_ms"
+    (the wait before each chunk, as recorded) and "prompt" (the last user message it
+    answers). A record whose prompt matches is used; otherwise records are cycled.
+    """
+
+    def __init__(self, api_key: Optional[str] = None, settings: Optional[Dict] = None):
+        self.id = "stub"
+        self.name = "Stub"
+        settings = {**module_config, **(settings or {})}
+        self.generation_model = settings["generation_model"]
+        self.embedding_model = settings["embedding_model"]
+        self.context_window = settings["context_window"]
+        self.ttft = settings["ttft_ms"] / 1000
+        self.tokens_per_second = settings["tokens_per_second"]
+        self.chunk_tokens = max(1, int(settings["chunk_tokens"]))
+        self.jitter = settings["jitter"]
+        self.jitter_amount = settings["jitter_amount"]
+        self.min_output_tokens = settings["min_output_tokens"]
+        self.max_output_tokens = max(settings["max_output_tokens"], self.min_output_tokens)
+        self.error_rate = settings["error_rate"]
+        self.stream_error_rate = settings["stream_error_rate"]
+        self.embedding_dim = settings["embedding_dim"]
+        self.embed_latency = settings["embed_latency_ms"] / 1000
+        self.seed = settings["seed"]
+        # Timing and error draws come from one seeded sequence shared by all requests
+        self._rng = random.Random(self.seed)
+
+        self._transcripts = []
+        self._by_prompt = {}
+        if settings["transcript_path"]:
+            self._load_transcripts(settings["transcript_path"])
+        self._next_transcript = cycle(self._transcripts) if self._transcripts else None
+
+    def _load_transcripts(self, path: str):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                chunks = record.get("chunks") or [record.get("response", "")]
+                delays = record.get("delays_ms")
+                entry = (chunks, [d / 1000 for d in delays] if delays and len(delays) == len(chunks) else None)
+                self._transcripts.append(entry)
+                if record.get("prompt") is not None:
+                    self._by_prompt.setdefault(record["prompt"], entry)
+        logging.info(f"Stub adapter loaded {len(self._transcripts)} transcript records from {path}")
+
+    def _jittered(self, seconds: float) -> float:
+        if seconds <= 0 or self.jitter == "none" or not self.jitter_amount:
+            return seconds
+        if self.jitter == "uniform":
+            factor = self._rng.uniform(1 - self.jitter_amount, 1 + self.jitter_amount)
+        elif self.jitter == "normal":
+            factor = self._rng.gauss(1.0, self.jitter_amount)
+        elif self.jitter == "lognormal":
+            # Median 1, long right tail, like real provider latencies
+            factor = self._rng.lognormvariate(0.0, self.jitter_amount)
+        else:
+            raise ValueError(f"Unknown stub jitter distribution '{self.jitter}'.")
+        return max(0.0, seconds * factor)
+
+    def _plan(self, messages: List[Dict], max_tokens: Optional[int]):
+        """
+        Returns (chunks, delays, recorded): the reply split into stream chunks, the wait
+        before each, and whether the delays were recorded (and so are replayed without jitter).
+        """
+        prompt = next((msg.get("content", "") for msg in reversed(messages) if msg.get("role") == "user"), "")
+        if self._next_transcript is not None:
+            chunks, delays = self._by_prompt.get(prompt) or next(self._next_transcript)
+            if delays is not None:
+                return chunks, delays, True
+        else:
+            digest = hashlib.sha256(json.dumps([self.seed, messages], sort_keys=True, default=str).encode("utf-8")).digest()
+            text_rng = random.Random(digest)
+            count = text_rng.randint(self.min_output_tokens, self.max_output_tokens)
+            if max_tokens:
+                count = min(count, max_tokens)
+            words = [text_rng.choice(_WORDS) for _ in range(count)]
+            chunks = [" ".join(words[i:i + self.chunk_tokens]) + " " for i in range(0, count, self.chunk_tokens)]
+        per_token = 1 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+        delays = [self.ttft] + [per_token * max(1, estimate_tokens(chunk)) for chunk in chunks[1:]]
+        return chunks, delays, False
+
+    def _delay(self, seconds: float, recorded: bool) -> float:
+        return seconds if recorded else self._jittered(seconds)
+
+    def _maybe_fail(self, rate: float, where: str):
+        if rate and self._rng.random() < rate:
+            raise StubAdapterError(f"Injected stub failure {where}.")
+
+    async def generate(self, messages: List[Dict], **kwargs) -> str:
+        """
+        Returns the whole reply after the time the equivalent stream would have taken.
+        """
+        chunks, delays, recorded = self._plan(messages, kwargs.get("max_tokens"))
+        await asyncio.sleep(self._delay(delays[0], recorded) if delays else 0)
+        self._maybe_fail(self.error_rate, "before the reply")
+        await asyncio.sleep(self._delay(sum(delays[1:]), recorded))
+        return "".join(chunks)
+
+    async def stream(self, messages: List[Dict], **kwargs) -> AsyncGenerator[str, None]:
+        """
+        Streams the reply chunk by chunk. Delays are measured against a running deadline,
+        so time spent by the consumer between chunks does not slow the emulated model.
+        """
+        chunks, delays, recorded = self._plan(messages, kwargs.get("max_tokens"))
+        fail_at = None
+        if self.stream_error_rate and self._rng.random() < self.stream_error_rate and len(chunks) > 1:
+            fail_at = self._rng.randrange(1, len(chunks))
+        deadline = time.monotonic()
+        for index, (chunk, delay) in enumerate(zip(chunks, delays)):
+            deadline += self._delay(delay, recorded)
+            await asyncio.sleep(max(0.0, deadline - time.monotonic()))
+            if index == 0:
+                self._maybe_fail(self.error_rate, "before the first chunk")
+            if index == fail_at:
+                raise StubAdapterError(f"Injected stub failure after {index} chunks.")
+            yield chunk
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """
+        Returns a unit vector per text, seeded from the text, so equal texts always embed equally.
+        """
+        async def fetch(batch: List[str]) -> List[List[float]]:
+            if self.embed_latency:
+                await asyncio.sleep(self._jittered(self.embed_latency))
+            vectors = []
+            for text in batch:
+                seed = int.from_bytes(hashlib.sha256(f"{self.seed}:{text}".encode("utf-8")).digest()[:8], "little")
+                vector = np.random.default_rng(seed).standard_normal(self.embedding_dim).astype(np.float32)
+                vectors.append((vector / np.linalg.norm(vector)).tolist())
+            return vectors
+
+        return await self._embed_through_cache(texts, fetch)
+
+    async def count_tokens(self, texts: List[str]) -> int:
+        """
+        Local estimate only; no tokenizer round trip.
+        """
+        return sum(estimate_tokens(text) for text in texts)
@@ -2,18 +2,42 @@
 
 import uvicorn
 import asyncio
-from typing import AsyncGenerator
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import StreamingResponse
+import anyio
+import logging
+import time
+from contextlib import asynccontextmanager, aclosing
+from typing import AsyncGenerator, Awaitable, Callable, Literal, Optional
+from fastapi import FastAPI, HTTPException, Request, WebSocket
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse, Response
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 from llms.llm_manager import LLMManager
+from llms.context_builder import ContextBuilder, ContextWindow
 from config.manager import ConfigManager
 from memory.memory_manager import MemoryManager # Import MemoryManager
+from server.streaming import StreamStats, StreamTimer, mark_partial
+from server.ws import ChatSocket
+from server.admission import AdmissionController, AdmissionRejected, AdmissionTicket
+from server.instrumentation import MetricsMiddleware, record_error
+from metrics.collectors import REGISTRY
 
 # Initialize managers
 config_manager = ConfigManager()
 memory_manager = MemoryManager(config_manager=config_manager) # Instantiate MemoryManager
 llm_manager = LLMManager(config_manager=config_manager)
+stream_stats = StreamStats()
+context_builder = ContextBuilder(
+    max_prompt_tokens=config_manager.get_setting("llm", "max_prompt_tokens"),
+    reserve_tokens=config_manager.get_setting("llm", "context_reserve_tokens", 256)
+)
+admission = AdmissionController(
+    max_inflight=config_manager.get_setting("admission", "max_inflight", 32),
+    max_queue=config_manager.get_setting("admission", "max_queue", 128),
+    queue_timeout=config_manager.get_setting("admission", "queue_timeout_seconds", 10.0),
+    session_rate=config_manager.get_setting("admission", "session_rate_per_second", 1.0),
+    session_burst=config_manager.get_setting("admission", "session_burst", 5)
+)
 
 # Pydantic model for incoming chat messages
 class QueryRequest(BaseModel):
@@ -21,86 +45,343 @@ class QueryRequest(BaseModel):
     session_id: str
     max_tokens: int = 4096
     temperature: float = 0.7
+    # Response cache mode for /query: read-through, force regenerate, or skip
+    cache: Literal["bypass", "read", "write"] = "read"
+    # Per-request module choice; defaults to the globally selected modules
+    model: Optional[str] = None
+    memory_module: Optional[str] = None
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await memory_manager.start()
+    yield
+    await memory_manager.aclose()
+    await llm_manager.aclose()
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
 
 @app.get("/")
 async def root():
     return {"message": "Welcome to AryAI's backend! Visit /docs for the API documentation."}
 
-@app.post("/stream")
-async def handle_stream(request: QueryRequest):
+async def admit(session_id: str) -> AdmissionTicket:
     """
-    Handles streaming chat requests.
+    Waits for an admission slot, turning a rejection into 429/503 with Retry-After.
     """
-    # Use the memory manager to get the full conversation history
-    memory_manager.add_message(role="user", content=request.query, session_id=request.session_id)
-    messages = memory_manager.get_messages(session_id=request.session_id)
+    try:
+        return await admission.acquire(session_id)
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers={"Retry-After": str(e.retry_after)})
+
+async def prepare_turn(request: QueryRequest) -> ContextWindow:
+    """
+    Stores the user's message and fits the session history to the prompt budget.
+    """
+    try:
+        adapter = llm_manager.get_module(request.model)
+        memory_manager.get_module(request.memory_module)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    await memory_manager.add_message_async(role="user", content=request.query, session_id=request.session_id, module_name=request.memory_module)
+    # Only the tail that could possibly fit the prompt is read, however long the session is
+    history = await memory_manager.get_messages_page_async(
+        session_id=request.session_id, module_name=request.memory_module,
+        limit=config_manager.get_setting("memory", "history_tail_messages", 1000),
+        max_bytes=context_builder.history_byte_budget(adapter, request.max_tokens)
+    )
+    # Fit the history to the model's prompt budget instead of sending all of it
+    return await context_builder.build(history, adapter, request.max_tokens)
 
-    # Get additional keyword arguments from the request
+async def stream_turn(request: QueryRequest, window: ContextWindow,
+                      is_disconnected: Callable[[], Awaitable[bool]] = None,
+                      arrived: Optional[float] = None) -> AsyncGenerator[str, None]:
+    """
+    Streams the assistant reply for a prepared turn and saves it to memory.
+    If the consumer goes away (is_disconnected, cancellation or an early close),
+    the upstream generation is closed and a marked partial reply is saved instead.
+    arrived is the time.perf_counter() reading when the request came in, for TTFT.
+    """
     kwargs = {
         "temperature": request.temperature,
         "max_tokens": request.max_tokens
     }
+    full_response = ""
+    stopped = False
+    timer = StreamTimer(arrived)
+    upstream = llm_manager.stream_text(messages=window.messages, session_id=request.session_id, module_name=request.model, **kwargs)
+    try:
+        async for chunk in upstream:
+            if is_disconnected is not None and await is_disconnected():
+                stopped = True
+                break
+            timer.on_chunk()
+            full_response += chunk
+            yield chunk
+    except (asyncio.CancelledError, GeneratorExit):
+        # Starlette cancels the response task when the client goes away
+        stopped = True
+        raise
+    except Exception as e:
+        record_error(e)
+        raise
+    finally:
+        # Shielded: the surrounding scope may already be cancelled by the disconnect
+        with anyio.CancelScope(shield=True):
+            await upstream.aclose()
+            timer.finish(full_response)
+            if stopped:
+                stream_stats.record_aborted(full_response, request.max_tokens)
+                full_response = mark_partial(full_response)
+            else:
+                stream_stats.record_completed()
+            # Add the AI response to memory, marked if it was cut short
+            await memory_manager.add_message_async(role="assistant", content=full_response, session_id=request.session_id, module_name=request.memory_module)
+
+@app.post("/stream")
+async def handle_stream(request: QueryRequest, http_request: Request):
+    """
+    Handles streaming chat requests.
+    Stops the upstream generation as soon as the client disconnects.
+    """
+    arrived = time.perf_counter()
+    ticket = await admit(request.session_id)
+    try:
+        window = await prepare_turn(request)
+    except Exception:
+        ticket.release()
+        raise
 
     async def stream_response_generator() -> AsyncGenerator[str, None]:
-        full_response = ""
         try:
-            # Directly use the manager's stream method
-            async for chunk in llm_manager.stream_text(messages=messages, **kwargs):
-                full_response += chunk
-                yield chunk
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"LLM streaming error: {e}")
+            async with aclosing(stream_turn(request, window, http_request.is_disconnected, arrived)) as chunks:
+                try:
+                    async for chunk in chunks:
+                        yield chunk
+                except Exception as e:
+                    # The 200 and headers are already sent, so an HTTPException would only be turned
+                    # into a second error by Starlette; end the body early. stream_turn counted it.
+                    logging.error(f"LLM streaming error for session '{request.session_id}': {e}")
         finally:
-            # Add the complete AI response to memory
-            memory_manager.add_message(role="assistant", content=full_response, session_id=request.session_id)
+            ticket.release()
+
+    headers = {
+        "X-Context-Prompt-Tokens": str(window.prompt_tokens),
+        "X-Context-Trimmed-Tokens": str(window.trimmed_tokens),
+    }
+    # The background task covers responses whose body never started streaming
+    return StreamingResponse(stream_response_generator(), media_type="text/event-stream", headers=headers,
+                             background=BackgroundTask(ticket.release))
+
+@app.websocket("/ws")
+async def handle_websocket(websocket: WebSocket):
+    """
+    Persistent chat connection: queries, streamed chunks, end-of-turn metadata,
+    history deltas and cancellation for any number of sessions over one socket.
+    See server/ws.py for the frame protocol.
+    """
+    await websocket.accept()
+
+    async def run_turn(frame, emit, is_cancelled):
+        arrived = time.perf_counter()
+        request = QueryRequest(**{key: value for key, value in frame.items() if key in QueryRequest.model_fields})
+        try:
+            ticket = await admission.acquire(request.session_id)
+        except AdmissionRejected as e:
+            await emit({"type": "error", "id": frame["id"], "status": e.status_code, "detail": e.detail, "retry_after": e.retry_after})
+            return
+        async with ticket:
+            await stream_ws_turn(request, frame["id"], emit, is_cancelled, arrived)
+
+    async def stream_ws_turn(request, turn_id, emit, is_cancelled, arrived):
+        window = await prepare_turn(request)
+        full_response = ""
+        stopped = False
+        try:
+            async with aclosing(stream_turn(request, window, arrived=arrived)) as chunks:
+                async for chunk in chunks:
+                    full_response += chunk
+                    await emit({"type": "chunk", "id": turn_id, "data": chunk})
+        except asyncio.CancelledError:
+            # A cancel frame cancels this task; stream_turn has saved the partial reply.
+            # Anything else (the socket closing) keeps propagating.
+            if not await is_cancelled():
+                raise
+            asyncio.current_task().uncancel()
+            stopped = True
+        if stopped:
+            full_response = mark_partial(full_response)
+        await emit({"type": "end", "id": turn_id, "stopped": stopped, "context": window.report()})
+        await emit({
+            "type": "history_delta",
+            "id": turn_id,
+            "session_id": request.session_id,
+            "messages": [
+                {"role": "user", "content": request.query},
+                {"role": "assistant", "content": full_response},
+            ],
+        })
+
+    await ChatSocket(
+        websocket, run_turn,
+        lambda session_id, memory_module: memory_manager.get_messages_async(session_id, module_name=memory_module),
+        send_queue_size=config_manager.get_setting("server", "ws_send_queue", 64),
+        max_turns=config_manager.get_setting("server", "ws_max_concurrent_queries", 8)
+    ).serve()
+
+@app.get("/admission/stats")
+async def get_admission_stats():
+    """
+    Returns in-flight and queued chat turns as seen by admission control.
+    """
+    return {"stats": admission.stats()}
 
-    return StreamingResponse(stream_response_generator(), media_type="text/event-stream")
+@app.get("/stream/stats")
+async def get_stream_stats():
+    """
+    Returns completed/aborted stream counters and the tokens saved by aborting.
+    """
+    return {"stats": stream_stats.stats()}
 
 @app.post("/query")
 async def handle_query(request: QueryRequest):
     """
     Handles non-streaming chat requests.
     """
-    memory_manager.add_message(role="user", content=request.query, session_id=request.session_id)
-
     kwargs = {
         "temperature": request.temperature,
         "max_tokens": request.max_tokens
     }
 
+    async with await admit(request.session_id):
+        try:
+            window = await prepare_turn(request)
+            response_content = await llm_manager.generate_text(
+                messages=window.messages, cache=request.cache, session_id=request.session_id,
+                module_name=request.model, **kwargs
+            )
+            await memory_manager.add_message_async(
+                role="assistant", content=response_content, session_id=request.session_id, module_name=request.memory_module
+            )
+            return {"response": response_content, "context": window.report()}
+        except HTTPException:
+            raise
+        except Exception as e:
+            record_error(e)
+            raise HTTPException(status_code=500, detail=f"LLM generation error: {e}")
+
+def memory_module_for(name: Optional[str]) -> Optional[str]:
+    """
+    Validates a per-request memory module name (None = the active module).
+    """
     try:
-        # Directly use the manager's generate method
-        messages = memory_manager.get_messages(session_id=request.session_id)
-        response_content = await llm_manager.generate_text(messages=messages, **kwargs)
-        memory_manager.add_message(role="assistant", content=response_content, session_id=request.session_id)
-        return {"response": response_content}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"LLM generation error: {e}")
+        memory_manager.get_module(name)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return name
+
+async def conditional_memory_response(http_request: Request, session_id: str, module_name: Optional[str],
+                                      render: Callable[[], Awaitable[dict]]) -> Response:
+    """
+    Answers with 304 when the client's If-None-Match still matches the session's
+    history version, so unchanged history is neither read nor sent again.
+    The body goes through jsonable_encoder like a returned dict would (e.g. utm_anyai's datetimes).
+    """
+    version = await memory_manager.get_version_async(session_id, module_name=module_name)
+    if version is None:
+        return JSONResponse(jsonable_encoder(await render()))
+    etag = f'"{version}"'
+    if_none_match = http_request.headers.get("if-none-match", "")
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in candidates or "*" in candidates:
+        return Response(status_code=304, headers=headers)
+    # Read after the version: if the history changes in between, the next request just gets a 200
+    return JSONResponse(jsonable_encoder(await render()), headers=headers)
 
 @app.get("/memory/history")
-async def get_memory_history(session_id: str = "default"):
+async def get_memory_history(http_request: Request, session_id: str = "default", memory_module: Optional[str] = None,
+                             limit: Optional[int] = None, max_bytes: Optional[int] = None,
+                             before_id: Optional[int] = None, after_id: Optional[int] = None):
     """
-    Retrieves the full conversation history from memory.
+    Retrieves the conversation history from memory: all of it by default, or the newest
+    messages (limit, max_bytes), or a keyset page next to a message id (before_id, after_id).
+    Supports If-None-Match against the ETag of the previous response.
     """
-    return {"history": memory_manager.get_messages(session_id)}
+    module_name = memory_module_for(memory_module)
+    paged = any(value is not None for value in (limit, max_bytes, before_id, after_id))
+
+    async def render():
+        if not paged:
+            return {"history": await memory_manager.get_messages_async(session_id, module_name=module_name)}
+        try:
+            history = await memory_manager.get_messages_page_async(
+                session_id, module_name=module_name, limit=limit, max_bytes=max_bytes, before_id=before_id, after_id=after_id
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return {"history": history}
+
+    return await conditional_memory_response(http_request, session_id, module_name, render)
 
 @app.get("/memory/context_string")
-async def get_memory_context_string(session_id: str = "default"):
+async def get_memory_context_string(http_request: Request, session_id: str = "default", memory_module: Optional[str] = None):
     """
     Retrieves the conversation history as a single formatted string from memory.
+    Supports If-None-Match against the ETag of the previous response.
     """
-    return {"context_string": memory_manager.get_context_string(session_id)}
+    module_name = memory_module_for(memory_module)
+
+    async def render():
+        return {"context_string": await memory_manager.get_context_string_async(session_id, module_name=module_name)}
+
+    return await conditional_memory_response(http_request, session_id, module_name, render)
 
 @app.post("/memory/clear")
-async def clear_memory(session_id: str = "default"):
+async def clear_memory(session_id: str = "default", memory_module: Optional[str] = None):
     """
     Clears the entire conversation history from memory.
     """
-    memory_manager.clear(session_id)
+    module_name = memory_module_for(memory_module)
+    await memory_manager.clear_async(session_id, module_name=module_name)
+    llm_manager.invalidate_session(session_id)
     return {"message": f"Memory for session '{session_id}' has been cleared."}
 
+@app.get("/memory/stats")
+async def get_memory_stats(memory_module: Optional[str] = None):
+    """
+    Returns resident bytes, session counts and eviction counters for memory modules that track them,
+    plus the write-behind queue's depth and failures when it is enabled.
+    """
+    module = memory_manager.get_module(memory_module_for(memory_module))
+    response = {"module": module.id, "stats": module.stats() if hasattr(module, "stats") else {}}
+    if memory_manager.write_behind is not None:
+        response["write_behind"] = memory_manager.write_behind.stats()
+    return response
+
+@app.get("/llm/cache/stats")
+async def get_llm_cache_stats():
+    """
+    Returns hit/miss/coalesced counters for the /query response cache.
+    """
+    return {"stats": llm_manager.response_cache.stats()}
+
+@app.get("/llm/routing/stats")
+async def get_llm_routing_stats():
+    """
+    Returns per-module latency, error rate and circuit state when hedged routing is enabled.
+    """
+    router = llm_manager.router
+    return {"enabled": router is not None, "stats": router.stats() if router is not None else {}}
+
+@app.get("/llm/embeddings/stats")
+async def get_embedding_cache_stats():
+    """
+    Returns entries and hit rate of the persistent embedding cache, per embedding model.
+    """
+    cache = llm_manager.embedding_cache
+    return {"stats": cache.stats() if cache is not None else {}}
+
 @app.get("/config/llm/modules")
 async def get_llm_modules():
     """
@@ -144,6 +425,13 @@ async def select_memory_module(module_name: str):
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
 
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Exposes latency histograms, counters and gauges in the Prometheus text format.
+    """
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.get("/ping")
 async def ping():
     """
@@ -1,7 +1,26 @@
 # memory/base.py
 
 from abc import ABC, abstractmethod
-from typing import List, Dict
+from typing import List, Dict, Optional
+
+def tail_messages(messages: List[Dict], limit: Optional[int] = None, max_bytes: Optional[int] = None) -> List[Dict]:
+    """
+    Returns the newest messages: at most limit of them, and only as many as fit in
+    max_bytes of UTF-8 content. The newest message is always included.
+    """
+    if limit is not None:
+        messages = messages[-limit:] if limit > 0 else []
+    if max_bytes is None:
+        return messages
+    start = len(messages)
+    used = 0
+    while start > 0:
+        size = len((messages[start - 1].get("content") or "").encode("utf-8"))
+        if used + size > max_bytes and start < len(messages):
+            break
+        used += size
+        start -= 1
+    return messages[start:]
 
 class BaseMemory(ABC):
     """
@@ -37,4 +56,103 @@ class BaseMemory(ABC):
         """
         Retrieves the conversation history as a single formatted string.
         """
-        pass
\ No newline at end of file
+        pass
+
+    def get_messages_page(self, session_id: str = "default", limit: Optional[int] = None, max_bytes: Optional[int] = None,
+                          before_id: Optional[int] = None, after_id: Optional[int] = None) -> List[Dict]:
+        """
+        Returns part of a session's history, oldest first. Without ids this is the
+        tail (see tail_messages). Modules with stable message ids also support keyset
+        pages: before_id reads the messages just older than that id, after_id the
+        ones just newer. The default implementation slices get_messages and has no ids.
+        """
+        if before_id is not None or after_id is not None:
+            raise ValueError(f"Memory module '{self.id}' does not support keyset pagination.")
+        return tail_messages(self.get_messages(session_id), limit, max_bytes)
+
+    def get_version(self, session_id: str = "default") -> Optional[str]:
+        """
+        Returns an opaque token that changes whenever the session's history changes,
+        so callers can make conditional requests. None means the module does not
+        track versions.
+        """
+        return None
+
+    def add_messages(self, messages: List[Dict]):
+        """
+        Adds a batch of messages, each a dict with role, content and session_id.
+        The default adds them one by one; modules override this to write the
+        batch in a single transaction.
+        """
+        for msg in messages:
+            self.add_message(msg["role"], msg["content"], msg.get("session_id", "default"))
+
+class AsyncBaseMemory(ABC):
+    """
+    Abstract Base Class for memory modules with a native asyncio interface.
+    Modules implement this alongside BaseMemory so the MemoryManager can await
+    them directly instead of pushing their blocking calls onto a worker thread.
+    """
+
+    @abstractmethod
+    async def add_message_async(self, role: str, content: str, session_id: str = "default"):
+        """
+        Adds a new message to the memory without blocking the event loop.
+        """
+        pass
+
+    @abstractmethod
+    async def get_messages_async(self, session_id: str = "default") -> List[Dict]:
+        """
+        Retrieves all messages for a given session without blocking the event loop.
+        """
+        pass
+
+    @abstractmethod
+    async def clear_async(self, session_id: str = "default"):
+        """
+        Clears the memory for a given session without blocking the event loop.
+        """
+        pass
+
+    @abstractmethod
+    async def get_context_string_async(self, session_id: str = "default") -> str:
+        """
+        Retrieves the conversation history as a single formatted string without blocking the event loop.
+        """
+        pass
+
+    async def add_messages_async(self, messages: List[Dict]):
+        """
+        Async counterpart of BaseMemory.add_messages. Adds messages one by one by default.
+        """
+        for msg in messages:
+            await self.add_message_async(msg["role"], msg["content"], msg.get("session_id", "default"))
+
+    async def get_messages_page_async(self, session_id: str = "default", limit: Optional[int] = None, max_bytes: Optional[int] = None,
+                                      before_id: Optional[int] = None, after_id: Optional[int] = None) -> List[Dict]:
+        """
+        Async counterpart of BaseMemory.get_messages_page.
+        """
+        if before_id is not None or after_id is not None:
+            raise ValueError(f"Memory module '{self.id}' does not support keyset pagination.")
+        return tail_messages(await self.get_messages_async(session_id), limit, max_bytes)
+
+    async def get_version_async(self, session_id: str = "default") -> Optional[str]:
+        """
+        Async counterpart of BaseMemory.get_version. Modules that track versions override both.
+        """
+        return None
+
+    def supports_async(self) -> bool:
+        """
+        Returns True if the async interface is usable at runtime, e.g. the
+        async database driver is installed.
+        """
+        return True
+
+    async def close_async(self):
+        """
+        Releases async resources such as connection pools. Called on shutdown.
+        """
+        pass
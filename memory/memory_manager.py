@@ -1,22 +1,51 @@
 # memory/memory_manager.py
 
 import os
+import asyncio
+import functools
 import importlib
 import inspect
-from typing import List, Dict
-from memory.base import BaseMemory
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional
+from memory.base import BaseMemory, AsyncBaseMemory, tail_messages
+from memory.write_behind import MemoryWriteBehind
+from metrics.collectors import Histogram, InstanceMetric
 from config.manager import ConfigManager
 import logging
 
+MEMORY_OP_SECONDS = Histogram("anyai_memory_operation_seconds", "Latency of memory module operations.", ["module", "operation"])
+WRITE_BEHIND_QUEUE_DEPTH = InstanceMetric("anyai_memory_write_behind_queue_depth", "Messages waiting to be flushed.",
+                                          lambda write_behind: write_behind.depth())
+WRITE_BEHIND_FAILURES = InstanceMetric("anyai_memory_write_behind_failures_total", "Write-behind batches that failed to write and were requeued.",
+                                       lambda write_behind: write_behind.failed_flushes, kind="counter")
+
 class MemoryManager:
     def __init__(self, config_manager: ConfigManager):
         self.config_manager = config_manager
         self.modules = {}
-        self._instances = {}  # Cache for module instances
+        self._instances = {}  # Cache for module instances, shared by concurrent requests
+        self._instances_lock = threading.Lock()
         self.active_module_name = None
         self.active_module = None
+        # Worker threads for modules that only implement the blocking interface
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.config_manager.get_setting("memory", "sync_workers", 8),
+            thread_name_prefix="memory-sync"
+        )
+        # Optional write-behind queue; started from start() once an event loop is running
+        self.write_behind = None
+        if self.config_manager.get_setting("memory", "write_behind", False):
+            self.write_behind = MemoryWriteBehind(
+                self._write_batch,
+                flush_interval=self.config_manager.get_setting("memory", "write_behind_flush_ms", 50) / 1000,
+                max_batch=self.config_manager.get_setting("memory", "write_behind_max_batch", 256)
+            )
+            WRITE_BEHIND_QUEUE_DEPTH.track(self.write_behind)
+            WRITE_BEHIND_FAILURES.track(self.write_behind)
         self._discover_modules()
         self.set_active_module(self.config_manager.get_memory_module())
+        self._preload_modules()
 
     def _discover_modules(self):
         """
@@ -25,7 +54,7 @@ class MemoryManager:
         """
         module_path = os.path.dirname(__file__)
         for filename in os.listdir(module_path):
-            if filename.endswith('.py') and filename not in ['__init__.py', 'base.py', 'memory_manager.py']:
+            if filename.endswith('.py') and filename not in ['__init__.py', 'base.py', 'memory_manager.py', 'sql_engine.py', 'write_behind.py']:
                 module_name_str = filename[:-3]
                 try:
                     module = importlib.import_module(f"memory.{module_name_str}")
@@ -44,24 +73,52 @@ class MemoryManager:
                 except (ImportError, AttributeError, SyntaxError) as e:
                     print(f"Warning: Could not load memory module from {filename}: {e}")
 
-    def set_active_module(self, module_name: str):
+    def _preload_modules(self):
         """
-        Sets the active memory module, using a cached instance if available.
+        Instantiates modules listed in memory.preload_modules up front so per-request
+        selection never pays for module setup (e.g. opening database engines).
+        """
+        for module_name in self.config_manager.get_setting("memory", "preload_modules", []):
+            try:
+                self.get_module(module_name)
+            except Exception as e:
+                print(f"Warning: Could not preload memory module {module_name}: {e}")
+
+    def get_module(self, module_name: Optional[str] = None) -> BaseMemory:
         """
-        if module_name in self.modules:
+        Returns the instance for a memory module from the shared pool, creating it on
+        first use. None means the active module. Does not change the active module.
+        """
+        if module_name is None:
+            return self.get_active_module()
+        instance = self._instances.get(module_name)
+        if instance is not None:
+            return instance
+        if module_name not in self.modules:
+            raise ValueError(f"Memory module '{module_name}' not found.")
+        with self._instances_lock:
             if module_name not in self._instances:
                 module_info = self.modules[module_name]
                 self._instances[module_name] = module_info["class"]()
                 print(f"Initialized and cached new instance for memory module: {module_name}")
+        return self._instances[module_name]
 
-            self.active_module_name = module_name
-            self.active_module = self._instances[module_name]
+    def set_active_module(self, module_name: str, persist: bool = True):
+        """
+        Sets the active memory module, using a cached instance if available.
+        persist=False adopts a selection already saved by another worker.
+        """
+        self.active_module = self.get_module(module_name)
+        self.active_module_name = module_name
+        if persist:
             self.config_manager.set_memory_module(module_name)
-            print(f"Active memory module set to: {module_name}")
-        else:
-            raise ValueError(f"Memory module '{module_name}' not found.")
+        print(f"Active memory module set to: {module_name}")
 
     def get_active_module(self) -> BaseMemory:
+        # Follow switches made by other workers sharing config.json
+        configured = self.config_manager.get_memory_module()
+        if configured != self.active_module_name and configured in self.modules:
+            self.set_active_module(configured, persist=False)
         if not self.active_module:
             raise ValueError("No active memory module set.")
         return self.active_module
@@ -79,4 +136,105 @@ class MemoryManager:
     def get_context_string(self, session_id: str = "default") -> str:
         return self.get_active_module().get_context_string(session_id)
 
+    async def _dispatch(self, method: str, *args, module: BaseMemory = None, **kwargs):
+        """
+        Awaits the module's native async method when it has one, otherwise runs
+        the blocking method on the memory thread pool so the event loop stays free.
+        """
+        module = module or self.get_active_module()
+        with MEMORY_OP_SECONDS.labels(module.id, method).time():
+            if isinstance(module, AsyncBaseMemory) and module.supports_async():
+                return await getattr(module, f"{method}_async")(*args, **kwargs)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(getattr(module, method), *args, **kwargs))
+
+    async def _write_batch(self, module: BaseMemory, messages: List[Dict]):
+        await self._dispatch("add_messages", messages, module=module)
+
+    def _write_behind_active(self) -> bool:
+        return self.write_behind is not None and self.write_behind.running
+
+    async def add_message_async(self, role: str, content: str, session_id: str = "default", module_name: Optional[str] = None):
+        logging.info(f"MemoryManager adding message to session '{session_id}'")
+        module = self.get_module(module_name)
+        if self._write_behind_active():
+            self.write_behind.enqueue(module, role, content, session_id)
+            return
+        await self._dispatch("add_message", role, content, session_id, module=module)
+
+    async def get_messages_async(self, session_id: str = "default", module_name: Optional[str] = None) -> List[Dict]:
+        module = self.get_module(module_name)
+        if self.write_behind is None or not self.write_behind.has_pending(session_id):
+            return await self._dispatch("get_messages", session_id, module=module)
+        # Read-your-writes: overlay messages that are queued but not yet committed
+        async with self.write_behind.lock:
+            messages = await self._dispatch("get_messages", session_id, module=module)
+            return messages + self.write_behind.pending_for(session_id, module)
+
+    async def get_messages_page_async(self, session_id: str = "default", module_name: Optional[str] = None,
+                                      limit: Optional[int] = None, max_bytes: Optional[int] = None,
+                                      before_id: Optional[int] = None, after_id: Optional[int] = None) -> List[Dict]:
+        """
+        Reads the tail of a session (limit / max_bytes) or a keyset page (before_id / after_id).
+        Raises ValueError if the module cannot page by id.
+        """
+        module = self.get_module(module_name)
+        page = functools.partial(self._dispatch, "get_messages_page", session_id, module=module,
+                                 limit=limit, max_bytes=max_bytes, before_id=before_id, after_id=after_id)
+        # Queued writes are the newest messages, so they only belong on the tail page
+        if before_id is not None or after_id is not None or self.write_behind is None or not self.write_behind.has_pending(session_id):
+            return await page()
+        async with self.write_behind.lock:
+            messages = await page()
+            return tail_messages(messages + self.write_behind.pending_for(session_id, module), limit, max_bytes)
+
+    async def clear_async(self, session_id: str = "default", module_name: Optional[str] = None):
+        module = self.get_module(module_name)
+        if self.write_behind is None:
+            await self._dispatch("clear", session_id, module=module)
+            return
+        async with self.write_behind.lock:
+            self.write_behind.discard(session_id, module)
+            await self._dispatch("clear", session_id, module=module)
+
+    async def get_context_string_async(self, session_id: str = "default", module_name: Optional[str] = None) -> str:
+        module = self.get_module(module_name)
+        if self.write_behind is None or not self.write_behind.has_pending(session_id):
+            return await self._dispatch("get_context_string", session_id, module=module)
+        async with self.write_behind.lock:
+            context_string = await self._dispatch("get_context_string", session_id, module=module)
+            pending = self.write_behind.pending_for(session_id, module)
+            lines = [context_string] if context_string else []
+            lines.extend(f"{msg['role']}: {msg['content']}" for msg in pending)
+            return "\n".join(lines)
+
+    async def get_version_async(self, session_id: str = "default", module_name: Optional[str] = None) -> Optional[str]:
+        """
+        Returns the module's history version for the session, or None when it cannot be
+        trusted: the module does not track versions, or writes are still queued.
+        """
+        module = self.get_module(module_name)
+        if self.write_behind is not None and self.write_behind.has_pending(session_id):
+            return None
+        version = await self._dispatch("get_version", session_id, module=module)
+        return f"{module.id}:{version}" if version is not None else None
+
+    async def start(self):
+        """
+        Starts background work (the write-behind flusher) on the running event loop.
+        """
+        if self.write_behind is not None and not self.write_behind.running:
+            self.write_behind.start()
+
+    async def aclose(self):
+        """
+        Drains pending writes, then releases module resources and the memory thread pool.
+        """
+        if self.write_behind is not None:
+            await self.write_behind.aclose()
+        for module in self._instances.values():
+            if isinstance(module, AsyncBaseMemory):
+                await module.close_async()
+        self._executor.shutdown(wait=True)
+
 # Global instance will be created in main.py
\ No newline at end of file
@@ -0,0 +1,138 @@
+# memory/sql_engine.py
+
+import os
+import logging
+from typing import List, Optional, Tuple
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url, Engine, URL
+
+# asyncio drivers matching the synchronous backends we support
+_ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+def to_async_url(db_url: str) -> Optional[URL]:
+    """
+    Maps a synchronous SQLAlchemy URL (e.g. postgresql+psycopg2://) onto the
+    matching asyncio driver. Returns None if the backend has no known async driver.
+    """
+    url = make_url(db_url)
+    drivername = _ASYNC_DRIVERS.get(url.get_backend_name())
+    if drivername is None:
+        return None
+    return url.set(drivername=drivername)
+
+# Embedded SQLite: the file is opened in WAL mode so readers never block the writer
+SQLITE_BUSY_TIMEOUT_MS = 5000
+DEFAULT_SQLITE_MMAP_BYTES = 256 * 1024 * 1024
+DEFAULT_SQLITE_CACHE_KB = 64 * 1024
+DEFAULT_SQLITE_READERS = 4
+
+def is_sqlite_file(db_url) -> bool:
+    url = make_url(db_url)
+    return url.get_backend_name() == "sqlite" and url.database not in (None, "", ":memory:")
+
+def _sqlite_pragmas(writer: bool) -> List[str]:
+    pragmas = [
+        f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}",
+        "PRAGMA synchronous = NORMAL",
+        f"PRAGMA mmap_size = {int(os.getenv('MEMORY_SQLITE_MMAP_BYTES', DEFAULT_SQLITE_MMAP_BYTES))}",
+        # Negative sizes are in KiB rather than pages
+        f"PRAGMA cache_size = -{int(os.getenv('MEMORY_SQLITE_CACHE_KB', DEFAULT_SQLITE_CACHE_KB))}",
+        "PRAGMA foreign_keys = ON",
+    ]
+    if writer:
+        # journal_mode is stored in the file, so setting it once on the writer covers every reader
+        return ["PRAGMA journal_mode = WAL"] + pragmas
+    return pragmas + ["PRAGMA query_only = ON"]
+
+def _tune_sqlite(engine: Engine, writer: bool):
+    """
+    Applies the WAL pragmas to every new connection and takes over transaction
+    control from the sqlite3 driver. The writer begins with BEGIN IMMEDIATE so
+    that concurrent processes queue on busy_timeout up front instead of failing
+    when a read lock is upgraded. Readers BEGIN a snapshot, so the statements of
+    one read see a consistent database.
+    """
+    pragmas = _sqlite_pragmas(writer)
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    @event.listens_for(engine, "begin")
+    def _on_begin(connection):
+        connection.exec_driver_sql("BEGIN IMMEDIATE" if writer else "BEGIN")
+
+def _sqlite_pool_args(readonly: bool) -> dict:
+    # One writer connection per process: SQLite serializes writers anyway, and
+    # queueing in the pool is cheaper than spinning on the file lock
+    size = int(os.getenv("MEMORY_SQLITE_READERS", DEFAULT_SQLITE_READERS)) if readonly else 1
+    return {"pool_size": size, "max_overflow": 0}
+
+def create_memory_engine(db_url: str, readonly: bool = False) -> Engine:
+    """
+    Creates a synchronous engine for a memory database. SQLite files get the
+    tuned WAL setup: a single writer connection, or with readonly a small pool
+    of query-only reader connections.
+    """
+    if not is_sqlite_file(db_url):
+        return create_engine(db_url)
+    engine = create_engine(db_url, **_sqlite_pool_args(readonly))
+    _tune_sqlite(engine, writer=not readonly)
+    return engine
+
+def create_memory_engines(db_url: str) -> Tuple[Engine, Engine]:
+    """
+    Returns (writer, reader) engines. They are the same engine except for SQLite
+    files, where reads get their own connections so they never queue behind writes.
+    """
+    writer = create_memory_engine(db_url)
+    if not is_sqlite_file(db_url):
+        return writer, writer
+    return writer, create_memory_engine(db_url, readonly=True)
+
+def create_memory_async_engine(db_url: str, readonly: bool = False) -> Optional["AsyncEngine"]:
+    """
+    Creates an async engine for a memory database. MEMORY_SQL_ASYNC overrides
+    the derived URL. Returns None if no async driver is available, in which
+    case callers should keep using their synchronous engine.
+    """
+    async_url = os.getenv("MEMORY_SQL_ASYNC") or to_async_url(db_url)
+    if async_url is None:
+        logging.warning(f"No async driver known for '{make_url(db_url).drivername}'; using the sync engine only.")
+        return None
+    try:
+        # Imported lazily: sqlalchemy.ext.asyncio raises ImportError without greenlet
+        from sqlalchemy.ext.asyncio import create_async_engine
+        if not is_sqlite_file(async_url):
+            return create_async_engine(async_url)
+        async_engine = create_async_engine(async_url, **_sqlite_pool_args(readonly))
+        _tune_sqlite(async_engine.sync_engine, writer=not readonly)
+        return async_engine
+    except ImportError as e:
+        logging.warning(f"Async database driver unavailable ({e}); using the sync engine only.")
+        return None
+
+def create_memory_async_engines(db_url: str) -> Tuple[Optional["AsyncEngine"], Optional["AsyncEngine"]]:
+    """
+    Async counterpart of create_memory_engines; both are None without an async driver.
+    """
+    writer = create_memory_async_engine(db_url)
+    if writer is None or not is_sqlite_file(writer.url):
+        return writer, writer
+    return writer, create_memory_async_engine(db_url, readonly=True)
+
+def async_session_factory(async_engine, **kwargs):
+    """
+    Returns an async_sessionmaker bound to the engine, or None without an engine.
+    """
+    if async_engine is None:
+        return None
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+    return async_sessionmaker(async_engine, **kwargs)
@@ -1,69 +1,485 @@
 # memory/stm_eth.py
 
-from datetime import datetime, timedelta
-from typing import List, Dict
-from memory.base import BaseMemory
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+import zlib
+from itertools import count
+from collections import OrderedDict, deque
+from datetime import timedelta
+from typing import List, Dict, Optional, Tuple
+from memory.base import BaseMemory, AsyncBaseMemory
+from metrics.collectors import InstanceMetric
+
+# Bytes charged per entry on top of its content string: the entry object and its deque slot
+ENTRY_OVERHEAD_BYTES = 64
+# Default process-wide budget for the local store, overridden by STM_ETH_MAX_BYTES (0 = unlimited)
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+STM_ETH_RESIDENT_BYTES = InstanceMetric("anyai_stm_eth_resident_bytes", "Bytes of session history held in memory by stm_eth.",
+                                        lambda store: store.resident_bytes)
+STM_ETH_SESSIONS = InstanceMetric("anyai_stm_eth_sessions", "stm_eth sessions by location.",
+                                  lambda store: {("memory",): len(store.sessions), ("disk",): len(store.spill.session_ids) if store.spill else 0},
+                                  labelnames=["location"])
+STM_ETH_EVICTIONS = InstanceMetric("anyai_stm_eth_evictions_total", "stm_eth sessions evicted to stay within the memory budget.",
+                                   lambda store: {("dropped",): store.evicted_sessions, ("spilled",): store.spilled_sessions},
+                                   kind="counter", labelnames=["outcome"])
+STM_ETH_FAULTS = InstanceMetric("anyai_stm_eth_faults_total", "Spilled stm_eth sessions loaded back into memory.",
+                                lambda store: store.faulted_sessions, kind="counter")
 
 class stm_eth_entry:
+    __slots__ = ("role", "content", "timestamp", "size")
+
     def __init__(self, role, content, timestamp=None):
         self.role = role
         self.content = content
-        self.timestamp = timestamp or datetime.now()
+        # Monotonic seconds, so wall-clock adjustments cannot expire or revive entries
+        self.timestamp = time.monotonic() if timestamp is None else timestamp
+        self.size = sys.getsizeof(content) + ENTRY_OVERHEAD_BYTES
+
+class stm_eth_session:
+    __slots__ = ("entries", "bytes", "version", "rendered")
+
+    def __init__(self, max_turns: int, version: int):
+        self.entries = deque(maxlen=max_turns)
+        self.bytes = 0
+        self.version = version
+        self.rendered = None  # context string, cached until the next change
+
+class stm_eth_spill_file:
+    """
+    Compact on-disk home for sessions evicted from memory: one zlib-compressed JSON
+    row per session in a private SQLite file. The file belongs to this process
+    (it is named after the pid), so durability is traded away for speed.
+    """
+    # Purge spilled sessions that have expired every this many spills
+    PURGE_EVERY = 256
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"stm_eth_spill_{os.getpid()}.db")
+        if os.path.exists(self.path):
+            os.remove(self.path)  # left behind by an earlier process with the same pid
+        self.conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=MEMORY")
+        self.conn.execute("PRAGMA synchronous=OFF")
+        self.conn.execute("CREATE TABLE spilled (session_id TEXT PRIMARY KEY, newest REAL NOT NULL, data BLOB NOT NULL)")
+        self.session_ids = set()  # answers "is it on disk?" without a query
+        self._spills = 0
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self.session_ids
+
+    def store(self, session_id: str, entries: deque, max_age_seconds: float):
+        data = zlib.compress(json.dumps([[e.role, e.content, e.timestamp] for e in entries]).encode("utf-8"))
+        newest = entries[-1].timestamp if entries else 0.0
+        self.conn.execute("INSERT OR REPLACE INTO spilled (session_id, newest, data) VALUES (?, ?, ?)", (session_id, newest, data))
+        self.session_ids.add(session_id)
+        self._spills += 1
+        if self._spills % self.PURGE_EVERY == 0:
+            cutoff = time.monotonic() - max_age_seconds
+            expired = [row[0] for row in self.conn.execute("SELECT session_id FROM spilled WHERE newest < ?", (cutoff,))]
+            self.conn.execute("DELETE FROM spilled WHERE newest < ?", (cutoff,))
+            self.session_ids.difference_update(expired)
+
+    def load(self, session_id: str) -> List[Tuple[str, str, float]]:
+        """
+        Removes a session from the file and returns its (role, content, timestamp) entries.
+        """
+        row = self.conn.execute("SELECT data FROM spilled WHERE session_id = ?", (session_id,)).fetchone()
+        self.delete(session_id)
+        return json.loads(zlib.decompress(row[0])) if row else []
+
+    def delete(self, session_id: str):
+        if session_id in self.session_ids:
+            self.conn.execute("DELETE FROM spilled WHERE session_id = ?", (session_id,))
+            self.session_ids.discard(session_id)
+
+    def close(self):
+        self.conn.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+class stm_eth_local_store:
+    """
+    Per-process session store. Each session is a deque bounded to max_turns, so
+    appends are O(1) and the oldest turn falls off automatically. Expired entries
+    are popped lazily from the left on read.
+
+    Sessions are kept in least-recently-used order, with a running byte count per
+    session and in total. Each append checks a few of the least recently used
+    sessions and reclaims any that have expired. When max_bytes is exceeded, LRU
+    sessions are evicted. Without a spill_dir they are dropped. With one, they are
+    moved to a spill file and faulted back in on their next access.
+
+    Every change gives the session a new version from a process-wide counter, and
+    drops its cached context string, which is otherwise rendered once and reused.
+    """
+    # Most idle sessions examined for reclaiming per append
+    SWEEP_BATCH = 8
 
-class stm_eth(BaseMemory):
+    def __init__(self, max_turns: int, max_age: timedelta, max_bytes: int = 0, spill_dir: str = None):
+        self.sessions = OrderedDict()  # session_id -> stm_eth_session, least recently used first
+        self.max_turns = max_turns
+        self.max_age_seconds = max_age.total_seconds()
+        self.max_bytes = max_bytes
+        self.resident_bytes = 0
+        self.evicted_sessions = 0
+        self.spilled_sessions = 0
+        self.faulted_sessions = 0
+        self.trimmed_entries = 0
+        # Versions are unique within this process; the epoch keeps them unique across restarts
+        self._epoch = uuid.uuid4().hex[:8]
+        self._versions = count(1)
+        # Guards the store when it is used from the memory thread pool (spilling enabled)
+        self._lock = threading.Lock()
+        self.spill = stm_eth_spill_file(spill_dir) if spill_dir else None
+        for metric in (STM_ETH_RESIDENT_BYTES, STM_ETH_SESSIONS, STM_ETH_EVICTIONS, STM_ETH_FAULTS):
+            metric.track(self)
+
+    def append(self, session_id: str, role: str, content: str):
+        with self._lock:
+            now = time.monotonic()
+            session = self._session(session_id)
+            if session is None:
+                session = self.sessions[session_id] = stm_eth_session(self.max_turns, next(self._versions))
+            entries = session.entries
+            if len(entries) == entries.maxlen:
+                self._release(session, entries[0])  # about to fall off the left
+            entry = stm_eth_entry(role, content, now)
+            entries.append(entry)
+            self._changed(session)
+            session.bytes += entry.size
+            self.resident_bytes += entry.size
+            self._sweep(now)
+            self._enforce_budget(session_id)
+
+    def entries(self, session_id: str) -> List[Tuple[str, str]]:
+        with self._lock:
+            session = self._live_session(session_id)
+            if session is None:
+                return []
+            self._enforce_budget(session_id)
+            return [(e.role, e.content) for e in session.entries]
+
+    def context_string(self, session_id: str) -> str:
+        with self._lock:
+            session = self._live_session(session_id)
+            if session is None:
+                return ""
+            # Charging the rendered string can push the session over budget and trim
+            # its oldest turn, which discards the render; render what is left then
+            while session.rendered is None:
+                rendered = session.rendered = "\n".join(f"{e.role}: {e.content}" for e in session.entries)
+                size = sys.getsizeof(rendered)
+                session.bytes += size
+                self.resident_bytes += size
+                self._enforce_budget(session_id)
+            return session.rendered
+
+    def get_version(self, session_id: str) -> str:
+        with self._lock:
+            session = self._live_session(session_id)
+            # Version 0 always means an empty history
+            return f"{self._epoch}.{session.version}" if session is not None else "0"
+
+    def _live_session(self, session_id: str) -> Optional[stm_eth_session]:
+        """
+        Returns the session with expired entries removed, or None if nothing is left.
+        """
+        session = self._session(session_id)
+        if session is None:
+            return None
+        self._expire(session, time.monotonic())
+        if not session.entries:
+            self._drop(session_id)
+            return None
+        return session
+
+    def _session(self, session_id: str):
+        """
+        Returns a session and marks it most recently used, faulting it in from the
+        spill file if it was evicted there. None if the session does not exist.
+        """
+        session = self.sessions.get(session_id)
+        if session is not None:
+            self.sessions.move_to_end(session_id)
+            return session
+        if self.spill is None or session_id not in self.spill:
+            return None
+        session = self.sessions[session_id] = stm_eth_session(self.max_turns, next(self._versions))
+        for role, content, timestamp in self.spill.load(session_id):
+            entry = stm_eth_entry(role, content, timestamp)
+            session.entries.append(entry)
+            session.bytes += entry.size
+        self.resident_bytes += session.bytes
+        self.faulted_sessions += 1
+        return session
+
+    def _release(self, session: stm_eth_session, entry: stm_eth_entry):
+        session.bytes -= entry.size
+        self.resident_bytes -= entry.size
+        self._changed(session)
+
+    def _changed(self, session: stm_eth_session):
+        session.version = next(self._versions)
+        if session.rendered is not None:
+            size = sys.getsizeof(session.rendered)
+            session.bytes -= size
+            self.resident_bytes -= size
+            session.rendered = None
+
+    def _expire(self, session: stm_eth_session, now: float):
+        cutoff = now - self.max_age_seconds
+        entries = session.entries
+        while entries and entries[0].timestamp < cutoff:
+            self._release(session, entries.popleft())
+
+    def _drop(self, session_id: str):
+        session = self.sessions.pop(session_id)
+        self.resident_bytes -= session.bytes
+        return session
+
+    def _sweep(self, now: float):
+        """
+        Drops sessions whose newest entry has expired. Only the least recently used
+        sessions are examined, and the sweep stops at the first live one.
+        """
+        cutoff = now - self.max_age_seconds
+        for _ in range(self.SWEEP_BATCH):
+            if not self.sessions:
+                return
+            session_id, session = next(iter(self.sessions.items()))
+            if session.entries and session.entries[-1].timestamp >= cutoff:
+                return
+            self._drop(session_id)
+
+    def _enforce_budget(self, keep: str):
+        """
+        Evicts least recently used sessions until the store fits max_bytes. The
+        session in use is never evicted; if it alone is over budget, its oldest
+        turns are dropped instead, always keeping the newest one.
+        """
+        if not self.max_bytes:
+            return
+        while self.resident_bytes > self.max_bytes:
+            session_id = next(iter(self.sessions))
+            if session_id != keep:
+                session = self._drop(session_id)
+                if self.spill is not None and session.entries:
+                    self.spill.store(session_id, session.entries, self.max_age_seconds)
+                    self.spilled_sessions += 1
+                else:
+                    self.evicted_sessions += 1
+                continue
+            session = self.sessions[keep]
+            if len(session.entries) <= 1:
+                return
+            self._release(session, session.entries.popleft())
+            self.trimmed_entries += 1
+
+    def trim(self, session_id: str):
+        with self._lock:
+            session = self.sessions.get(session_id)
+            if session is not None:
+                self._expire(session, time.monotonic())
+
+    def clear(self, session_id: str):
+        with self._lock:
+            if session_id in self.sessions:
+                self._drop(session_id)
+            if self.spill is not None:
+                self.spill.delete(session_id)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "resident_bytes": self.resident_bytes,
+                "max_bytes": self.max_bytes,
+                "sessions": len(self.sessions),
+                "spilled_sessions_on_disk": len(self.spill.session_ids) if self.spill else 0,
+                "evicted_sessions": self.evicted_sessions,
+                "spilled_sessions": self.spilled_sessions,
+                "faulted_sessions": self.faulted_sessions,
+                "trimmed_entries": self.trimmed_entries,
+            }
+
+    def close(self):
+        if self.spill is not None:
+            self.spill.close()
+
+class stm_eth_shared_store:
+    """
+    Host-wide session store in a SQLite file in WAL mode, so every uvicorn worker
+    sees the same history. Applies the same turn and age limits as the local store.
+    Readers never block writers under WAL, and an indexed tail read stays well under a millisecond.
+    """
+    # Purge rows of idle sessions every this many appends
+    PURGE_EVERY = 256
+
+    def __init__(self, path: str, max_turns: int, max_age: timedelta):
+        self.path = path
+        self.max_turns = max_turns
+        self.max_age_seconds = max_age.total_seconds()
+        self._local = threading.local()  # sqlite3 connections are per thread
+        self._appends = 0
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS stm_eth_entries ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, "
+            "role TEXT NOT NULL, content TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_stm_eth_entries_session_seq ON stm_eth_entries (session_id, seq)")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_stm_eth_entries_created_at ON stm_eth_entries (created_at)")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode; write transactions are opened explicitly with BEGIN IMMEDIATE
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+        return conn
+
+    def append(self, session_id: str, role: str, content: str):
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT INTO stm_eth_entries (session_id, role, content, created_at) VALUES (?, ?, ?, ?)",
+                (session_id, role, content, now)
+            )
+            # Keep only the newest max_turns entries that are still within max_age
+            conn.execute(
+                "DELETE FROM stm_eth_entries WHERE session_id = ? AND (created_at < ? OR seq <= ("
+                "SELECT seq FROM stm_eth_entries WHERE session_id = ? ORDER BY seq DESC LIMIT 1 OFFSET ?))",
+                (session_id, now - self.max_age_seconds, session_id, self.max_turns)
+            )
+            self._appends += 1
+            if self._appends % self.PURGE_EVERY == 0:
+                conn.execute("DELETE FROM stm_eth_entries WHERE created_at < ?", (now - self.max_age_seconds,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def entries(self, session_id: str) -> List[Tuple[str, str]]:
+        rows = self._connection().execute(
+            "SELECT role, content FROM (SELECT seq, role, content FROM stm_eth_entries "
+            "WHERE session_id = ? AND created_at >= ? ORDER BY seq DESC LIMIT ?) ORDER BY seq",
+            (session_id, time.time() - self.max_age_seconds, self.max_turns)
+        )
+        return rows.fetchall()
+
+    def context_string(self, session_id: str) -> str:
+        return "\n".join(f"{role}: {content}" for role, content in self.entries(session_id))
+
+    def get_version(self, session_id: str) -> str:
+        # The seq range of the live tail identifies it; seq values are never reused
+        low, high, rows = self._connection().execute(
+            "SELECT MIN(seq), MAX(seq), COUNT(*) FROM (SELECT seq FROM stm_eth_entries "
+            "WHERE session_id = ? AND created_at >= ? ORDER BY seq DESC LIMIT ?)",
+            (session_id, time.time() - self.max_age_seconds, self.max_turns)
+        ).fetchone()
+        return f"{low}-{high}.{rows}" if rows else "0"
+
+    def trim(self, session_id: str):
+        # Limits are enforced on write and filtered on read
+        pass
+
+    def clear(self, session_id: str):
+        self._connection().execute("DELETE FROM stm_eth_entries WHERE session_id = ?", (session_id,))
+
+class stm_eth(BaseMemory, AsyncBaseMemory):
     id = "stm_eth"
     name = "Ephemeral Memory"
 
-    def __init__(self, max_turns=15, max_age_minutes=15):
-        self.sessions = {} # Dictionary to hold memory for different sessions
+    def __init__(self, max_turns=15, max_age_minutes=15, max_bytes=None, spill_dir=None):
         self.max_turns = max_turns
         self.max_age = timedelta(minutes=max_age_minutes)
-
-    def _get_session_entries(self, session_id: str):
-        if session_id not in self.sessions:
-            self.sessions[session_id] = []
-        return self.sessions[session_id]
+        # STM_ETH_SHARED_DB points every worker at one SQLite file; otherwise history is per process
+        shared_path = os.getenv("STM_ETH_SHARED_DB")
+        if shared_path:
+            self.store = stm_eth_shared_store(shared_path, self.max_turns, self.max_age)
+        else:
+            if max_bytes is None:
+                max_bytes = int(os.getenv("STM_ETH_MAX_BYTES", DEFAULT_MAX_BYTES))
+            # STM_ETH_SPILL_DIR moves sessions evicted by the budget to disk instead of dropping them
+            spill_dir = spill_dir or os.getenv("STM_ETH_SPILL_DIR")
+            self.store = stm_eth_local_store(self.max_turns, self.max_age, max_bytes, spill_dir)
 
     def add_message(self, role: str, content: str, session_id: str = "default"):
-        entries = self._get_session_entries(session_id)
-        entries.append(stm_eth_entry(role, content))
-        self.trim(session_id)
+        self.store.append(session_id, role, content)
 
     def get_messages(self, session_id: str = "default") -> List[Dict]:
         """
         Returns the message history for a given session as a list of dictionaries.
         """
-        self.trim(session_id) # Ensure memory is fresh before returning
-        entries = self._get_session_entries(session_id)
-        return [{"role": e.role, "content": e.content} for e in entries]
+        return [{"role": role, "content": content} for role, content in self.store.entries(session_id)]
 
     def trim(self, session_id: str = "default"):
-        now = datetime.now()
-        entries = self._get_session_entries(session_id)
-        entries = [
-            e for e in entries
-            if now - e.timestamp <= self.max_age
-        ]
-        if len(entries) > self.max_turns:
-            entries = entries[-self.max_turns:]
-        self.sessions[session_id] = entries # Update the session's entries
+        self.store.trim(session_id)
 
     def get_context_string(self, session_id: str = "default") -> str:
         """
         Returns the conversation history for a given session as a single string.
         """
-        self.trim(session_id) # Ensure memory is fresh before returning
-        entries = self._get_session_entries(session_id)
-        return "\n".join(f"{e.role}: {e.content}" for e in entries)
+        return self.store.context_string(session_id)
+
+    def get_version(self, session_id: str = "default") -> Optional[str]:
+        """
+        Changes whenever the session's live history changes, including when entries expire.
+        """
+        return self.store.get_version(session_id)
 
     def clear(self, session_id: str = "default"):
         """
         Clears the memory for a specific session.
         """
-        if session_id in self.sessions:
-            del self.sessions[session_id]
+        self.store.clear(session_id)
+
+    def stats(self) -> Dict:
+        """
+        Memory budget and eviction counters of the local store.
+        """
+        return self.store.stats() if isinstance(self.store, stm_eth_local_store) else {}
+
+    def supports_async(self) -> bool:
+        # The shared store can wait on SQLite locks, and a spilling local store reads
+        # its spill file, so both run on the memory thread pool
+        return isinstance(self.store, stm_eth_local_store) and self.store.spill is None
+
+    # The local store is an in-process dict, so the async interface simply runs the
+    # sync methods on the event loop rather than paying for a thread hop.
+    async def add_message_async(self, role: str, content: str, session_id: str = "default"):
+        self.add_message(role, content, session_id)
+
+    async def get_messages_async(self, session_id: str = "default") -> List[Dict]:
+        return self.get_messages(session_id)
+
+    async def clear_async(self, session_id: str = "default"):
+        self.clear(session_id)
+
+    async def get_context_string_async(self, session_id: str = "default") -> str:
+        return self.get_context_string(session_id)
+
+    async def get_version_async(self, session_id: str = "default") -> Optional[str]:
+        return self.get_version(session_id)
+
+    async def close_async(self):
+        if isinstance(self.store, stm_eth_local_store):
+            self.store.close()
 
 module_config = {
     "name": "Ephemeral Memory",
     "description": "Stores conversation history in memory, limited by time and number of turns."
-}
\ No newline at end of file
+}
@@ -1,13 +1,25 @@
 # memory/stm_prp.py
 
+import asyncio
 import os
 import logging
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime
+# Aliased: sqlalchemy's select takes the plain name below
+import select as stdlib_select
+import threading
+import time
+import uuid
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, List, Optional
+from sqlalchemy import select, insert, delete, func, or_, cast, Column, Index, Integer, String, Text, DateTime, LargeBinary
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
 from dotenv import load_dotenv
-from memory.base import BaseMemory
+from memory.base import BaseMemory, AsyncBaseMemory
+from memory.sql_engine import create_memory_engines, create_memory_async_engines, async_session_factory
+from metrics.collectors import InstanceMetric
 
 load_dotenv()
 
@@ -16,47 +28,649 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 
 Base = declarative_base()
 
+# How the history cache learns about writes made by other processes
+CACHE_MODES = ("off", "local", "version", "notify")
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+NOTIFY_CHANNEL = "stm_prp_messages"
+
+HISTORY_CACHE_READS = InstanceMetric("anyai_stm_prp_history_cache_reads_total", "stm_prp history reads by cache outcome.",
+                                     lambda cache: {(result,): value for result, value in cache.reads.items()},
+                                     kind="counter", labelnames=["result"])
+DB_ROUND_TRIPS_SAVED = InstanceMetric("anyai_stm_prp_db_round_trips_saved_total", "stm_prp history reads served without querying the database.",
+                                      lambda cache: cache.round_trips_saved, kind="counter")
+HISTORY_CACHE_BYTES = InstanceMetric("anyai_stm_prp_history_cache_bytes", "Bytes of message content held by the stm_prp history cache.",
+                                     lambda cache: cache.bytes)
+HISTORY_CACHE_INVALIDATIONS = InstanceMetric("anyai_stm_prp_history_cache_invalidations_total",
+                                             "stm_prp sessions dropped because another process wrote them.",
+                                             lambda cache: cache.invalidations, kind="counter")
+GROUP_COMMIT_BATCHES = InstanceMetric("anyai_stm_prp_group_commit_batches_total", "Transactions committed by the stm_prp group committer.",
+                                      lambda committer: committer.batches, kind="counter")
+GROUP_COMMIT_MESSAGES = InstanceMetric("anyai_stm_prp_group_commit_messages_total", "Messages written by the stm_prp group committer.",
+                                       lambda committer: committer.messages, kind="counter")
+
 class Message(Base):
     __tablename__ = 'messages'
+    # Mirrors alembic revision a738f8687434; every read is one session in id order
+    __table_args__ = (Index('ix_messages_session_id_id', 'session_id', 'id'),)
     id = Column(Integer, primary_key=True)
     session_id = Column(String, nullable=False)
     role = Column(String, nullable=False)
     content = Column(Text, nullable=False)
     timestamp = Column(DateTime, default=datetime.utcnow)
 
-class stm_prp(BaseMemory):
+def _message_row(msg):
+    """
+    Maps a batch message dict onto Message columns, keeping a caller-supplied
+    timestamp (e.g. when a write-behind queue accepted the message). History is
+    read in id order, so the timestamp records when a message was written and
+    does not affect its position. Every row carries the same keys so a batch can
+    go out as one INSERT.
+    """
+    return {
+        "session_id": msg.get("session_id", "default"),
+        "role": msg["role"],
+        "content": msg["content"],
+        "timestamp": msg.get("timestamp") or datetime.utcnow(),
+    }
+
+# Executed with a list of rows this is a multi-row INSERT; ids come back in row order
+_INSERT_MESSAGES = insert(Message).returning(Message.id, sort_by_parameter_order=True)
+
+def _written(ids, rows) -> Dict[str, list]:
+    """
+    Groups inserted rows by session as (id, role, content) for the history cache.
+    """
+    written = {}
+    for message_id, row in zip(ids, rows):
+        written.setdefault(row["session_id"], []).append((message_id, row["role"], row["content"]))
+    return written
+
+def _render(rows) -> str:
+    # rows are (id, role, content, ...) tuples
+    return "\n".join(f"{row[1]}: {row[2]}" for row in rows)
+
+def _row_id(row) -> int:
+    return row[0]
+
+class stm_prp_context_cache:
+    """
+    Rendered context strings for recently used sessions, each tagged with the row
+    count and highest message id it covers. When a session has only gained rows,
+    just the new rows are rendered and appended; any other change re-renders.
+    """
+
+    def __init__(self, max_sessions: int = 1024):
+        self.max_sessions = max_sessions
+        self._entries = OrderedDict()  # session_id -> (rows, max_id, text)
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str):
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None:
+                self._entries.move_to_end(session_id)
+            return entry
+
+    def put(self, session_id: str, rows: int, max_id: int, text: str):
+        with self._lock:
+            self._entries[session_id] = (rows, max_id, text)
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_sessions:
+                self._entries.popitem(last=False)
+
+    def drop(self, session_id: str):
+        with self._lock:
+            self._entries.pop(session_id, None)
+
+    @staticmethod
+    def delta_after(entry, rows: int, max_id: int):
+        """
+        Returns the id after which rows must be fetched to catch up, or None to re-render.
+        """
+        if entry is None or entry[1] >= max_id or entry[0] >= rows:
+            return None
+        return entry[1]
+
+    def extend(self, session_id: str, entry, rows: int, delta) -> str:
+        """
+        Appends freshly fetched rows to a cached entry. Returns None if the session
+        also lost rows since it was cached (the counts disagree).
+        """
+        if not delta or entry[0] + len(delta) != rows:
+            return None
+        text = entry[2] + "\n" + _render(delta) if entry[2] else _render(delta)
+        self.put(session_id, rows, delta[-1][0], text)
+        return text
+
+class stm_prp_history_cache:
+    """
+    Read-through cache of whole session histories, least recently used first and
+    bounded by session count and content bytes. Each session is an immutable tuple
+    of (id, role, content, size) rows that writers replace, so readers never copy.
+    Sessions longer than max_rows are not cached and keep using paged queries;
+    they are remembered so later reads skip straight to the database.
+    """
+
+    def __init__(self, max_sessions: int = 1024, max_bytes: int = DEFAULT_CACHE_BYTES, max_rows: int = 2000):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.max_rows = max_rows
+        self.bytes = 0
+        self._entries = OrderedDict()  # session_id -> (rows, bytes)
+        self._uncacheable = OrderedDict()  # session_id -> None, sessions known to exceed max_rows
+        self._lock = threading.Lock()
+        # Loads that raced a write or invalidation of the same session are not stored.
+        # Each session remembers the clock of its last change; sessions that fall out of
+        # this bounded map only raise the floor assumed for every untracked session.
+        self._clock = 0
+        self._changed_at = OrderedDict()  # session_id -> clock of its last change, oldest first
+        self._changed_floor = 0
+        self.reads = {"hit": 0, "validated": 0, "refreshed": 0, "miss": 0, "uncacheable": 0}
+        self.round_trips_saved = 0
+        self.invalidations = 0
+        for metric in (HISTORY_CACHE_READS, DB_ROUND_TRIPS_SAVED, HISTORY_CACHE_BYTES, HISTORY_CACHE_INVALIDATIONS):
+            metric.track(self)
+
+    @staticmethod
+    def rows_from(result) -> tuple:
+        return tuple((row[0], row[1], row[2], len(row[2].encode("utf-8"))) for row in result)
+
+    def get(self, session_id: str):
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return None
+            self._entries.move_to_end(session_id)
+            return entry[0]
+
+    def record(self, result: str):
+        with self._lock:
+            self.reads[result] += 1
+            if result == "hit":
+                self.round_trips_saved += 1
+
+    def is_uncacheable(self, session_id: str) -> bool:
+        with self._lock:
+            return session_id in self._uncacheable
+
+    def mark_uncacheable(self, session_id: str):
+        with self._lock:
+            self._remove(session_id)
+            self._uncacheable[session_id] = None
+            self._uncacheable.move_to_end(session_id)
+            while len(self._uncacheable) > self.max_sessions:
+                self._uncacheable.popitem(last=False)
+
+    def generation(self) -> int:
+        """
+        Token to take before loading a session from the database; see put.
+        """
+        with self._lock:
+            return self._clock
+
+    def _changed(self, session_id: str):
+        self._clock += 1
+        self._changed_at[session_id] = self._clock
+        self._changed_at.move_to_end(session_id)
+        while len(self._changed_at) > self.max_sessions * 4:
+            _, changed = self._changed_at.popitem(last=False)
+            self._changed_floor = changed
+
+    def put(self, session_id: str, rows: tuple, generation: int) -> tuple:
+        """
+        Stores a freshly loaded history unless the same session was written or
+        invalidated after generation was taken. Returns rows either way.
+        """
+        with self._lock:
+            if self._changed_at.get(session_id, self._changed_floor) <= generation:
+                self._store(session_id, rows)
+        return rows
+
+    def extend(self, session_id: str, rows: tuple, delta) -> tuple:
+        """
+        Appends rows fetched by a version check and returns the extended history.
+        It is only stored if the cached entry is still the one that was checked.
+        """
+        extended = rows + self.rows_from(delta)
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None and entry[0] is rows:
+                self._store(session_id, extended)
+        return extended
+
+    def append(self, session_id: str, new_rows):
+        """
+        Adds rows this process just wrote. Sessions that are not cached stay uncached;
+        rows arriving out of id order (concurrent writers) drop the session instead.
+        """
+        new_rows = self.rows_from(new_rows)
+        with self._lock:
+            self._changed(session_id)
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return
+            rows = entry[0]
+            if rows and new_rows[0][0] <= rows[-1][0]:
+                self._remove(session_id)
+                return
+            self._store(session_id, rows + new_rows)
+
+    def drop(self, session_id: str, invalidation: bool = False):
+        with self._lock:
+            self._changed(session_id)
+            # A cleared session starts short again
+            self._uncacheable.pop(session_id, None)
+            if self._remove(session_id) and invalidation:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._clock += 1
+            self._changed_at.clear()
+            self._changed_floor = self._clock
+            self._entries.clear()
+            self._uncacheable.clear()
+            self.bytes = 0
+
+    def _store(self, session_id: str, rows: tuple):
+        self._remove(session_id)
+        size = sum(row[3] for row in rows)
+        if len(rows) > self.max_rows or size > self.max_bytes:
+            return
+        self._entries[session_id] = (rows, size)
+        self.bytes += size
+        while len(self._entries) > self.max_sessions or self.bytes > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.bytes -= evicted
+
+    def _remove(self, session_id: str) -> bool:
+        entry = self._entries.pop(session_id, None)
+        if entry is None:
+            return False
+        self.bytes -= entry[1]
+        return True
+
+    def stats(self) -> Dict:
+        with self._lock:
+            reads = sum(self.reads.values())
+            served = self.reads["hit"] + self.reads["validated"] + self.reads["refreshed"]
+            return {
+                "sessions": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "reads": dict(self.reads),
+                "hit_ratio": round(served / reads, 4) if reads else 0.0,
+                "round_trips_saved": self.round_trips_saved,
+                "invalidations": self.invalidations,
+            }
+
+class stm_prp_group_commit:
+    """
+    Coalesces concurrent single-message writes into one transaction. The first
+    writer to arrive opens a window of window_ms (or until max_batch messages
+    queue up); a committer thread then writes the whole batch with one INSERT
+    and completes every writer's future once it has committed, so callers still
+    return only after their message is durable. Writers arriving during a commit
+    form the next batch. If a batch fails, its messages are retried one by one
+    so each writer gets its own outcome.
+    """
+
+    def __init__(self, write_batch, window_ms: float = 2.0, max_batch: int = 512):
+        self._write_batch = write_batch
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.batches = 0
+        self.messages = 0
+        self._queue = []  # (message, future)
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="stm_prp-group-commit", daemon=True)
+        self._thread.start()
+        GROUP_COMMIT_BATCHES.track(self)
+        GROUP_COMMIT_MESSAGES.track(self)
+
+    def submit(self, message: Dict) -> Future:
+        future = Future()
+        with self._cond:
+            if self._stopping:
+                raise RuntimeError("stm_prp group commit is closed")
+            self._queue.append((message, future))
+            if len(self._queue) == 1 or len(self._queue) >= self.max_batch:
+                self._cond.notify()
+        return future
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._queue and not self._stopping:
+                self._cond.wait()
+            deadline = time.monotonic() + self.window
+            while len(self._queue) < self.max_batch and not self._stopping:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = self._queue[:self.max_batch]
+            del self._queue[:self.max_batch]
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return  # stopping and drained
+            try:
+                self._write_batch([message for message, _ in batch])
+                outcomes = [None] * len(batch)
+            except Exception as e:
+                if len(batch) == 1:
+                    outcomes = [e]
+                else:
+                    logging.warning(f"Group commit of {len(batch)} messages failed ({e}); retrying them one by one.")
+                    outcomes = [self._write_one(message) for message, _ in batch]
+            self.batches += 1
+            self.messages += sum(1 for outcome in outcomes if outcome is None)
+            for (_, future), outcome in zip(batch, outcomes):
+                if outcome is None:
+                    future.set_result(None)
+                else:
+                    future.set_exception(outcome)
+
+    def _write_one(self, message: Dict):
+        try:
+            self._write_batch([message])
+            return None
+        except Exception as e:
+            return e
+
+    def stats(self) -> Dict:
+        return {
+            "window_ms": self.window * 1000,
+            "batches": self.batches,
+            "messages": self.messages,
+            "messages_per_batch": round(self.messages / self.batches, 2) if self.batches else 0.0,
+        }
+
+    def close(self):
+        """
+        Commits everything already submitted, then stops the committer thread.
+        """
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self._thread.join()
+
+class stm_prp_invalidation_listener:
+    """
+    LISTENs on a Postgres channel from a daemon thread and drops sessions written
+    by other processes from the history cache. Each process tags its NOTIFY
+    payloads with a token so it skips its own writes. The cache is only trusted
+    while the listener is connected; on (re)connect it is cleared, since writes
+    made while nobody was listening were never announced.
+    """
+    POLL_SECONDS = 1.0
+    RETRY_SECONDS = 5.0
+
+    def __init__(self, engine, cache: stm_prp_history_cache, token: str):
+        self.engine = engine
+        self.cache = cache
+        self.token = token
+        self.listening = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stm_prp-listen", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            raw = None
+            try:
+                raw = self.engine.raw_connection()
+                # Keep the LISTEN session out of the pool
+                raw.detach()
+                conn = raw.driver_connection
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+                self.cache.clear()
+                self.listening.set()
+                logging.info(f"stm_prp listening for cache invalidations on '{NOTIFY_CHANNEL}'.")
+                while not self._stop.is_set():
+                    if not stdlib_select.select([conn], [], [], self.POLL_SECONDS)[0]:
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        token, _, session_id = conn.notifies.pop(0).payload.partition(":")
+                        if token != self.token:
+                            self.cache.drop(session_id, invalidation=True)
+            except Exception as e:
+                logging.warning(f"stm_prp invalidation listener disconnected: {e}")
+                self._stop.wait(self.RETRY_SECONDS)
+            finally:
+                self.listening.clear()
+                if raw is not None:
+                    try:
+                        raw.close()
+                    except Exception:
+                        pass
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=self.POLL_SECONDS * 2)
+
+class stm_prp(BaseMemory, AsyncBaseMemory):
+    """
+    Keeps history in SQL behind a read-through history cache. STM_PRP_CACHE picks
+    how the cache stays correct when other processes write the same sessions:
+    "local" trusts it outright (one process), "version" checks the session's row
+    count and highest id before each read, "notify" trusts it while listening for
+    Postgres NOTIFYs from other writers, and "off" disables it. With
+    STM_PRP_GROUP_COMMIT_MS set, concurrent single-message writes share transactions.
+    """
     id = "stm_prp"
     name = "Perpetual Memory"
+    # Most rows a byte-budgeted page scans when no limit is given
+    TAIL_SCAN_ROWS = 1000
 
     def __init__(self):
         db_url = os.getenv("MEMORY_SQL")
         if not db_url:
             logging.error("MEMORY_SQL environment variable not set")
             raise ValueError("MEMORY_SQL environment variable not set")
-        self.engine = create_engine(db_url)
+        # Separate reader connections on SQLite; the same engine otherwise
+        self.engine, self.read_engine = create_memory_engines(db_url)
         self.Session = sessionmaker(bind=self.engine)
+        self.ReadSession = sessionmaker(bind=self.read_engine)
         Base.metadata.create_all(bind=self.engine)  # Create tables if they don't exist
-        logging.info(f"stm_prp initialized with DB URL: {db_url}, tables created")
+        self.async_engine, self.async_read_engine = create_memory_async_engines(db_url)
+        self.AsyncSession = async_session_factory(self.async_engine, expire_on_commit=False)
+        self.AsyncReadSession = async_session_factory(self.async_read_engine, expire_on_commit=False)
+        self.context_cache = stm_prp_context_cache()
+        self.cache_mode = os.getenv("STM_PRP_CACHE", "version").lower()
+        if self.cache_mode not in CACHE_MODES:
+            raise ValueError(f"STM_PRP_CACHE must be one of {', '.join(CACHE_MODES)}, not '{self.cache_mode}'.")
+        if self.cache_mode == "notify" and self.engine.dialect.driver != "psycopg2":
+            logging.warning("STM_PRP_CACHE=notify needs PostgreSQL with psycopg2; falling back to version checks.")
+            self.cache_mode = "version"
+        self.history_cache = None
+        if self.cache_mode != "off":
+            self.history_cache = stm_prp_history_cache(
+                max_sessions=int(os.getenv("STM_PRP_CACHE_SESSIONS", 1024)),
+                max_bytes=int(os.getenv("STM_PRP_CACHE_BYTES", DEFAULT_CACHE_BYTES)),
+                max_rows=int(os.getenv("STM_PRP_CACHE_MAX_ROWS", 2000)),
+            )
+        self._token = uuid.uuid4().hex[:12]
+        self.listener = None
+        if self.cache_mode == "notify":
+            self.listener = stm_prp_invalidation_listener(self.engine, self.history_cache, self._token)
+        self.group_commit = None
+        group_commit_ms = float(os.getenv("STM_PRP_GROUP_COMMIT_MS", 0))
+        if group_commit_ms > 0:
+            self.group_commit = stm_prp_group_commit(
+                self._commit_batch, group_commit_ms, int(os.getenv("STM_PRP_GROUP_COMMIT_MAX", 512))
+            )
+        logging.info(f"stm_prp initialized with DB URL: {db_url}, tables created, history cache: {self.cache_mode}")
 
-    def add_message(self, role: str, content: str, session_id: str = "default"):
+    def _cache_trusted(self) -> bool:
+        if self.cache_mode == "local":
+            return True
+        return self.listener is not None and self.listener.listening.is_set()
+
+    def _notifications(self, session_ids):
+        """
+        pg_notify calls announcing writes to other processes; they are delivered on commit.
+        """
+        if self.cache_mode != "notify":
+            return []
+        return [select(func.pg_notify(NOTIFY_CHANNEL, f"{self._token}:{session_id}")) for session_id in sorted(set(session_ids))]
+
+    def _cache_written(self, written: Dict[str, list]):
+        if self.history_cache is None:
+            return
+        for session_id, rows in written.items():
+            self.history_cache.append(session_id, rows)
+
+    def _cache_cleared(self, session_id: str):
+        self.context_cache.drop(session_id)
+        if self.history_cache is not None:
+            self.history_cache.drop(session_id)
+
+    def _insert(self, session, messages: List[Dict]) -> Dict[str, list]:
+        """
+        Inserts a batch with a single multi-row INSERT and queues its notifications.
+        The caller commits.
+        """
+        rows = [_message_row(msg) for msg in messages]
+        written = _written(session.execute(_INSERT_MESSAGES, rows).scalars().all(), rows)
+        for notification in self._notifications(written):
+            session.execute(notification)
+        return written
+
+    def _commit_batch(self, messages: List[Dict]):
+        """
+        Writes a batch in one transaction and updates the history cache. Raises on failure.
+        """
         session = self.Session()
         try:
-            new_message = Message(session_id=session_id, role=role, content=content)
-            session.add(new_message)
+            written = self._insert(session, messages)
             session.commit()
-            logging.info(f"Added message to session '{session_id}': Role='{role}', Content='{content[:50]}...'")
-        except Exception as e:
+        except Exception:
             session.rollback()
-            logging.error(f"Error adding message to session '{session_id}': {e}")
+            raise
         finally:
             session.close()
+        self._cache_written(written)
+
+    def add_message(self, role: str, content: str, session_id: str = "default"):
+        try:
+            message = {"role": role, "content": content, "session_id": session_id}
+            if self.group_commit is not None:
+                self.group_commit.submit(message).result()
+            else:
+                self._commit_batch([message])
+            logging.info(f"Added message to session '{session_id}': Role='{role}', Content='{content[:50]}...'")
+        except Exception as e:
+            logging.error(f"Error adding message to session '{session_id}': {e}")
+
+    def add_messages(self, messages):
+        """
+        Writes a batch of messages in a single transaction.
+        """
+        if not messages:
+            return
+        try:
+            self._commit_batch(messages)
+            logging.info(f"Added batch of {len(messages)} messages.")
+        except Exception as e:
+            logging.error(f"Error adding batch of {len(messages)} messages: {e}")
+
+    def _checked(self, session_id: str, rows: tuple, count: int, max_id: int) -> str:
+        """
+        Compares a cached session with its (count, max id) in the database: "current",
+        "delta" (rows were added after the cached ones; fetch them), "reload" (cleared
+        elsewhere, or a row committed behind the cached ones, since ids are allocated
+        before commit) or "uncacheable" (grew past max_rows).
+        """
+        cache = self.history_cache
+        last_id = rows[-1][0] if rows else 0
+        if count > cache.max_rows:
+            cache.mark_uncacheable(session_id)
+            cache.record("uncacheable")
+            return "uncacheable"
+        if count == len(rows) and max_id == last_id:
+            cache.record("validated")
+            return "current"
+        if count > len(rows) and max_id > last_id:
+            return "delta"
+        cache.drop(session_id)
+        return "reload"
+
+    def _delta_query(self, session_id: str, rows: tuple):
+        return self._rows_query(session_id).where(Message.id > (rows[-1][0] if rows else 0))
+
+    def _extended(self, session_id: str, rows: tuple, delta, count: int) -> Optional[tuple]:
+        """
+        Applies rows fetched after a "delta" check. If they do not account for every
+        new row, one was committed behind the cached ones: drop the entry and reload.
+        """
+        cache = self.history_cache
+        if len(rows) + len(delta) != count:
+            cache.drop(session_id)
+            return None
+        cache.record("refreshed")
+        return cache.extend(session_id, rows, delta)
+
+    def _loaded(self, session_id: str, loaded, generation: int) -> Optional[tuple]:
+        cache = self.history_cache
+        if len(loaded) > cache.max_rows:
+            cache.mark_uncacheable(session_id)
+            cache.record("uncacheable")
+            return None
+        cache.record("miss")
+        return cache.put(session_id, cache.rows_from(loaded), generation)
+
+    def _cached_history(self, session, session_id: str, load: bool = True) -> Optional[tuple]:
+        """
+        Returns the session's (id, role, content, size) rows through the history
+        cache, or None if the caller should query the database itself: caching is
+        off, the session is too long to cache, or it is not cached and load is False
+        (page reads, which a bounded page query answers more cheaply than a load).
+        Only sessions that fit the cache are counted, and loads read at most
+        max_rows + 1 rows, so no query scans a long session.
+        """
+        cache = self.history_cache
+        if cache is None or cache.is_uncacheable(session_id):
+            return None
+        rows = cache.get(session_id)
+        if rows is not None:
+            if self._cache_trusted():
+                cache.record("hit")
+                return rows
+            # A cached session holds at most max_rows rows, so counting them stays cheap
+            count, max_id = self._session_state(session, session_id)
+            state = self._checked(session_id, rows, count, max_id)
+            if state == "current":
+                return rows
+            if state == "uncacheable":
+                return None
+            if state == "delta":
+                rows = self._extended(session_id, rows, session.execute(self._delta_query(session_id, rows)).all(), count)
+                if rows is not None:
+                    return rows
+        if not load:
+            return None
+        generation = cache.generation()
+        loaded = session.execute(self._rows_query(session_id).limit(cache.max_rows + 1)).all()
+        return self._loaded(session_id, loaded, generation)
 
     def get_messages(self, session_id: str = "default"):
-        session = self.Session()
+        session = self.ReadSession()
         try:
-            messages = session.query(Message).filter_by(session_id=session_id).order_by(Message.timestamp).all()
-            logging.info(f"Retrieved {len(messages)} messages for session '{session_id}'.")
-            return [{"role": msg.role, "content": msg.content} for msg in messages]
+            rows = self._cached_history(session, session_id)
+            if rows is None:
+                rows = session.execute(
+                    select(Message.id, Message.role, Message.content).where(Message.session_id == session_id).order_by(Message.id)
+                ).all()
+            logging.info(f"Retrieved {len(rows)} messages for session '{session_id}'.")
+            return [{"role": row[1], "content": row[2]} for row in rows]
         except Exception as e:
             logging.error(f"Error retrieving messages for session '{session_id}': {e}")
             return []
@@ -67,7 +681,10 @@ class stm_prp(BaseMemory):
         session = self.Session()
         try:
             session.query(Message).filter_by(session_id=session_id).delete()
+            for notification in self._notifications([session_id]):
+                session.execute(notification)
             session.commit()
+            self._cache_cleared(session_id)
             logging.info(f"Cleared memory for session '{session_id}'.")
         except Exception as e:
             session.rollback()
@@ -75,11 +692,135 @@ class stm_prp(BaseMemory):
         finally:
             session.close()
 
+    def _session_state(self, session, session_id: str):
+        rows, max_id = session.execute(
+            select(func.count(Message.id), func.max(Message.id)).where(Message.session_id == session_id)
+        ).one()
+        return rows, max_id or 0
+
+    @staticmethod
+    def _rows_query(session_id: str):
+        # Plain (id, role, content) rows; no ORM objects are built
+        return select(Message.id, Message.role, Message.content).where(Message.session_id == session_id).order_by(Message.id)
+
+    def _content_bytes(self):
+        if self.engine.dialect.name == "postgresql":
+            return func.octet_length(Message.content)
+        return func.length(cast(Message.content, LargeBinary))
+
+    def _page_query(self, session_id: str, limit: Optional[int], max_bytes: Optional[int],
+                    before_id: Optional[int], after_id: Optional[int]):
+        """
+        Keyset page over the (session_id, id) index. Pages walk backwards from
+        before_id (or the newest message) unless only after_id is given, in which
+        case they walk forwards. max_bytes keeps the messages whose running content
+        size, counted from the page's starting edge, fits the budget.
+        """
+        forward = after_id is not None and before_id is None
+        conditions = [Message.session_id == session_id]
+        if before_id is not None:
+            conditions.append(Message.id < before_id)
+        if after_id is not None:
+            conditions.append(Message.id > after_id)
+        walk = Message.id.asc() if forward else Message.id.desc()
+        rows = limit if limit is not None else (self.TAIL_SCAN_ROWS if max_bytes is not None else None)
+        if max_bytes is None:
+            page = select(Message.id, Message.role, Message.content).where(*conditions).order_by(walk).limit(rows).subquery()
+            return select(page.c.id, page.c.role, page.c.content).order_by(page.c.id)
+        page = (
+            select(Message.id, Message.role, Message.content, self._content_bytes().label("size"))
+            .where(*conditions).order_by(walk).limit(rows).subquery()
+        )
+        running = func.sum(page.c.size).over(order_by=page.c.id.asc() if forward else page.c.id.desc())
+        ranked = select(page.c.id, page.c.role, page.c.content, page.c.size, running.label("running")).subquery()
+        return (
+            select(ranked.c.id, ranked.c.role, ranked.c.content)
+            # The first message of the page is kept even if it alone exceeds the budget
+            .where(or_(ranked.c.running <= max_bytes, ranked.c.running == ranked.c.size))
+            .order_by(ranked.c.id)
+        )
+
+    def _page_rows(self, rows: tuple, limit: Optional[int], max_bytes: Optional[int],
+                   before_id: Optional[int], after_id: Optional[int]) -> tuple:
+        """
+        The same page as _page_query, cut from cached rows.
+        """
+        forward = after_id is not None and before_id is None
+        low = bisect_right(rows, after_id, key=_row_id) if after_id is not None else 0
+        high = bisect_left(rows, before_id, key=_row_id) if before_id is not None else len(rows)
+        page = rows[low:max(low, high)]
+        take = limit if limit is not None else (self.TAIL_SCAN_ROWS if max_bytes is not None else None)
+        if take is not None:
+            page = page[:take] if forward else page[max(len(page) - take, 0):]
+        if max_bytes is None:
+            return page
+        kept = used = 0
+        for row in (page if forward else reversed(page)):
+            if kept and used + row[3] > max_bytes:
+                break
+            used += row[3]
+            kept += 1
+        return page[:kept] if forward else page[len(page) - kept:]
+
+    def get_messages_page(self, session_id: str = "default", limit: Optional[int] = None, max_bytes: Optional[int] = None,
+                          before_id: Optional[int] = None, after_id: Optional[int] = None) -> List[Dict]:
+        """
+        Reads only the requested page, so a turn costs the same however long the session is.
+        """
+        session = self.ReadSession()
+        try:
+            rows = self._cached_history(session, session_id, load=False)
+            if rows is not None:
+                rows = self._page_rows(rows, limit, max_bytes, before_id, after_id)
+            else:
+                rows = session.execute(self._page_query(session_id, limit, max_bytes, before_id, after_id)).all()
+            return [{"id": row[0], "role": row[1], "content": row[2]} for row in rows]
+        except Exception as e:
+            logging.error(f"Error retrieving messages for session '{session_id}': {e}")
+            return []
+        finally:
+            session.close()
+
+    def _render_cached(self, session_id: str, rows: tuple) -> str:
+        """
+        Context string for cached rows, rendering only the rows added since the last call.
+        """
+        count, max_id = len(rows), rows[-1][0] if rows else 0
+        entry = self.context_cache.get(session_id)
+        if entry is not None and entry[:2] == (count, max_id):
+            return entry[2]
+        after_id = self.context_cache.delta_after(entry, count, max_id)
+        if after_id is not None:
+            context_string = self.context_cache.extend(session_id, entry, count, rows[bisect_right(rows, after_id, key=_row_id):])
+            if context_string is not None:
+                return context_string
+        context_string = _render(rows)
+        self.context_cache.put(session_id, count, max_id, context_string)
+        logging.info(f"Generated context string for session '{session_id}'. Length: {len(context_string)} characters.")
+        return context_string
+
     def get_context_string(self, session_id: str = "default") -> str:
-        session = self.Session()
+        """
+        Renders the history once and afterwards fetches only messages added since.
+        """
+        session = self.ReadSession()
         try:
-            messages = session.query(Message).filter_by(session_id=session_id).order_by(Message.timestamp).all()
-            context_string = "\n".join([f"{msg.role}: {msg.content}" for msg in messages])
+            cached = self._cached_history(session, session_id)
+            if cached is not None:
+                return self._render_cached(session_id, cached)
+            rows, max_id = self._session_state(session, session_id)
+            entry = self.context_cache.get(session_id)
+            if entry is not None and entry[:2] == (rows, max_id):
+                return entry[2]
+            after_id = self.context_cache.delta_after(entry, rows, max_id)
+            if after_id is not None:
+                delta = session.execute(self._rows_query(session_id).where(Message.id > after_id)).all()
+                context_string = self.context_cache.extend(session_id, entry, rows, delta)
+                if context_string is not None:
+                    return context_string
+            messages = session.execute(self._rows_query(session_id)).all()
+            context_string = _render(messages)
+            self.context_cache.put(session_id, len(messages), messages[-1].id if messages else 0, context_string)
             logging.info(f"Generated context string for session '{session_id}'. Length: {len(context_string)} characters.")
             return context_string
         except Exception as e:
@@ -88,6 +829,204 @@ class stm_prp(BaseMemory):
         finally:
             session.close()
 
+    def _trusted_version(self, session_id: str) -> Optional[str]:
+        if self.history_cache is None or not self._cache_trusted():
+            return None
+        rows = self.history_cache.get(session_id)
+        if rows is None:
+            return None
+        self.history_cache.record("hit")
+        return f"{len(rows)}.{rows[-1][0]}" if rows else "0"
+
+    def get_version(self, session_id: str = "default"):
+        """
+        Message count and highest id of the session; any insert or delete changes it.
+        """
+        version = self._trusted_version(session_id)
+        if version is not None:
+            return version
+        session = self.ReadSession()
+        try:
+            rows, max_id = self._session_state(session, session_id)
+            return f"{rows}.{max_id}" if rows else "0"
+        except Exception as e:
+            logging.error(f"Error reading version for session '{session_id}': {e}")
+            return None
+        finally:
+            session.close()
+
+    def stats(self) -> Dict:
+        """
+        History cache mode, hit ratio, database round trips saved and group commit batching.
+        """
+        stats = {"cache_mode": self.cache_mode}
+        if self.listener is not None:
+            stats["listening"] = self.listener.listening.is_set()
+        if self.history_cache is not None:
+            stats.update(self.history_cache.stats())
+        if self.group_commit is not None:
+            stats["group_commit"] = self.group_commit.stats()
+        return stats
+
+    # AsyncBaseMemory Interface Methods
+    def supports_async(self) -> bool:
+        return self.async_engine is not None
+
+    async def _insert_async(self, session, messages: List[Dict]) -> Dict[str, list]:
+        rows = [_message_row(msg) for msg in messages]
+        result = await session.execute(_INSERT_MESSAGES, rows)
+        written = _written(result.scalars().all(), rows)
+        for notification in self._notifications(written):
+            await session.execute(notification)
+        return written
+
+    async def add_message_async(self, role: str, content: str, session_id: str = "default"):
+        message = {"role": role, "content": content, "session_id": session_id}
+        if self.group_commit is not None:
+            try:
+                await asyncio.wrap_future(self.group_commit.submit(message))
+                logging.info(f"Added message to session '{session_id}': Role='{role}', Content='{content[:50]}...'")
+            except Exception as e:
+                logging.error(f"Error adding message to session '{session_id}': {e}")
+            return
+        await self.add_messages_async([message])
+
+    async def add_messages_async(self, messages):
+        if not messages:
+            return
+        async with self.AsyncSession() as session:
+            try:
+                written = await self._insert_async(session, messages)
+                await session.commit()
+                self._cache_written(written)
+                logging.info(f"Added batch of {len(messages)} messages.")
+            except Exception as e:
+                await session.rollback()
+                logging.error(f"Error adding batch of {len(messages)} messages: {e}")
+
+    async def _cached_history_async(self, session, session_id: str, load: bool = True) -> Optional[tuple]:
+        cache = self.history_cache
+        if cache is None or cache.is_uncacheable(session_id):
+            return None
+        rows = cache.get(session_id)
+        if rows is not None:
+            if self._cache_trusted():
+                cache.record("hit")
+                return rows
+            count, max_id = await self._session_state_async(session, session_id)
+            state = self._checked(session_id, rows, count, max_id)
+            if state == "current":
+                return rows
+            if state == "uncacheable":
+                return None
+            if state == "delta":
+                result = await session.execute(self._delta_query(session_id, rows))
+                rows = self._extended(session_id, rows, result.all(), count)
+                if rows is not None:
+                    return rows
+        if not load:
+            return None
+        generation = cache.generation()
+        result = await session.execute(self._rows_query(session_id).limit(cache.max_rows + 1))
+        return self._loaded(session_id, result.all(), generation)
+
+    async def get_messages_async(self, session_id: str = "default"):
+        async with self.AsyncReadSession() as session:
+            try:
+                rows = await self._cached_history_async(session, session_id)
+                if rows is None:
+                    result = await session.execute(
+                        select(Message.id, Message.role, Message.content).where(Message.session_id == session_id).order_by(Message.id)
+                    )
+                    rows = result.all()
+                logging.info(f"Retrieved {len(rows)} messages for session '{session_id}'.")
+                return [{"role": row[1], "content": row[2]} for row in rows]
+            except Exception as e:
+                logging.error(f"Error retrieving messages for session '{session_id}': {e}")
+                return []
+
+    async def clear_async(self, session_id: str = "default"):
+        async with self.AsyncSession() as session:
+            try:
+                await session.execute(delete(Message).filter_by(session_id=session_id))
+                for notification in self._notifications([session_id]):
+                    await session.execute(notification)
+                await session.commit()
+                self._cache_cleared(session_id)
+                logging.info(f"Cleared memory for session '{session_id}'.")
+            except Exception as e:
+                await session.rollback()
+                logging.error(f"Error clearing memory for session '{session_id}': {e}")
+
+    async def get_messages_page_async(self, session_id: str = "default", limit: Optional[int] = None, max_bytes: Optional[int] = None,
+                                      before_id: Optional[int] = None, after_id: Optional[int] = None) -> List[Dict]:
+        async with self.AsyncReadSession() as session:
+            try:
+                rows = await self._cached_history_async(session, session_id, load=False)
+                if rows is not None:
+                    rows = self._page_rows(rows, limit, max_bytes, before_id, after_id)
+                else:
+                    rows = (await session.execute(self._page_query(session_id, limit, max_bytes, before_id, after_id))).all()
+                return [{"id": row[0], "role": row[1], "content": row[2]} for row in rows]
+            except Exception as e:
+                logging.error(f"Error retrieving messages for session '{session_id}': {e}")
+                return []
+
+    async def _session_state_async(self, session, session_id: str):
+        result = await session.execute(
+            select(func.count(Message.id), func.max(Message.id)).where(Message.session_id == session_id)
+        )
+        rows, max_id = result.one()
+        return rows, max_id or 0
+
+    async def get_context_string_async(self, session_id: str = "default") -> str:
+        async with self.AsyncReadSession() as session:
+            try:
+                cached = await self._cached_history_async(session, session_id)
+                if cached is not None:
+                    return self._render_cached(session_id, cached)
+                rows, max_id = await self._session_state_async(session, session_id)
+                entry = self.context_cache.get(session_id)
+                if entry is not None and entry[:2] == (rows, max_id):
+                    return entry[2]
+                after_id = self.context_cache.delta_after(entry, rows, max_id)
+                if after_id is not None:
+                    result = await session.execute(self._rows_query(session_id).where(Message.id > after_id))
+                    context_string = self.context_cache.extend(session_id, entry, rows, result.all())
+                    if context_string is not None:
+                        return context_string
+                result = await session.execute(self._rows_query(session_id))
+                messages = result.all()
+                context_string = _render(messages)
+                self.context_cache.put(session_id, len(messages), messages[-1].id if messages else 0, context_string)
+                logging.info(f"Generated context string for session '{session_id}'. Length: {len(context_string)} characters.")
+                return context_string
+            except Exception as e:
+                logging.error(f"Error generating context string for session '{session_id}': {e}")
+                return "[Memory Context Unavailable]"
+
+    async def get_version_async(self, session_id: str = "default"):
+        version = self._trusted_version(session_id)
+        if version is not None:
+            return version
+        async with self.AsyncReadSession() as session:
+            try:
+                rows, max_id = await self._session_state_async(session, session_id)
+                return f"{rows}.{max_id}" if rows else "0"
+            except Exception as e:
+                logging.error(f"Error reading version for session '{session_id}': {e}")
+                return None
+
+    async def close_async(self):
+        if self.group_commit is not None:
+            await asyncio.to_thread(self.group_commit.close)
+        if self.listener is not None:
+            self.listener.stop()
+        if self.async_engine is not None:
+            await self.async_engine.dispose()
+        if self.async_read_engine is not self.async_engine:
+            await self.async_read_engine.dispose()
+
 module_config = {
     "name": "Perpetual Memory",
     "description": "Stores conversation history in a PostgreSQL database."
@@ -1,13 +1,16 @@
 import asyncio
-from typing import List, Dict
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Optional
 from datetime import datetime
 
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, LargeBinary
+from sqlalchemy import select, delete, func, Column, Index, Integer, String, DateTime, LargeBinary, JSON
 from sqlalchemy.dialects.postgresql import ARRAY, JSONB
 from sqlalchemy.orm import sessionmaker, declarative_base
 from sqlalchemy.exc import SQLAlchemyError
 import os
 from dotenv import load_dotenv
+from memory.sql_engine import create_memory_engines, create_memory_async_engines, async_session_factory
 
 # Load environment variables
 load_dotenv()
@@ -18,40 +21,68 @@ if not DATABASE_URL:
     raise ValueError("MEMORY_SQL environment variable not set.")
 
 Base = declarative_base()
-engine = create_engine(DATABASE_URL)
+# Writes go through engine; reads use read_engine, which is a separate reader pool on SQLite
+engine, read_engine = create_memory_engines(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+# Async engines for the non-blocking interface; None when no async driver is installed
+async_engine, async_read_engine = create_memory_async_engines(DATABASE_URL)
+AsyncSessionLocal = async_session_factory(async_engine, autoflush=False, expire_on_commit=False)
+AsyncReadSessionLocal = async_session_factory(async_read_engine, autoflush=False, expire_on_commit=False)
 
 # Database Schema (`topics`)
 class Topic(Base):
     __tablename__ = 'topics'
+    # Mirrors alembic revision a738f8687434. GIN serves the synonym overlap (&&) lookup; SQLite has no equivalent
+    __table_args__ = (
+        Index('ix_topics_foreign_key_datetime', 'foreign_key', 'datetime'),
+        Index('ix_topics_synonym', 'synonym', postgresql_using='gin').ddl_if(dialect='postgresql'),
+    )
 
     id = Column(Integer, primary_key=True)
     topic = Column(String, nullable=False, unique=True) # Added unique constraint
     datetime = Column(DateTime, nullable=False)
     turn_id = Column(Integer, nullable=False)
     embedding = Column(LargeBinary, nullable=True)
-    synonym = Column(ARRAY(String), default=[])
+    # ARRAY and JSONB are PostgreSQL-only; SQLite stores both as JSON text
+    synonym = Column(ARRAY(String).with_variant(JSON(), "sqlite"), default=[])
     foreign_key = Column(String, nullable=True)
     last_refactored = Column(DateTime, nullable=True)
-    extra_metadata = Column(JSONB, default={})
+    extra_metadata = Column(JSONB().with_variant(JSON(), "sqlite"), default={})
 
     def __repr__(self):
         return f"<Topic(topic='{self.topic}', datetime='{self.datetime}', turn_id={self.turn_id}, extra_metadata={self.extra_metadata})>"
 
+def _synonym_match(synonyms: List[str]):
+    """
+    True for topics that list any of the given synonyms. SQLite has no arrays,
+    so there the JSON list is expanded with json_each.
+    """
+    if engine.dialect.name == "sqlite":
+        entries = func.json_each(Topic.synonym).table_valued("value")
+        return select(entries.c.value).where(entries.c.value.in_(synonyms)).exists()
+    return Topic.synonym.overlap(synonyms)
+
 from memory.rag_dummy import receive_topics
-from memory.base import BaseMemory
+from memory.base import BaseMemory, AsyncBaseMemory
 
-class utm_anyai(BaseMemory):
+class utm_anyai(BaseMemory, AsyncBaseMemory):
     id = "utm_anyai"
     name = "Universal Topic Mapper (AnyAI)"
 
     def __init__(self):
         print("UtmAnyAI module initialized.")
         self._turn_counters = {} # To generate turn_id per session
+        # session_id -> (version, context string), reused until the session's topics change
+        self._context_cache = OrderedDict()
+        self.context_cache_sessions = 1024
+        # Held around every _context_cache access: the sync methods run on worker threads
+        self._context_lock = threading.Lock()
         # Base.metadata.create_all(bind=engine) # This should be handled by Alembic
 
-    def _get_db(self):
-        db = SessionLocal()
+    def _get_db(self, readonly: bool = False):
+        db = ReadSessionLocal() if readonly else SessionLocal()
         try:
             yield db
         finally:
@@ -102,6 +133,28 @@ class utm_anyai(BaseMemory):
             synonyms.extend(["db", "data store"])
         return list(set(synonyms)) # Remove duplicates
 
+    def _resolve_turn_id(self, session_id: str, turn_id):
+        """
+        Returns the given turn_id, or generates the next one for the session.
+        """
+        if turn_id is None:
+            self._turn_counters[session_id] = self._turn_counters.get(session_id, 0) + 1
+            turn_id = self._turn_counters[session_id]
+            print(f"Generated turn_id {turn_id} for session {session_id}")
+        return turn_id
+
+    def _topic_to_message(self, topic_obj: Topic, session_id: str) -> Dict:
+        """
+        Transforms a topic row into a message-like dict for compatibility.
+        """
+        return {
+            "role": "system", # Or "topic_extractor"
+            "content": f"Topic: {topic_obj.topic} (Synonyms: {', '.join(topic_obj.synonym)})",
+            "timestamp": topic_obj.datetime,
+            "session_id": session_id,
+            "turn_id": topic_obj.turn_id
+        }
+
     def extract_and_store_topics(self, message: Dict):
         """
         Accepts a message dict, extracts topics, stores them, and forwards to RAG.
@@ -116,11 +169,7 @@ class utm_anyai(BaseMemory):
             print("Warning: Message content missing for topic extraction.")
             return
 
-        # If turn_id is not provided, generate one based on session
-        if turn_id is None:
-            self._turn_counters[session_id] = self._turn_counters.get(session_id, 0) + 1
-            turn_id = self._turn_counters[session_id]
-            print(f"Generated turn_id {turn_id} for session {session_id}")
+        turn_id = self._resolve_turn_id(session_id, turn_id)
 
         extracted_topics = self._extract_topics_from_content(content)
         all_topics_for_rag = []
@@ -134,7 +183,7 @@ class utm_anyai(BaseMemory):
             try:
                 # Check if topic or any synonym already exists
                 existing_topic = db_session.query(Topic).filter(
-                    (Topic.topic == topic_str) | (Topic.synonym.any(synonyms))
+                    (Topic.topic == topic_str) | _synonym_match(synonyms)
                 ).first()
 
                 if existing_topic:
@@ -142,10 +191,10 @@ class utm_anyai(BaseMemory):
                     # For simplicity, we'll just update last_refactored for now
                     # A more complex history tracking would involve a separate table or JSONB list
                     existing_topic.last_refactored = datetime.now()
-                    # Ensure synonyms are unique and updated
-                    for syn in synonyms:
-                        if syn not in existing_topic.synonym:
-                            existing_topic.synonym.append(syn)
+                    # Ensure synonyms are unique and updated; reassign so the column change is tracked
+                    existing_topic.synonym = existing_topic.synonym + [
+                        syn for syn in synonyms if syn not in existing_topic.synonym
+                    ]
                     print(f"Updated existing topic: {existing_topic.topic}")
                 else:
                     # Insert a new row
@@ -190,20 +239,11 @@ class utm_anyai(BaseMemory):
         For UTM, it will return topics as "messages" for now, or an empty list.
         A more complete implementation might retrieve messages from another source.
         """
-        db_session = next(self._get_db())
+        db_session = next(self._get_db(readonly=True))
         try:
             topics = db_session.query(Topic).filter(Topic.foreign_key == session_id).order_by(Topic.datetime).all()
             # Transform topics into a message-like format for compatibility
-            messages = []
-            for topic_obj in topics:
-                messages.append({
-                    "role": "system", # Or "topic_extractor"
-                    "content": f"Topic: {topic_obj.topic} (Synonyms: {', '.join(topic_obj.synonym)})",
-                    "timestamp": topic_obj.datetime,
-                    "session_id": session_id,
-                    "turn_id": topic_obj.turn_id
-                })
-            return messages
+            return [self._topic_to_message(topic_obj, session_id) for topic_obj in topics]
         except SQLAlchemyError as e:
             print(f"Database error during get_messages: {e}")
             return []
@@ -228,12 +268,166 @@ class utm_anyai(BaseMemory):
         finally:
             db_session.close()
 
+    def _version_query(self, session_id: str):
+        # Topics are updated in place (synonyms, last_refactored), so the newest touch is part of the version
+        return select(func.count(Topic.id), func.max(Topic.id), func.max(Topic.last_refactored)).where(Topic.foreign_key == session_id)
+
+    @staticmethod
+    def _format_version(row) -> str:
+        rows, max_id, touched = row
+        return f"{rows}.{max_id}.{touched.timestamp() if touched else 0}" if rows else "0"
+
+    def _cached_context(self, session_id: str, version: Optional[str]) -> Optional[str]:
+        with self._context_lock:
+            cached = self._context_cache.get(session_id)
+            if cached is None or version is None or cached[0] != version:
+                return None
+            self._context_cache.move_to_end(session_id)
+            return cached[1]
+
+    def _cache_context(self, session_id: str, version: Optional[str], context_string: str):
+        if version is None:
+            return
+        with self._context_lock:
+            self._context_cache[session_id] = (version, context_string)
+            self._context_cache.move_to_end(session_id)
+            while len(self._context_cache) > self.context_cache_sessions:
+                self._context_cache.popitem(last=False)
+
+    def get_version(self, session_id: str = "default") -> Optional[str]:
+        """
+        Changes whenever a topic of the session is added, removed or refactored.
+        """
+        db_session = next(self._get_db(readonly=True))
+        try:
+            return self._format_version(db_session.execute(self._version_query(session_id)).one())
+        except SQLAlchemyError as e:
+            print(f"Database error during get_version: {e}")
+            return None
+        finally:
+            db_session.close()
+
     def get_context_string(self, session_id: str = "default") -> str:
         """
-        Retrieves topics as a context string.
+        Retrieves topics as a context string, re-rendered only when the topics changed.
+        """
+        version = self.get_version(session_id)
+        context_string = self._cached_context(session_id, version)
+        if context_string is None:
+            messages = self.get_messages(session_id=session_id)
+            context_string = "\n".join([msg["content"] for msg in messages])
+            self._cache_context(session_id, version, context_string)
+        return context_string
+
+    # AsyncBaseMemory Interface Methods
+    def supports_async(self) -> bool:
+        return AsyncSessionLocal is not None
+
+    async def extract_and_store_topics_async(self, message: Dict):
         """
-        messages = self.get_messages(session_id=session_id)
-        return "\n".join([msg["content"] for msg in messages])
+        Async counterpart of extract_and_store_topics using the async engine.
+        """
+        content = message.get("content")
+        timestamp = message.get("timestamp", datetime.now())
+        session_id = message.get("session_id", "default")
+
+        if not content:
+            print("Warning: Message content missing for topic extraction.")
+            return
+
+        turn_id = self._resolve_turn_id(session_id, message.get("turn_id"))
+        extracted_topics = self._extract_topics_from_content(content)
+        all_topics_for_rag = []
+
+        async with AsyncSessionLocal() as db_session:
+            for topic_str in extracted_topics:
+                synonyms = self._generate_synonyms(topic_str)
+                all_topics_for_rag.append(topic_str)
+                all_topics_for_rag.extend(synonyms) # Include synonyms for RAG
+                try:
+                    result = await db_session.execute(
+                        select(Topic).filter((Topic.topic == topic_str) | _synonym_match(synonyms)).limit(1)
+                    )
+                    existing_topic = result.scalars().first()
+
+                    if existing_topic:
+                        existing_topic.last_refactored = datetime.now()
+                        # Reassign rather than append so the ARRAY change is tracked
+                        existing_topic.synonym = existing_topic.synonym + [
+                            syn for syn in synonyms if syn not in existing_topic.synonym
+                        ]
+                        print(f"Updated existing topic: {existing_topic.topic}")
+                    else:
+                        db_session.add(Topic(
+                            topic=topic_str,
+                            datetime=timestamp,
+                            turn_id=turn_id,
+                            synonym=synonyms,
+                            foreign_key=session_id, # Store session_id as foreign_key
+                            last_refactored=datetime.now()
+                        ))
+                        print(f"Inserted new topic: {topic_str}")
+                    await db_session.commit()
+                except SQLAlchemyError as e:
+                    await db_session.rollback()
+                    print(f"Database error during topic storage: {e}")
+
+        receive_topics(list(set(all_topics_for_rag))) # Ensure unique topics for RAG
+
+    async def add_message_async(self, role: str, content: str, session_id: str = "default"):
+        await self.extract_and_store_topics_async({
+            "role": role,
+            "content": content,
+            "timestamp": datetime.now(),
+            "session_id": session_id,
+            "turn_id": None
+        })
+
+    async def get_messages_async(self, session_id: str = "default") -> List[Dict]:
+        async with AsyncReadSessionLocal() as db_session:
+            try:
+                result = await db_session.execute(
+                    select(Topic).filter(Topic.foreign_key == session_id).order_by(Topic.datetime)
+                )
+                return [self._topic_to_message(topic_obj, session_id) for topic_obj in result.scalars()]
+            except SQLAlchemyError as e:
+                print(f"Database error during get_messages: {e}")
+                return []
+
+    async def clear_async(self, session_id: str = "default"):
+        async with AsyncSessionLocal() as db_session:
+            try:
+                await db_session.execute(delete(Topic).filter(Topic.foreign_key == session_id))
+                await db_session.commit()
+                print(f"Cleared topics for session: {session_id}")
+                self._turn_counters.pop(session_id, None)
+            except SQLAlchemyError as e:
+                await db_session.rollback()
+                print(f"Database error during clear: {e}")
+
+    async def get_version_async(self, session_id: str = "default") -> Optional[str]:
+        async with AsyncReadSessionLocal() as db_session:
+            try:
+                result = await db_session.execute(self._version_query(session_id))
+                return self._format_version(result.one())
+            except SQLAlchemyError as e:
+                print(f"Database error during get_version: {e}")
+                return None
+
+    async def get_context_string_async(self, session_id: str = "default") -> str:
+        version = await self.get_version_async(session_id)
+        context_string = self._cached_context(session_id, version)
+        if context_string is None:
+            messages = await self.get_messages_async(session_id=session_id)
+            context_string = "\n".join([msg["content"] for msg in messages])
+            self._cache_context(session_id, version, context_string)
+        return context_string
+
+    async def close_async(self):
+        if async_engine is not None:
+            await async_engine.dispose()
+        if async_read_engine is not async_engine:
+            await async_read_engine.dispose()
 
     async def _populate_missing_embeddings(self):
         """
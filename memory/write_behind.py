@@ -0,0 +1,174 @@
+# memory/write_behind.py
+
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List
+
+class MemoryWriteBehind:
+    """
+    Buffers add_message calls and persists them in batches from a background task.
+    Messages stay visible through pending_for() until their batch is committed,
+    and readers that overlay them hold `lock` so a batch is never seen twice.
+    A batch that fails to write goes back to the front of the queue and is
+    retried with exponential backoff, up to max_backoff seconds apart.
+    """
+
+    def __init__(self, write_batch: Callable[[object, List[Dict]], Awaitable[None]],
+                 flush_interval: float = 0.05, max_batch: int = 256, max_backoff: float = 5.0):
+        self._write_batch = write_batch
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_backoff = max_backoff
+        self.failed_flushes = 0
+        self.consecutive_failures = 0
+        self.last_error = None
+        self._retry_at = 0.0
+        self.lock = asyncio.Lock()
+        self._queue = deque()  # (module, message) in arrival order
+        self._by_session = {}  # session_id -> deque of (module, message)
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._stopping = False
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    def enqueue(self, module, role: str, content: str, session_id: str):
+        message = {"role": role, "content": content, "session_id": session_id, "timestamp": datetime.utcnow()}
+        self._queue.append((module, message))
+        self._by_session.setdefault(session_id, deque()).append((module, message))
+        if len(self._queue) >= self.max_batch:
+            self._wakeup.set()
+
+    def has_pending(self, session_id: str) -> bool:
+        return session_id in self._by_session
+
+    def pending_for(self, session_id: str, module) -> List[Dict]:
+        """
+        Messages queued for the session on the given module and not yet committed.
+        """
+        return [
+            {"role": message["role"], "content": message["content"]}
+            for pending_module, message in self._by_session.get(session_id, ())
+            if pending_module is module
+        ]
+
+    def discard(self, session_id: str, module=None):
+        """
+        Drops queued messages for a session, on one module or all of them. Call while holding `lock`.
+        """
+        pending = self._by_session.get(session_id)
+        if pending is None:
+            return
+        def dropped(item):
+            return item[1]["session_id"] == session_id and (module is None or item[0] is module)
+        kept = deque(item for item in pending if not dropped(item))
+        if kept:
+            self._by_session[session_id] = kept
+        else:
+            del self._by_session[session_id]
+        self._queue = deque(item for item in self._queue if not dropped(item))
+
+    def depth(self) -> int:
+        return len(self._queue)
+
+    def stats(self) -> Dict:
+        return {
+            "queued": len(self._queue),
+            "sessions": len(self._by_session),
+            "failed_flushes": self.failed_flushes,
+            "consecutive_failures": self.consecutive_failures,
+            "last_error": self.last_error,
+        }
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            # A full queue keeps waking us; hold off until the backoff after a failure ends
+            if loop.time() >= self._retry_at:
+                await self.flush()
+
+    def _committed(self, item):
+        """
+        Removes a written message from its session's overlay. Call while holding `lock`.
+        """
+        message = item[1]
+        session_id = message["session_id"]
+        pending = self._by_session.get(session_id)
+        if not pending:
+            return
+        if pending[0][1] is message:
+            pending.popleft()
+        else:
+            # An earlier message of the session failed on another module and is still queued
+            for index, queued in enumerate(pending):
+                if queued[1] is message:
+                    del pending[index]
+                    break
+        if not pending:
+            del self._by_session[session_id]
+
+    def _failed(self, error: Exception):
+        self.failed_flushes += 1
+        self.consecutive_failures += 1
+        self.last_error = str(error)
+        backoff = min(self.max_backoff, self.flush_interval * 2 ** self.consecutive_failures)
+        self._retry_at = asyncio.get_running_loop().time() + backoff
+        logging.error(f"Write-behind flush failed ({self.consecutive_failures} in a row, {len(self._queue)} messages queued); "
+                      f"retrying in {backoff:.2f}s: {error}")
+
+    async def flush(self) -> bool:
+        """
+        Writes everything queued so far, one batch (and transaction per module) at a time.
+        Stops at the first failed write, leaving its messages queued and visible; returns
+        whether the queue was drained.
+        """
+        while self._queue:
+            async with self.lock:
+                batch = [self._queue.popleft() for _ in range(min(self.max_batch, len(self._queue)))]
+                groups = {}
+                for item in batch:
+                    groups.setdefault(id(item[0]), (item[0], []))[1].append(item)
+                failed = []
+                error = None
+                for module, items in groups.values():
+                    try:
+                        await self._write_batch(module, [message for _, message in items])
+                    except Exception as e:
+                        error = e
+                        failed.extend(items)
+                        continue
+                    for item in items:
+                        self._committed(item)
+                if error is not None:
+                    # Back in front, in arrival order, so a retry keeps each session's order
+                    order = {id(item): index for index, item in enumerate(batch)}
+                    self._queue.extendleft(reversed(sorted(failed, key=lambda item: order[id(item)])))
+                    self._failed(error)
+                    return False
+                self.consecutive_failures = 0
+        return True
+
+    async def aclose(self):
+        """
+        Stops the background task and drains everything still queued.
+        """
+        self._stopping = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        if not await self.flush():
+            logging.error(f"Write-behind closed with {len(self._queue)} messages that could not be written.")
@@ -0,0 +1,247 @@
+# metrics/collectors.py
+
+import threading
+import time
+import weakref
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+# Latency buckets in seconds, from sub-millisecond memory reads up to long generations
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class Registry:
+    """
+    Holds every collector and renders them in the Prometheus text format.
+    Each metric name can be registered once; a second family with the same
+    name would make the exposition invalid.
+    """
+
+    def __init__(self):
+        self._collectors = []
+        self._names = set()
+        self._lock = threading.Lock()
+
+    def register(self, collector):
+        with self._lock:
+            if collector.name in self._names:
+                raise ValueError(f"Metric '{collector.name}' is already registered.")
+            self._names.add(collector.name)
+            self._collectors.append(collector)
+        return collector
+
+    def render(self) -> str:
+        lines = []
+        for collector in list(self._collectors):
+            lines.append(f"# HELP {collector.name} {collector.documentation}")
+            lines.append(f"# TYPE {collector.name} {collector.kind}")
+            lines.extend(collector.samples())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric(ABC):
+    """
+    Base for labelled metrics. Children are created once per label set; after
+    that, recording only touches the child's own uncontended lock.
+    """
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), registry: Registry = REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+        registry.register(self)
+
+    def labels(self, *values):
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    @abstractmethod
+    def _new_child(self):
+        """
+        Returns the per-label-set child that records values.
+        """
+
+    def _unlabelled(self):
+        return self._children[()]
+
+class _CounterChild:
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    def get(self) -> float:
+        return self._value
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self._unlabelled().inc(amount)
+
+    def samples(self) -> Iterable[str]:
+        for key, child in list(self._children.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.get())}"
+
+class _GaugeChild(_CounterChild):
+    def dec(self, amount: float = 1.0):
+        self.inc(-amount)
+
+    def set(self, value: float):
+        self._value = value
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def dec(self, amount: float = 1.0):
+        self._unlabelled().dec(amount)
+
+    def set(self, value: float):
+        self._unlabelled().set(value)
+
+class _Timer:
+    def __init__(self, child):
+        self._child = child
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._child.observe(time.perf_counter() - self._start)
+        return False
+
+class _HistogramChild:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self._buckets = buckets
+        self._counts = [0] * (len(buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self._buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def time(self) -> _Timer:
+        return _Timer(self)
+
+    def snapshot(self):
+        with self._lock:
+            return list(self._counts), self._sum
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, registry: Registry = REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._unlabelled().observe(value)
+
+    def time(self) -> _Timer:
+        return self._unlabelled().time()
+
+    def samples(self) -> Iterable[str]:
+        for key, child in list(self._children.items()):
+            counts, total = child.snapshot()
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+class CallbackMetric:
+    """
+    A counter or gauge whose values are read from a callback at scrape time,
+    for state that is already tracked elsewhere (cache stats, queue depth).
+    The callback returns a number, or a dict of label-value tuples to numbers.
+    """
+
+    def __init__(self, name: str, documentation: str, callback: Callable, kind: str = "gauge",
+                 labelnames: Sequence[str] = (), registry: Registry = REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self._callback = callback
+        registry.register(self)
+
+    def samples(self) -> List[str]:
+        value = self._callback()
+        if not isinstance(value, dict):
+            value = {(): value}
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(sample)}"
+            for key, sample in value.items()
+        ]
+
+class InstanceMetric(CallbackMetric):
+    """
+    A CallbackMetric for state kept on objects that can be created more than once
+    (stores, caches, managers). Declared once at module level; each object calls
+    track(self), and a scrape sums value(obj) over the live ones. Objects are held
+    weakly, so being tracked never keeps one alive.
+    """
+
+    def __init__(self, name: str, documentation: str, value: Callable, kind: str = "gauge",
+                 labelnames: Sequence[str] = (), registry: Registry = REGISTRY):
+        self._instances = weakref.WeakSet()
+        self._value = value
+        super().__init__(name, documentation, self._total, kind, labelnames, registry)
+
+    def track(self, instance):
+        self._instances.add(instance)
+        return instance
+
+    def _total(self) -> Dict:
+        totals = {}
+        for instance in list(self._instances):
+            value = self._value(instance)
+            if not isinstance(value, dict):
+                value = {(): value}
+            for key, sample in value.items():
+                totals[key] = totals.get(key, 0) + sample
+        return totals
@@ -0,0 +1,169 @@
+# server/admission.py
+
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Dict
+
+from metrics.collectors import Counter, Histogram, InstanceMetric
+
+ADMISSION_WAIT = Histogram("anyai_admission_wait_seconds", "Time chat requests spent queued before admission.")
+ADMISSION_REJECTED = Counter("anyai_admission_rejected_total", "Chat requests turned away by admission control.", ["reason"])
+ADMISSION_INFLIGHT = InstanceMetric("anyai_admission_inflight", "Chat turns currently admitted.", lambda controller: controller._inflight)
+ADMISSION_QUEUE_DEPTH = InstanceMetric("anyai_admission_queue_depth", "Chat turns waiting for admission.", lambda controller: controller._waiting)
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a request is not admitted. status_code is 429 for a session
+    over its rate and 503 when the server is saturated.
+    """
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+class AdmissionTicket:
+    """
+    One admitted request's slot. release() is idempotent, so it can be called
+    from several cleanup paths (generator finally, background task).
+    """
+
+    def __init__(self, controller: "AdmissionController"):
+        self._controller = controller
+        self._admitted_at = time.monotonic()
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._controller._release(time.monotonic() - self._admitted_at)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.release()
+        return False
+
+class AdmissionController:
+    """
+    Bounds concurrent chat turns (and with them upstream LLM streams and DB sessions).
+
+    - At most max_inflight turns run at once.
+    - Up to max_queue more wait, each for at most queue_timeout seconds; beyond that 503.
+    - Each session_id has a token bucket (session_rate per second, session_burst deep); beyond that 429.
+    - Waiters are queued per session and served round-robin across sessions,
+      so a session with many queued turns cannot starve the others.
+    """
+    # Token buckets kept for at most this many recently seen sessions
+    MAX_TRACKED_SESSIONS = 10000
+
+    def __init__(self, max_inflight: int = 32, max_queue: int = 128, queue_timeout: float = 10.0,
+                 session_rate: float = 1.0, session_burst: int = 5):
+        self.max_inflight = max_inflight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.session_rate = session_rate
+        self.session_burst = session_burst
+        self._inflight = 0
+        self._waiting = 0
+        self._queues = OrderedDict()  # session_id -> deque of waiter futures, in round-robin order
+        self._buckets = OrderedDict()  # session_id -> (tokens, last refill time)
+        self._hold_seconds = 1.0  # EWMA of how long a turn holds its slot
+        ADMISSION_INFLIGHT.track(self)
+        ADMISSION_QUEUE_DEPTH.track(self)
+
+    async def acquire(self, session_id: str) -> AdmissionTicket:
+        """
+        Waits for a slot and returns its ticket, or raises AdmissionRejected.
+        """
+        can_run = self._inflight < self.max_inflight and not self._waiting
+        if not can_run and self._waiting >= self.max_queue:
+            ADMISSION_REJECTED.labels("queue_full").inc()
+            raise AdmissionRejected(503, "Server is at capacity, please retry later.", self._retry_after())
+        self._take_token(session_id)
+        if can_run:
+            self._inflight += 1
+            ADMISSION_WAIT.observe(0.0)
+            return AdmissionTicket(self)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(session_id, deque()).append(waiter)
+        self._waiting += 1
+        started = time.monotonic()
+        try:
+            await asyncio.wait({waiter}, timeout=self.queue_timeout)
+        except asyncio.CancelledError:
+            if waiter.done():
+                # Granted just as the caller went away; hand the slot back
+                self._release(0.0)
+            else:
+                self._withdraw(session_id, waiter)
+            raise
+        if not waiter.done():
+            self._withdraw(session_id, waiter)
+            ADMISSION_REJECTED.labels("queue_timeout").inc()
+            raise AdmissionRejected(503, "Timed out waiting for capacity, please retry later.", self._retry_after())
+        ADMISSION_WAIT.observe(time.monotonic() - started)
+        return AdmissionTicket(self)
+
+    def _take_token(self, session_id: str):
+        if not self.session_rate:
+            return
+        now = time.monotonic()
+        tokens, last = self._buckets.pop(session_id, (float(self.session_burst), now))
+        tokens = min(float(self.session_burst), tokens + (now - last) * self.session_rate)
+        if tokens < 1.0:
+            self._buckets[session_id] = (tokens, now)
+            ADMISSION_REJECTED.labels("session_rate").inc()
+            raise AdmissionRejected(
+                429, f"Too many requests for session '{session_id}'.",
+                max(1, math.ceil((1.0 - tokens) / self.session_rate))
+            )
+        self._buckets[session_id] = (tokens - 1.0, now)
+        if len(self._buckets) > self.MAX_TRACKED_SESSIONS:
+            # The least recently seen session has most likely refilled anyway
+            self._buckets.popitem(last=False)
+
+    def _withdraw(self, session_id: str, waiter: asyncio.Future):
+        queue = self._queues.get(session_id)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            self._waiting -= 1
+            if not queue:
+                del self._queues[session_id]
+
+    def _release(self, held_seconds: float):
+        self._inflight -= 1
+        if held_seconds:
+            self._hold_seconds = 0.9 * self._hold_seconds + 0.1 * held_seconds
+        self._grant()
+
+    def _grant(self):
+        while self._inflight < self.max_inflight and self._queues:
+            # Serve the session at the head of the rotation, then move it to the back
+            session_id, queue = self._queues.popitem(last=False)
+            waiter = queue.popleft()
+            self._waiting -= 1
+            if queue:
+                self._queues[session_id] = queue
+            if waiter.done():
+                continue
+            self._inflight += 1
+            waiter.set_result(None)
+
+    def _retry_after(self) -> int:
+        # Roughly how long until the current queue drains
+        return max(1, math.ceil(self._hold_seconds * (self._waiting + 1) / max(self.max_inflight, 1)))
+
+    def stats(self) -> Dict:
+        return {
+            "inflight": self._inflight,
+            "waiting": self._waiting,
+            "waiting_sessions": len(self._queues),
+            "max_inflight": self.max_inflight,
+            "max_queue": self.max_queue,
+        }
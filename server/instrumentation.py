@@ -0,0 +1,54 @@
+# server/instrumentation.py
+
+from metrics.collectors import Counter, Gauge
+
+INFLIGHT_REQUESTS = Gauge("anyai_http_inflight_requests", "HTTP requests currently being served, including streaming bodies.", ["path"])
+ERRORS = Counter("anyai_errors_total", "Errors raised while serving requests, by exception type.", ["type"])
+
+def record_error(exc: BaseException):
+    """
+    Counts exc once, however many layers see it: a streaming error is recorded
+    by stream_turn (which also serves websockets, outside the middleware) and
+    then escapes through MetricsMiddleware as the same exception object.
+    """
+    if getattr(exc, "_anyai_error_recorded", False):
+        return
+    try:
+        exc._anyai_error_recorded = True
+    except AttributeError:
+        # Some built-in exceptions take no attributes; count them anyway
+        pass
+    ERRORS.labels(type(exc).__name__).inc()
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware tracking in-flight HTTP requests per route path and
+    counting exceptions that escape the app (unless a handler already did). Unlike BaseHTTPMiddleware it does
+    not wrap the response stream, so streaming and disconnects are unaffected.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._paths = None
+
+    def _path_label(self, scope) -> str:
+        if self._paths is None:
+            # Only label known static routes so parameterized paths cannot blow up cardinality
+            router = scope.get("app")
+            self._paths = {getattr(route, "path", None) for route in getattr(router, "routes", [])}
+        path = scope.get("path", "")
+        return path if path in self._paths else "other"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        gauge = INFLIGHT_REQUESTS.labels(self._path_label(scope))
+        gauge.inc()
+        try:
+            await self.app(scope, receive, send)
+        except Exception as e:
+            record_error(e)
+            raise
+        finally:
+            gauge.dec()
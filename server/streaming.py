@@ -0,0 +1,90 @@
+# server/streaming.py
+
+import time
+from typing import Dict
+from llms.context_builder import estimate_tokens
+from metrics.collectors import Histogram, InstanceMetric
+
+# Appended to assistant turns that were cut short so they are never mistaken for complete answers
+PARTIAL_RESPONSE_MARKER = "[partial response: stopped by client]"
+
+STREAM_TTFT = Histogram("anyai_stream_time_to_first_token_seconds",
+                        "Time from request arrival to the first streamed chunk, including admission queueing and context preparation.")
+STREAM_CHUNK_GAP = Histogram("anyai_stream_chunk_gap_seconds", "Time between consecutive streamed chunks.")
+STREAM_DURATION = Histogram("anyai_stream_duration_seconds", "Total duration of streamed turns, from request arrival.")
+STREAM_TOKENS_PER_SECOND = Histogram(
+    "anyai_stream_tokens_per_second", "Estimated output tokens per second of each stream.",
+    buckets=(1, 5, 10, 25, 50, 75, 100, 150, 200, 300, 500, 1000)
+)
+
+def mark_partial(text: str) -> str:
+    """
+    Returns the text as it is stored for a stream the client stopped early.
+    """
+    return f"{text}\n{PARTIAL_RESPONSE_MARKER}" if text else PARTIAL_RESPONSE_MARKER
+
+STREAMS_COMPLETED = InstanceMetric("anyai_stream_completed_total", "Streams that ran to completion.",
+                                   lambda stats: stats.completed, kind="counter")
+STREAMS_ABORTED = InstanceMetric("anyai_stream_aborted_total", "Streams stopped early because the client disconnected or cancelled.",
+                                 lambda stats: stats.aborted, kind="counter")
+STREAM_TOKENS_SAVED = InstanceMetric("anyai_stream_tokens_saved_total", "Upper bound of output tokens not generated thanks to aborts.",
+                                     lambda stats: stats.tokens_saved, kind="counter")
+
+class StreamStats:
+    """
+    Counters for /stream requests, used to size upstream capacity.
+    tokens_saved is an upper bound: the unused part of each aborted stream's max_tokens budget.
+    """
+
+    def __init__(self):
+        self.completed = 0
+        self.aborted = 0
+        self.tokens_streamed_before_abort = 0
+        self.tokens_saved = 0
+        for metric in (STREAMS_COMPLETED, STREAMS_ABORTED, STREAM_TOKENS_SAVED):
+            metric.track(self)
+
+    def record_completed(self):
+        self.completed += 1
+
+    def record_aborted(self, streamed_text: str, max_tokens: int):
+        streamed = estimate_tokens(streamed_text)
+        self.aborted += 1
+        self.tokens_streamed_before_abort += streamed
+        self.tokens_saved += max(0, max_tokens - streamed)
+
+    def stats(self) -> Dict:
+        return {
+            "completed": self.completed,
+            "aborted": self.aborted,
+            "tokens_streamed_before_abort": self.tokens_streamed_before_abort,
+            "tokens_saved": self.tokens_saved,
+        }
+
+class StreamTimer:
+    """
+    Records time-to-first-token, inter-chunk gaps, duration and throughput for one stream.
+    TTFT and duration count from `arrived`, the perf_counter() reading taken when the
+    request came in, so they include the waits users see; throughput counts from the
+    start of generation.
+    """
+
+    def __init__(self, arrived: float = None):
+        self.started = time.perf_counter()
+        self.arrived = self.started if arrived is None else arrived
+        self._last_chunk = None
+
+    def on_chunk(self):
+        now = time.perf_counter()
+        if self._last_chunk is None:
+            STREAM_TTFT.observe(now - self.arrived)
+        else:
+            STREAM_CHUNK_GAP.observe(now - self._last_chunk)
+        self._last_chunk = now
+
+    def finish(self, text: str):
+        now = time.perf_counter()
+        STREAM_DURATION.observe(now - self.arrived)
+        generating = now - self.started
+        if self._last_chunk is not None and generating > 0:
+            STREAM_TOKENS_PER_SECOND.observe(estimate_tokens(text) / generating)
@@ -0,0 +1,149 @@
+# server/ws.py
+
+import asyncio
+import json
+import logging
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+# Frame types a client may send
+CLIENT_FRAMES = ("query", "cancel", "history")
+
+class ChatSocket:
+    """
+    Serves one /ws connection carrying a framed JSON protocol.
+
+    Client -> server:
+        {"type": "query", "id": "...", "session_id": "...", "query": "...", ...other QueryRequest fields}
+        {"type": "cancel", "id": "..."}
+        {"type": "history", "session_id": "...", "memory_module": "..." (optional)}
+    Server -> client:
+        {"type": "chunk", "id": "...", "data": "..."}
+        {"type": "end", "id": "...", "stopped": bool, "context": {...}}
+        {"type": "history_delta", "id": "...", "session_id": "...", "messages": [...]}
+        {"type": "history", "session_id": "...", "messages": [...]}
+        {"type": "error", "id": "...", "detail": "..."}
+
+    Each query runs as its own task keyed by its id, so several sessions can
+    stream over one socket, and a cancel frame cancels that task at once, even
+    before the first chunk or while the upstream is stalled. Turn frames go
+    through a bounded queue drained by a single writer; when the client reads
+    slowly the queue fills, turns wait on it and stop pulling from the upstream
+    LLM stream. Replies to control frames skip that queue, so the reader never
+    waits on it and a cancel is always read.
+    """
+
+    def __init__(self, websocket: WebSocket,
+                 run_turn: Callable[[Dict, Callable[[Dict], Awaitable[None]], Callable[[], Awaitable[bool]]], Awaitable[None]],
+                 get_history: Callable[[str, Optional[str]], Awaitable[List[Dict]]],
+                 send_queue_size: int = 64, max_turns: int = 8):
+        self.websocket = websocket
+        self._run_turn = run_turn
+        self._get_history = get_history
+        self.max_turns = max_turns
+        self._outgoing = asyncio.Queue(maxsize=send_queue_size)
+        # Replies to the reader's frames; one per client frame, so the client bounds it
+        self._control = deque()
+        self._ready = asyncio.Event()
+        self._turns = {}  # query id -> (task, cancel event)
+
+    async def emit(self, frame: Dict):
+        """
+        Queues a frame for the client, waiting while the send queue is full.
+        """
+        await self._outgoing.put(frame)
+        self._ready.set()
+
+    def _reply(self, frame: Dict):
+        """
+        Sends a frame ahead of queued turn frames, without waiting.
+        """
+        self._control.append(frame)
+        self._ready.set()
+
+    async def serve(self):
+        """
+        Reads frames until the client disconnects, then stops every running turn.
+        Turns stopped this way save their partial reply like an aborted /stream.
+        """
+        writer = asyncio.create_task(self._write_frames())
+        try:
+            while True:
+                text = await self.websocket.receive_text()
+                try:
+                    frame = json.loads(text)
+                except ValueError:
+                    frame = None
+                if not isinstance(frame, dict):
+                    self._reply({"type": "error", "id": None, "detail": "Frames must be JSON objects."})
+                    continue
+                await self._handle(frame)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            tasks = [task for task, _ in self._turns.values()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            writer.cancel()
+            await asyncio.gather(writer, return_exceptions=True)
+
+    async def _write_frames(self):
+        while True:
+            if self._control:
+                frame = self._control.popleft()
+            elif not self._outgoing.empty():
+                frame = self._outgoing.get_nowait()
+            else:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            await self.websocket.send_text(json.dumps(frame, default=str))
+
+    async def _handle(self, frame: Dict):
+        frame_type = frame.get("type")
+        frame_id = frame.get("id")
+        if frame_type not in CLIENT_FRAMES:
+            self._reply({"type": "error", "id": frame_id, "detail": f"Unknown frame type '{frame_type}'."})
+        elif frame_type == "history":
+            session_id = frame.get("session_id", "default")
+            try:
+                messages = await self._get_history(session_id, frame.get("memory_module"))
+            except ValueError as e:
+                self._reply({"type": "error", "id": frame_id, "detail": str(e)})
+                return
+            self._reply({"type": "history", "session_id": session_id, "messages": messages})
+        elif frame_type == "cancel":
+            turn = self._turns.get(frame_id)
+            if turn is not None and not turn[1].is_set():
+                # The event tells the turn this cancellation came from the client, not a disconnect
+                turn[1].set()
+                turn[0].cancel()
+        elif frame_id is None or frame_id in self._turns:
+            self._reply({"type": "error", "id": frame_id, "detail": "Query frames need an id that is not already in use."})
+        elif len(self._turns) >= self.max_turns:
+            self._reply({"type": "error", "id": frame_id, "detail": f"At most {self.max_turns} queries can stream at once on one socket."})
+        else:
+            cancelled = asyncio.Event()
+            task = asyncio.create_task(self._turn(frame_id, frame, cancelled))
+            self._turns[frame_id] = (task, cancelled)
+
+    async def _turn(self, frame_id, frame: Dict, cancelled: asyncio.Event):
+        async def is_cancelled() -> bool:
+            return cancelled.is_set()
+
+        try:
+            await self._run_turn(frame, self.emit, is_cancelled)
+        except asyncio.CancelledError:
+            if not cancelled.is_set():
+                raise
+            # Cancelled by the client before run_turn could report it (e.g. while queued for admission)
+            asyncio.current_task().uncancel()
+            await self.emit({"type": "end", "id": frame_id, "stopped": True, "context": None})
+        except Exception as e:
+            logging.error(f"WebSocket query '{frame_id}' failed: {e}")
+            await self.emit({"type": "error", "id": frame_id, "detail": str(e)})
+        finally:
+            self._turns.pop(frame_id, None)
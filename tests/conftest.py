@@ -0,0 +1,35 @@
+# tests/conftest.py
+
+import json
+import os
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+
+# The server modules import each other from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture(scope="session")
+def server(tmp_path_factory):
+    """
+    (main, TestClient) for the app on a scratch SQLite database, with the stub
+    model answering instantly. main is imported once per test run.
+    """
+    workdir = tmp_path_factory.mktemp("server")
+    config = {
+        "llm": {"active_model": "stub", "modules": {"stub": {"ttft_ms": 0, "tokens_per_second": 1e6, "jitter": "none"}}},
+        "memory": {"active_module": "stm_eth"},
+    }
+    # config.json is read from and written to the working directory
+    (workdir / "config.json").write_text(json.dumps(config))
+    with pytest.MonkeyPatch.context() as patch:
+        patch.chdir(workdir)
+        patch.setenv("MEMORY_SQL", f"sqlite:///{workdir / 'memory.db'}")
+        patch.delenv("MEMORY_SQL_ASYNC", raising=False)
+        import main
+        import memory.utm_anyai as utm
+        # utm_anyai leaves its schema to Alembic
+        utm.Base.metadata.create_all(utm.engine)
+        with TestClient(main.app) as client:
+            yield main, client
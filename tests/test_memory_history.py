@@ -0,0 +1,31 @@
+# tests/test_memory_history.py
+"""
+/memory/history and /memory/context_string for every memory module, paged and
+unpaged, including the 304 path. utm_anyai returns datetimes, which must still
+serialize after the ETag response path.
+"""
+
+def test_history_serializes_for_every_module(server):
+    main, client = server
+    assert {"stm_eth", "stm_prp", "utm_anyai"} <= set(main.memory_manager.modules)
+    for module_name in main.memory_manager.modules:
+        session_id = f"history-{module_name}"
+        module = main.memory_manager.get_module(module_name)
+        module.add_message("user", "How does the memory database store a topic?", session_id)
+        module.add_message("assistant", "Each module keeps its own table.", session_id)
+
+        for params in ({}, {"limit": 1}):
+            query = {"session_id": session_id, "memory_module": module_name, **params}
+            response = client.get("/memory/history", params=query)
+            assert response.status_code == 200, (module_name, params, response.text)
+            history = response.json()["history"]
+            assert isinstance(history, list)
+            if params and history:
+                assert len(history) == 1
+            etag = response.headers.get("etag")
+            if etag:
+                assert client.get("/memory/history", params=query, headers={"If-None-Match": etag}).status_code == 304
+
+        response = client.get("/memory/context_string", params={"session_id": session_id, "memory_module": module_name})
+        assert response.status_code == 200, (module_name, response.text)
+        assert isinstance(response.json()["context_string"], str)
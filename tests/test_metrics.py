@@ -0,0 +1,13 @@
+# tests/test_metrics.py
+
+from datetime import timedelta
+
+from memory.stm_eth import stm_eth_local_store
+
+def test_each_metric_family_is_exposed_once(server):
+    main, client = server
+    # A second store must add to the existing families, not repeat them
+    stm_eth_local_store(10, timedelta(hours=1)).append("metrics", "user", "hello")
+    text = client.get("/metrics").text
+    families = [line for line in text.splitlines() if line.startswith("# TYPE ")]
+    assert families and len(families) == len(set(families))
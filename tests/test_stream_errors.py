@@ -0,0 +1,20 @@
+# tests/test_stream_errors.py
+
+from server.instrumentation import ERRORS
+
+def _error_counts():
+    return {key[0]: child.get() for key, child in ERRORS._children.items()}
+
+def test_mid_stream_failure_is_counted_once(server):
+    main, client = server
+    stub = main.llm_manager.get_module("stub")
+    before = _error_counts()
+    stub.stream_error_rate = 1.0
+    try:
+        response = client.post("/stream", json={"query": "tell me about memory", "session_id": "stream-error", "max_tokens": 64})
+    finally:
+        stub.stream_error_rate = 0.0
+    assert response.status_code == 200
+    after = _error_counts()
+    added = {name: after[name] - before.get(name, 0) for name in after if after[name] != before.get(name, 0)}
+    assert added == {"StubAdapterError": 1}
@@ -0,0 +1,33 @@
+# tests/test_write_behind.py
+
+import asyncio
+
+from memory.write_behind import MemoryWriteBehind
+
+class _Module:
+    pass
+
+def test_failed_batch_stays_queued_and_visible():
+    written = []
+    failing = {"on": True}
+    module = _Module()
+
+    async def write_batch(target, messages):
+        if failing["on"]:
+            raise RuntimeError("database unavailable")
+        written.extend(message["content"] for message in messages)
+
+    async def scenario():
+        write_behind = MemoryWriteBehind(write_batch, flush_interval=0.01, max_batch=2, max_backoff=0.02)
+        for i in range(3):
+            write_behind.enqueue(module, "user", f"m{i}", "s")
+        assert not await write_behind.flush()
+        assert [m["content"] for m in write_behind.pending_for("s", module)] == ["m0", "m1", "m2"]
+        assert write_behind.stats()["failed_flushes"] == 1
+        failing["on"] = False
+        assert await write_behind.flush()
+        assert not write_behind.has_pending("s")
+        assert write_behind.stats()["consecutive_failures"] == 0
+
+    asyncio.run(scenario())
+    assert written == ["m0", "m1", "m2"]
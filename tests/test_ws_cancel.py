@@ -0,0 +1,24 @@
+# tests/test_ws_cancel.py
+
+import time
+
+def test_cancel_before_first_chunk(server):
+    main, client = server
+    stub = main.llm_manager.get_module("stub")
+    stub.ttft = 30.0  # an upstream that has not produced anything yet
+    try:
+        with client.websocket_connect("/ws") as socket:
+            socket.send_json({"type": "query", "id": "q1", "session_id": "ws-cancel", "query": "hello"})
+            time.sleep(0.2)
+            started = time.monotonic()
+            socket.send_json({"type": "cancel", "id": "q1"})
+            end = socket.receive_json()
+            assert time.monotonic() - started < 5
+            assert end["type"] == "end" and end["id"] == "q1" and end["stopped"] is True
+            delta = socket.receive_json()
+            assert delta["type"] == "history_delta"
+    finally:
+        stub.ttft = 0.0
+    # The partial (empty) reply is saved, marked as cut short
+    history = main.memory_manager.get_module("stm_eth").get_messages("ws-cancel")
+    assert [message["role"] for message in history] == ["user", "assistant"]